@@ -1,17 +1,53 @@
-from flask import Flask, jsonify, request
+from flask import Flask, has_request_context, jsonify, redirect, request
 from flask_cors import CORS
-import pandas as pd
-import numpy as np
-from statistics import NormalDist
 import math
 from datetime import datetime, timedelta
 from collections import defaultdict
 import json
+import logging
 import os
+import time
 import sqlite3
+import sys
+
+# Shared backend modules (timing, cache, sampling, ...) live next to backend/app.py
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from timing import span, timed_block, summarize
+from cache import DerivedCache, SnapshotCache
+from lazy import lazy_module
+import build_static
+import cache
+import datasets
+import profiling
+import result_cache
+import snapshot
+import sqlite_pool
+import telemetry
+import timing
+
+# Imported on first use (see lazy.py): routes that never touch them do not pay for them on a cold start
+pd = lazy_module('pandas')
+np = lazy_module('numpy')
+statistics = lazy_module('statistics')
+abstats = lazy_module('abstats')
+bootstrap = lazy_module('bootstrap')
+cube = lazy_module('cube')
+event_index = lazy_module('event_index')
+funnels = lazy_module('funnels')
+partitions = lazy_module('partitions')
+paths = lazy_module('paths')
+retention = lazy_module('retention')
+summaries = lazy_module('summaries')
+sampling = lazy_module('sampling')
+sequential = lazy_module('sequential')
 
 app = Flask(__name__)
 CORS(app)
+timing.init_app(app)
+telemetry.init_app(app)
+profiling.init_app(app)
+result_cache.init_app(app, lambda: result_store, lambda: _served_version())
 
 # Database path - Adjusted for Vercel Serverless
 # On Vercel, files might be in slightly different locations.
@@ -22,60 +58,469 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 # Attempt to locate the DB relative to api/ directory (so ../backend/database/vizsprints.db)
 DB_FILE = os.path.join(BASE_DIR, 'backend', 'database', 'vizsprints.db')
 
-users_df = None
-events_df = None
+# Datasets are loaded by load_data(), each on the first request that needs it (see
+# _load_data_on_first_use); reading app.users_df / app.events_df from outside the module
+# loads the default one too (see __getattr__)
+
+# Routes that never read the loaded data
+DATA_FREE_ENDPOINTS = {'health_check', 'prometheus_metrics', 'get_debug_timings', 'get_debug_profile',
+                       'get_debug_result_cache', 'get_debug_sql', 'get_debug_datasets', 'get_static_fallback'}
+
+# The default database and those in backend/database/datasets/, served by ?dataset=<name> (see datasets.py)
+registry = datasets.Registry(lambda: DB_FILE,
+                             os.environ.get(datasets.DIR_ENV, datasets.DEFAULT_DIR),
+                             int(float(os.environ.get(datasets.BUDGET_ENV, datasets.DEFAULT_BUDGET_MB)) * 1024 * 1024))
+
+# Whole responses persisted across cold starts (see result_cache.py and warm_cache.py)
+result_store = result_cache.ResultCache(os.environ.get(result_cache.PATH_ENV, result_cache.DEFAULT_PATH))
+
+FUNNEL_STAGES = ['signup_success', 'view_dashboard', 'start_project', 'complete_task', 'invite_user']
+
+# Every event name the data generator emits
+EVENT_TYPES = FUNNEL_STAGES + ['upgrade_subscription', 'export_data', 'share_report', 'create_chart', 'delete_project']
+
+# User attributes experiments can be broken down by
+SEGMENT_DIMENSIONS = ['country', 'device', 'subscription_status']
+
+# Monthly revenue per subscription tier
+REVENUE_MAP = {'Free': 0, 'Premium': 29, 'Enterprise': 99}
+
+# Structures built once per loaded snapshot (cube, samples, indexes), kept as long as the snapshot
+snapshot_cache = SnapshotCache('snapshot')
+
+# Results of requests with their own parameters, derived from the loaded frames of every dataset
+derived_cache = DerivedCache('derived', maxsize=128)
+
+# Snapshots of frames assigned to app.users_df / app.events_df from outside (see _snapshot)
+override_cache = DerivedCache('overrides', maxsize=2)
+
+def _dataset(name=None):
+    """The dataset a request asked for (?dataset=, default otherwise); KeyError for unknown names"""
+    if name is None:
+        name = request.args.get('dataset', datasets.DEFAULT) if has_request_context() else datasets.DEFAULT
+    return registry.get(name)
+
+def _snapshot(dataset=None):
+    """The data a request works on, or None while its dataset is not loaded.
+    
+    Take it once per request and pass it to everything the request calls.
+    Frames assigned to app.users_df / app.events_df from outside (tests,
+    benchmarks) are served in place of the default dataset, as a snapshot of their own.
+    """
+    dataset = dataset or _dataset()
+    current = dataset.snapshot
+    if dataset.name != datasets.DEFAULT:
+        return current
+    users = globals().get('users_df', current.users if current is not None else None)
+    events = globals().get('events_df', current.events if current is not None else None)
+    if users is None or events is None:
+        return None
+    if current is not None and users is current.users and events is current.events:
+        return current
+    return override_cache.get_or_compute('snapshot', (users, events), lambda: snapshot.Snapshot(users, events))
+
+def _ensure_loaded(dataset=None):
+    """Load the dataset unless it already is; returns whether it is loaded"""
+    dataset = dataset or _dataset()
+    if _snapshot(dataset) is None:
+        with dataset.lock:
+            if _snapshot(dataset) is None:
+                load_data(dataset)
+    registry.touch(dataset)
+    return _snapshot(dataset) is not None
+
+def __getattr__(name):
+    # Module attribute access from outside (tests, scripts): app.users_df loads the data
+    if name in ('users_df', 'events_df') and _ensure_loaded(_dataset(datasets.DEFAULT)):
+        return getattr(_snapshot(_dataset(datasets.DEFAULT)), name[:-3])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+@app.before_request
+def _load_data_on_first_use():
+    # Registered after result_cache's hook: a cached response never loads the data
+    try:
+        dataset = _dataset()
+    except KeyError as e:
+        return jsonify({'error': f"Unknown dataset '{e.args[0]}'"}), 404
+    if request.endpoint in DATA_FREE_ENDPOINTS or request.endpoint is None:
+        return None
+    if not _ensure_loaded(dataset):
+        return jsonify({'error': 'Data is not available'}), 503
+    return None
+
+def _served_version():
+    """Data version of the frames being served, or None when they are not a database's"""
+    try:
+        dataset = _dataset()
+    except KeyError:
+        return None
+    snap = _snapshot(dataset)
+    # Nothing loaded yet: a load would serve the database as it is now
+    version = _database_version(dataset) if snap is None else snap.data_version
+    if version is None or dataset.name == datasets.DEFAULT:
+        return version
+    return result_cache.scoped_version(dataset.name, version)
+
+def _database_version(dataset):
+    if not os.path.exists(dataset.db_file):
+        return None
+    try:
+        with _pool(dataset).connection() as conn:
+            return result_cache.data_version(conn)
+    except sqlite3.Error:
+        return None
+
+def _pool(dataset, db_file=None):
+    """The connection pool of a dataset's database file, reopened when the file was replaced (a full init_db load)"""
+    db_file = db_file or dataset.db_file
+    with dataset.lock:
+        if dataset.pool is None or not dataset.pool.is_current(db_file):
+            if dataset.pool is not None:
+                dataset.pool.close()
+            dataset.pool = sqlite_pool.ConnectionPool(db_file)
+        return dataset.pool
+
+def _samples(snap):
+    """Nested deterministic user samples of the snapshot (built at load time)"""
+    return snapshot_cache.get_or_compute('samples', snap,
+                                         lambda: sampling.build_samples(snap.users, snap.events))
+
+def _sample_arg(snap):
+    """Parse ?sample=<rate>; returns (Sample or None, error response or None)"""
+    rate = request.args.get('sample', type=float)
+    if rate is None or rate >= 1:
+        return None, None
+    if rate not in sampling.SAMPLE_RATES:
+        rates = ', '.join(str(r) for r in sampling.SAMPLE_RATES)
+        return None, (jsonify({'error': f'sample must be one of {rates}'}), 400)
+    # Estimates from a sample carry intervals at this level
+    if not 0 < request.args.get('confidence_level', 0.95, type=float) < 1:
+        return None, (jsonify({'error': 'confidence_level must be between 0 and 1'}), 400)
+    return _samples(snap)[rate], None
+
+def _read_tables(pool, marks, known_user_ids=()):
+    """Users and events stored after the given marks, decoded; returns (users, events, new marks)"""
+    state = dict(pool.execute("SELECT name, value FROM load_state"))
+    event_rowid = pool.execute("SELECT MAX(rowid) FROM events")[0][0] or 0
+    with span('read_users'):
+        users = pool.read_frame("SELECT * FROM users WHERE user_key > ? ORDER BY user_key", (marks['user_key'],))
+    with span('read_events'):
+        # Metadata stays on disk (see partitions.py)
+        events = pool.read_frame("SELECT event_id, user_key, event_name, timestamp FROM events "
+                                 "WHERE rowid > ? AND rowid <= ?", (marks['event_rowid'], event_rowid))
+    
+    # Events store integer user keys (1, 2, ... in user order); map them back to user ids
+    with span('map_user_ids'):
+        user_key = int(users['user_key'].max()) if len(users) else marks['user_key']
+        users = users.drop(columns='user_key')
+        user_ids = np.concatenate([np.asarray(known_user_ids, dtype=object), users['user_id'].to_numpy(dtype=object)])
+        events.insert(1, 'user_id', user_ids[events.pop('user_key').to_numpy() - 1])
+    
+    # Timestamps are stored as epoch seconds
+    with span('parse_timestamps'):
+        users['joined_at'] = pd.to_datetime(users['joined_at'], unit='s', utc=True)
+        events['timestamp'] = pd.to_datetime(events['timestamp'], unit='s', utc=True)
+    
+    return users, events, {'load_id': state.get('load_id'), 'user_key': user_key, 'event_rowid': event_rowid}
+
+def _serve(dataset, snap):
+    """Put a snapshot in place of a dataset's data (with its lock held) and fit the datasets in the memory budget"""
+    previous, dataset.snapshot = dataset.snapshot, snap
+    if previous is not None:
+        derived_cache.discard(previous.sources)
+    if dataset.name == datasets.DEFAULT:
+        # Loading replaces frames assigned from outside, as it always has
+        globals().pop('users_df', None)
+        globals().pop('events_df', None)
+    
+    # Resident size of the frames, strings included (also reported by /metrics)
+    tables = snapshot_cache.get_or_compute('table_stats', snap, lambda: _table_stats(snap))
+    nbytes = sum(size for _, _, size in tables)
+    for victim in registry.admit(dataset, nbytes):
+        if not registry.over_budget():
+            break
+        dropped = registry.evict(victim)
+        if dropped is not None:
+            derived_cache.discard(dropped.sources)
+            # Module attributes still naming the dropped frames would keep serving (and holding) them
+            if victim.name == datasets.DEFAULT and globals().get('users_df') is dropped.users \
+                    and globals().get('events_df') is dropped.events:
+                globals().pop('users_df', None)
+                globals().pop('events_df', None)
+            print(f"Evicted dataset '{victim.name}' ({victim.info()['evictions']} evictions)")
+    over = registry.over_budget()
+    if over:
+        reason = (f"'{dataset.name}' alone exceeds it" if nbytes > registry.budget_bytes
+                  else "datasets being loaded could not be evicted")
+        print(f"Warning: datasets are {over} bytes over the memory budget ({reason})")
 
-def load_data():
-    """Load data from SQLite database into pandas DataFrames"""
-    global users_df, events_df
+def load_data(dataset=None):
+    """Load a dataset (the default one unless given) from SQLite into pandas DataFrames"""
+    dataset = dataset or _dataset(datasets.DEFAULT)
     
     try:
-        if not os.path.exists(DB_FILE):
-            print(f"Database not found at {DB_FILE}")
-            # Fallback for Vercel if file structure is flattened or different
-            # Try looking in 'database' folder in current dir
-            alt_db_file = os.path.join(os.path.dirname(__file__), '..', 'backend', 'database', 'vizsprints.db')
-            if os.path.exists(alt_db_file):
-                print(f"Database found at alternative path: {alt_db_file}")
-                # We can't easily assign back to DB_FILE global without Declare, but we can use the local var if we changed design.
-                # simpler: just try to connect to the one that exists.
-                conn = sqlite3.connect(alt_db_file)
+        with dataset.lock:
+            if not os.path.exists(dataset.db_file):
+                print(f"Database not found at {dataset.db_file}")
+                # Fallback for Vercel if file structure is flattened or different
+                # Try looking in 'database' folder in current dir
+                alt_db_file = os.path.join(os.path.dirname(__file__), '..', 'backend', 'database', 'vizsprints.db')
+                if os.path.exists(alt_db_file):
+                    print(f"Database found at alternative path: {alt_db_file}")
+                    # We can't easily assign back to DB_FILE global without Declare, but we can use the local var if we changed design.
+                    # simpler: just try to connect to the one that exists.
+                    pool = _pool(dataset, alt_db_file)
+                else:
+                     # Try absolute path from root if CWD is root
+                     root_db = os.path.join(os.getcwd(), 'backend', 'database', 'vizsprints.db')
+                     if os.path.exists(root_db):
+                         print(f"Database found at root relative path: {root_db}")
+                         pool = _pool(dataset, root_db)
+                     else: 
+                         return False
             else:
-                 # Try absolute path from root if CWD is root
-                 root_db = os.path.join(os.getcwd(), 'backend', 'database', 'vizsprints.db')
-                 if os.path.exists(root_db):
-                     print(f"Database found at root relative path: {root_db}")
-                     conn = sqlite3.connect(root_db)
-                 else: 
-                     return False
-        else:
-            conn = sqlite3.connect(DB_FILE)
-        
-        print("Loading data from database...")
-        users_df = pd.read_sql_query("SELECT * FROM users", conn)
-        events_df = pd.read_sql_query("SELECT * FROM events", conn)
-        
-        conn.close()
-        
-        # Parse timestamps
-        users_df['joined_at'] = pd.to_datetime(users_df['joined_at'])
-        events_df['timestamp'] = pd.to_datetime(events_df['timestamp'])
-        
-        print(f"Loaded {len(users_df)} users and {len(events_df)} events from database")
+                pool = _pool(dataset)
+            
+            print(f"Loading dataset '{dataset.name}' from database...")
+            load_start = time.perf_counter()
+            with timed_block('load_data'):
+                users, events, marks = _read_tables(pool, {'load_id': None, 'user_key': 0, 'event_rowid': 0})
+                
+                # Keep events in time order so time ranges are row slices
+                with span('sort_events'):
+                    events = events.sort_values('timestamp', kind='stable', ignore_index=True)
+                
+                with pool.connection() as conn:
+                    # Summary tables answer the headline endpoints when init_db built them from these events
+                    with span('load_summaries'):
+                        stored = summaries.Summaries.load(conn, cube.data_version(events))
+                    snap = snapshot.Snapshot(users, events, result_cache.data_version(conn), stored, dataset.name)
+                    
+                    # Use the persisted cube when init_db built it from these events
+                    with span('load_cube'):
+                        stored_cube = cube.Cube.load(conn, cube.data_version(events))
+                        snapshot_cache.get_or_compute('cube', snap,
+                                                      lambda: stored_cube or cube.Cube.build(users, events))
+                
+                # Prepare the approximate-query samples up front
+                with span('build_samples'):
+                    _samples(snap)
+                
+                dataset.marks, dataset.event_store = marks, partitions.PartitionStore(pool)
+                _serve(dataset, snap)
+            
+            load_seconds = time.perf_counter() - load_start
+            dataset.loads, dataset.load_seconds, dataset.loaded_at = dataset.loads + 1, load_seconds, time.time()
+            telemetry.record_data_load(load_seconds)
+        print(f"Loaded {len(users)} users and {len(events)} events from database")
         return True
     except Exception as e:
         print(f"Error loading data: {e}")
         return False
 
+def refresh_data(dataset=None):
+    """Fold rows added by `init_db.py --append` into a new snapshot of a dataset (default one unless given) and its cube.
+    
+    Returns (new users, new events), or None when the database was fully
+    reloaded since (then everything is read again via load_data).
+    """
+    dataset = dataset or _dataset(datasets.DEFAULT)
+    
+    with dataset.lock:
+        pool = _pool(dataset)
+        current = dataset.snapshot
+        with timed_block('refresh_data'):
+            if current is None or pool is not dataset.event_store.pool or \
+                    dict(pool.execute("SELECT name, value FROM load_state")).get('load_id') != dataset.marks['load_id']:
+                load_data(dataset)
+                return None
+            new_users, new_events, marks = _read_tables(pool, dataset.marks, current.users['user_id'].to_numpy())
+            if not len(new_users) and not len(new_events):
+                return 0, 0
+            
+            users = pd.concat([current.users, new_users], ignore_index=True) if len(new_users) else current.users
+            events = pd.concat([current.events, new_events], ignore_index=True)
+            with span('ingest_cube'):
+                # Requests still reading the current snapshot keep using its cube
+                event_cube = _cube(current).copy()
+                event_cube.ingest(users, events, len(current.events))
+            
+            # Appended events usually come after everything loaded; otherwise restore time order
+            with span('sort_events'):
+                latest = _time_index(current).max_ns
+                if len(new_events) and latest is not None and \
+                        event_index.timestamp_ns(new_events['timestamp']).min() < latest:
+                    events = events.sort_values('timestamp', kind='stable', ignore_index=True)
+            
+            # init_db --append refreshed the summary tables along with the rows
+            with span('load_summaries'), pool.connection() as conn:
+                snap = snapshot.Snapshot(users, events, result_cache.data_version(conn),
+                                         summaries.Summaries.load(conn, cube.data_version(events)), dataset.name)
+            
+            snapshot_cache.get_or_compute('cube', snap, lambda: event_cube)
+            with span('build_samples'):
+                _samples(snap)
+            dataset.event_store.invalidate(
+                np.unique(partitions.month_of(event_index.timestamp_ns(new_events['timestamp']))))
+            dataset.marks = marks
+            _serve(dataset, snap)
+    
+    print(f"Appended {len(new_users)} users and {len(new_events)} events from database")
+    return len(new_users), len(new_events)
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
+    loaded = _snapshot() is not None
     return jsonify({
         'status': 'healthy',
-        'users_loaded': users_df is not None,
-        'events_loaded': events_df is not None
+        'users_loaded': loaded,
+        'events_loaded': loaded
     })
 
+@app.route('/static-api/<path:name>.json', methods=['GET'])
+def get_static_fallback(name):
+    """A build-time snapshot (build_static.py) missing from the deployment: redirect to the request it snapshots"""
+    url = build_static.STATIC_RESPONSES.get(name)
+    if url is None:
+        return jsonify({'error': f'Unknown static response: {name}'}), 404
+    return redirect(url)
+
+def _table_stats(snap):
+    """Row counts and deep in-memory sizes of the snapshot's tables"""
+    return [(name, len(df), int(df.memory_usage(deep=True).sum()))
+            for name, df in zip(('users', 'events'), snap.sources)]
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus text exposition of request, cache, data and process metrics"""
+    # Deep memory usage walks every string, so it is computed once per load
+    snap = _snapshot()
+    tables = [] if snap is None else snapshot_cache.get_or_compute('table_stats', snap,
+                                                                    lambda: _table_stats(snap))
+    caches = sorted(cache.all_caches().items())
+    kinds = [(name, kind, counts) for name, c in caches for kind, counts in sorted(c.kind_counts.items())]
+    
+    lines = []
+    lines += telemetry.sample_lines(
+        'vizsprints_cache_hits_total', 'Derived-result cache hits, by cache and result kind.', 'counter',
+        [((name, kind), counts[0]) for name, kind, counts in kinds], ('cache', 'kind'))
+    lines += telemetry.sample_lines(
+        'vizsprints_cache_misses_total', 'Derived-result cache misses, by cache and result kind.', 'counter',
+        [((name, kind), counts[1]) for name, kind, counts in kinds], ('cache', 'kind'))
+    lines += telemetry.sample_lines(
+        'vizsprints_cache_hit_ratio', 'Derived-result cache hit ratio since start.', 'gauge',
+        [((name, ), c.hit_ratio()) for name, c in caches], ('cache',))
+    lines += telemetry.sample_lines(
+        'vizsprints_cache_entries', 'Entries currently held per cache.', 'gauge',
+        [((name, ), len(c)) for name, c in caches], ('cache',))
+    lines += telemetry.sample_lines(
+        'vizsprints_table_rows', 'Rows in each loaded table.', 'gauge',
+        [((name, ), rows) for name, rows, _ in tables], ('table',))
+    lines += telemetry.sample_lines(
+        'vizsprints_table_bytes', 'Deep in-memory size of each loaded table in bytes.', 'gauge',
+        [((name, ), size) for name, _, size in tables], ('table',))
+    lines += telemetry.sample_lines(
+        'process_resident_memory_bytes', 'Resident memory size in bytes.', 'gauge',
+        [((), telemetry.process_rss_bytes())])
+    lines += telemetry.sample_lines(
+        'process_peak_resident_memory_bytes', 'Peak resident memory size in bytes.', 'gauge',
+        [((), telemetry.peak_rss_bytes())])
+    
+    return telemetry.render(lines), 200, {'Content-Type': telemetry.CONTENT_TYPE}
+
+@app.route('/api/debug/timings', methods=['GET'])
+def get_debug_timings():
+    """Per-route, per-stage latency percentiles over recent requests"""
+    route = request.args.get('route')
+    return jsonify({
+        'history_size': timing.HISTORY_SIZE,
+        'routes': summarize(route)
+    })
+
+@app.route('/api/debug/partitions', methods=['GET'])
+def get_debug_partitions():
+    """Month partitions of event metadata: catalog, resident months and load/eviction counts"""
+    try:
+        store = _event_store(_dataset())
+        return jsonify({'catalog': store.catalog(), **store.stats()})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/debug/sql', methods=['GET'])
+def get_debug_sql():
+    """Connection pool: open/idle connections, waits, query counts and recent slow queries with their plans"""
+    try:
+        return jsonify(_pool(_dataset()).stats())
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/debug/datasets', methods=['GET'])
+def get_debug_datasets():
+    """Every dataset: resident or not, resident bytes, load count and time, evictions and last use"""
+    try:
+        return jsonify(registry.stats())
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/debug/result-cache', methods=['GET'])
+def get_debug_result_cache():
+    """Persistent response cache: file, entry count and hit/miss/write counts"""
+    try:
+        return jsonify({'data_version': _served_version(), **result_store.stats()})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/debug/profile', methods=['GET'])
+def get_debug_profile():
+    """Sample every thread's stack for N seconds; returns collapsed stacks for flamegraphs"""
+    denied = profiling.check_access()
+    if denied is not None:
+        return denied
+    
+    seconds = request.args.get('seconds', 5, type=float)
+    interval_ms = request.args.get('interval_ms', profiling.DEFAULT_INTERVAL * 1000, type=float)
+    include_idle = request.args.get('idle') == '1'
+    if not 0 < seconds <= profiling.MAX_SECONDS:
+        return jsonify({'error': f'seconds must be in (0, {profiling.MAX_SECONDS}]'}), 400
+    if not 1 <= interval_ms <= 1000:
+        return jsonify({'error': 'interval_ms must be between 1 and 1000'}), 400
+    
+    stacks, samples = profiling.sample_stacks(seconds, interval_ms / 1000, include_idle)
+    
+    if request.args.get('format') == 'json':
+        return jsonify({
+            'seconds': seconds,
+            'samples': samples,
+            'stacks': [{'stack': stack, 'count': count} for stack, count in stacks.most_common()]
+        })
+    return profiling.collapsed_text(stacks), 200, {
+        'Content-Type': 'text/plain; charset=utf-8',
+        'X-Profile-Samples': str(samples)
+    }
+
+@app.route('/api/debug/refresh', methods=['POST'])
+def post_debug_refresh():
+    """Pick up rows appended to the database without reloading everything"""
+    denied = profiling.check_access()
+    if denied is not None:
+        return denied
+    try:
+        dataset = _dataset()
+        added = refresh_data(dataset)
+        snap = _snapshot(dataset)
+        return jsonify({
+            'reloaded': added is None,
+            'new_users': None if added is None else added[0],
+            'new_events': None if added is None else added[1],
+            'users': len(snap.users),
+            'events': len(snap.events),
+            'snapshot': snap.version
+        })
+    except Exception as e:
+        print(f"Error in refresh: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/users', methods=['GET'])
 def get_users():
     """Get user data with optional filters"""
@@ -85,25 +530,130 @@ def get_users():
         device = request.args.get('device')
         subscription = request.args.get('subscription_status')
         
-        df = users_df.copy()
+        with span('filter'):
+            df = _snapshot().users
+            
+            if country:
+                df = df[df['country'] == country]
+            if device:
+                df = df[df['device'] == device]
+            if subscription:
+                df = df[df['subscription_status'] == subscription]
+        
+        # Convert to JSON-friendly format (in the records; the snapshot's frame is read-only)
+        with span('format'):
+            records = df.to_dict('records')
+            for record, joined_at in zip(records, df['joined_at'].dt.strftime('%Y-%m-%dT%H:%M:%SZ')):
+                record['joined_at'] = joined_at
+        
+        with span('serialize'):
+            return jsonify({
+                'users': records,
+                'total': len(df)
+            })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def _user_positions(snap):
+    """Index from user_id to row of snap.users"""
+    return snapshot_cache.get_or_compute('user_positions', snap, lambda: pd.Index(snap.users['user_id']))
+
+def _iso_timestamps(ns):
+    """ISO 8601 strings (UTC, second precision) for int64 nanosecond timestamps"""
+    return [f"{t}Z" for t in np.datetime_as_string(np.asarray(ns).astype('datetime64[ns]'), unit='s')]
+
+@app.route('/api/users/<user_id>/timeline', methods=['GET'])
+def get_user_timeline(user_id):
+    """One user's profile, events, sessions and funnel progress"""
+    try:
+        limit = request.args.get('limit', 1000, type=int)
+        if limit < 0:
+            return jsonify({'error': 'limit must be non-negative'}), 400
+        snap = _snapshot()
         
-        if country:
-            df = df[df['country'] == country]
-        if device:
-            df = df[df['device'] == device]
-        if subscription:
-            df = df[df['subscription_status'] == subscription]
+        with span('lookup'):
+            index = _user_event_index(snap)
+            positions = _user_positions(snap)
+            user_slice = index.user_slice(user_id)
+            has_profile = user_id in positions
+            if not has_profile and user_slice.stop == user_slice.start:
+                return jsonify({'error': f"User '{user_id}' not found"}), 404
+            
+            # Views into the sorted index; only this user's table rows are gathered
+            timestamps = index.timestamps[user_slice]
+            event_codes = index.events[user_slice]
+            session_start = index.session_start[user_slice]
+            rows = snap.events.iloc[index.order[user_slice][:limit]]
         
-        # Convert to JSON-friendly format
-        df['joined_at'] = df['joined_at'].dt.strftime('%Y-%m-%dT%H:%M:%SZ')
+        with span('format'):
+            profile = None
+            if has_profile:
+                profile = snap.users.iloc[positions.get_loc(user_id)].to_dict()
+                profile['joined_at'] = profile['joined_at'].strftime('%Y-%m-%dT%H:%M:%SZ')
+            
+            times = _iso_timestamps(timestamps)
+            events = [{
+                'event_id': event_id,
+                'event_name': index.event_names[code],
+                'timestamp': times[i],
+                'metadata': metadata
+            } for i, (event_id, code, metadata) in enumerate(zip(
+                rows['event_id'], event_codes, _event_metadata(snap, rows)))]
+            
+            # Sessions: runs between boundaries (30 minute inactivity timeout)
+            starts = np.flatnonzero(session_start)
+            ends = np.append(starts[1:], len(timestamps)) - 1
+            sessions = []
+            for start, end in zip(starts, ends):
+                duration = (timestamps[end] - timestamps[start]) / 3.6e12
+                sessions.append({
+                    'start': times[start],
+                    'end': times[end],
+                    'events': int(end - start + 1),
+                    # Single-event sessions count as one minute, as in /api/user-sessions
+                    'duration_hours': round(duration if end > start else 1 / 60, 4)
+                })
+            
+            # Funnel progress: first time each stage was reached, and how far the user got in order
+            funnel = []
+            step_time = None
+            in_order = True
+            for stage in FUNNEL_STAGES:
+                positions_at_stage = np.flatnonzero(event_codes == index.event_names.index(stage))
+                hits = timestamps[positions_at_stage]
+                if in_order:
+                    later = hits[hits >= step_time] if step_time is not None else hits
+                    in_order = len(later) > 0
+                    step_time = later[0] if in_order else None
+                funnel.append({
+                    'stage': stage,
+                    'reached': bool(len(hits)),
+                    'first_at': times[positions_at_stage[0]] if len(hits) else None,
+                    'reached_in_order': in_order
+                })
         
-        return jsonify({
-            'users': df.to_dict('records'),
-            'total': len(df)
-        })
+        with span('serialize'):
+            return jsonify({
+                'user': profile,
+                'total_events': len(timestamps),
+                'events': events,
+                'sessions': sessions,
+                'funnel': funnel
+            })
     except Exception as e:
+        print(f"Error building user timeline: {e}")
         return jsonify({'error': str(e)}), 500
 
+def _event_store(dataset):
+    """Month partitions of a dataset's event metadata (a fresh store if it was evicted meanwhile)"""
+    return dataset.event_store or partitions.PartitionStore(_pool(dataset))
+
+def _event_metadata(snap, rows):
+    """Metadata of event rows: from the frame when it has the column, else from the month partitions"""
+    if 'metadata' in rows:
+        return rows['metadata'].tolist()
+    return _event_store(_dataset(snap.dataset)).metadata(rows['event_id'], event_index.timestamp_ns(rows['timestamp']))
+
 @app.route('/api/events', methods=['GET'])
 def get_events():
     """Get event data with optional filters"""
@@ -114,84 +664,172 @@ def get_events():
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
         
-        df = events_df.copy()
+        try:
+            start_ns = event_index.to_ns(start_date) if start_date else None
+            end_ns = event_index.to_ns(end_date) if end_date else None
+        except ValueError:
+            return jsonify({'error': 'start_date and end_date must be ISO dates or timestamps'}), 400
+        snap = _snapshot()
         
-        if user_id:
-            df = df[df['user_id'] == user_id]
-        if event_name:
-            df = df[df['event_name'] == event_name]
-        if start_date:
-            df = df[df['timestamp'] >= pd.to_datetime(start_date)]
-        if end_date:
-            df = df[df['timestamp'] <= pd.to_datetime(end_date)]
+        with span('filter'):
+            if user_id:
+                # Only this user's rows, located through the user-sorted index (kept in table order)
+                df = snap.events.iloc[np.sort(_user_event_index(snap).user_rows(user_id))]
+                if start_ns is not None or end_ns is not None:
+                    df = event_index.TimeIndex(df).select(df, start_ns, end_ns)
+            else:
+                # Two binary searches over the time-sorted keys, then a slice
+                df = _time_index(snap).select(snap.events, start_ns, end_ns)
+            
+            if event_name:
+                df = df[df['event_name'] == event_name]
         
-        # Convert to JSON-friendly format
-        df['timestamp'] = df['timestamp'].dt.strftime('%Y-%m-%dT%H:%M:%SZ')
+        # Convert to JSON-friendly format (only the rows returned)
+        with span('format'):
+            page = df.head(1000)  # Limit to 1000 events
+            records = page.to_dict('records')
+            for record, timestamp, metadata in zip(records, page['timestamp'].dt.strftime('%Y-%m-%dT%H:%M:%SZ'),
+                                                   _event_metadata(snap, page)):
+                record['timestamp'] = timestamp
+                record['metadata'] = metadata
         
-        return jsonify({
-            'events': df.to_dict('records')[:1000],  # Limit to 1000 events
-            'total': len(df)
-        })
+        with span('serialize'):
+            return jsonify({
+                'events': records,
+                'total': len(df)
+            })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def _approximate_metrics(sample, confidence_level):
+    """get_metrics estimated from a user sample, with confidence intervals"""
+    z = sampling.z_value(confidence_level)
+    rate = sample.rate
+    users, events = sample.users, sample.events
+    user_ids = users['user_id']
+    ones = np.ones(len(users))
+    
+    with span('active_users'):
+        thirty_days_ago = sample.max_timestamp - timedelta(days=30)
+        active = user_ids.isin(events.loc[events['timestamp'] >= thirty_days_ago, 'user_id']).to_numpy()
+    
+    with span('conversion'):
+        completed = user_ids.isin(events.loc[events['event_name'] == 'complete_task', 'user_id']).to_numpy()
+    
+    with span('revenue'):
+        revenue = users['subscription_status'].map(REVENUE_MAP).fillna(0).to_numpy()
+        events_per_user = user_ids.map(events['user_id'].value_counts()).fillna(0).to_numpy()
+    
+    with span('estimate'):
+        total_users, total_users_ci = sampling.estimate_count(len(users), rate, z)
+        active_users, active_users_ci = sampling.estimate_count(int(active.sum()), rate, z)
+        conversion, conversion_ci = sampling.estimate_ratio(completed, ones, rate, z, upper_bound=1)
+        revenue_total, revenue_ci = sampling.estimate_total(revenue, rate, z)
+        avg_events, avg_events_ci = sampling.estimate_ratio(events_per_user, ones, rate, z)
+        total_events, total_events_ci = sampling.estimate_total(events_per_user, rate, z)
+    
+    with span('serialize'):
+        return jsonify({
+            'total_users': int(round(total_users)),
+            'active_users': int(round(active_users)),
+            'conversion_rate': round(conversion * 100, 2),
+            'revenue': int(round(revenue_total)),
+            'avg_events_per_user': round(avg_events, 2),
+            'total_events': int(round(total_events)),
+            'confidence_intervals': {
+                'total_users': sampling.rounded(total_users_ci, 0),
+                'active_users': sampling.rounded(active_users_ci, 0),
+                'conversion_rate': sampling.rounded([v * 100 for v in conversion_ci]),
+                'revenue': sampling.rounded(revenue_ci, 0),
+                'avg_events_per_user': sampling.rounded(avg_events_ci),
+                'total_events': sampling.rounded(total_events_ci, 0)
+            },
+            'sampling': sample.info(confidence_level)
+        })
+
 @app.route('/api/metrics', methods=['GET'])
 def get_metrics():
     """Get overall engagement metrics"""
+    snap = _snapshot()
+    sample, error = _sample_arg(snap)
+    if error:
+        return error
     try:
+        if sample is not None:
+            return _approximate_metrics(sample, request.args.get('confidence_level', 0.95, type=float))
+        
         # Total users
-        total_users = len(users_df)
+        total_users = len(snap.users)
+        stored = snap.summaries
         
         # Active users (users with events in last 30 days)
-        thirty_days_ago = events_df['timestamp'].max() - timedelta(days=30)
-        active_user_ids = events_df[events_df['timestamp'] >= thirty_days_ago]['user_id'].unique()
-        active_users = len(active_user_ids)
+        with span('active_users'):
+            active_users = 0
+            if stored is not None:
+                active_users = stored.active_users(pd.Timedelta(days=30))
+            elif len(_time_index(snap)):
+                time_index = _time_index(snap)
+                thirty_days_ago = time_index.max_ns - pd.Timedelta(days=30).value
+                active_user_ids = time_index.select(snap.events, thirty_days_ago)['user_id'].unique()
+                active_users = len(active_user_ids)
         
         # Conversion rate (users who completed at least one task)
-        completed_users = events_df[events_df['event_name'] == 'complete_task']['user_id'].nunique()
-        conversion_rate = (completed_users / total_users * 100) if total_users > 0 else 0
+        with span('conversion'):
+            if stored is not None:
+                completed_users = stored.stage_users.get('complete_task', 0)
+            else:
+                completed_users = snap.events[snap.events['event_name'] == 'complete_task']['user_id'].nunique()
+            conversion_rate = (completed_users / total_users * 100) if total_users > 0 else 0
         
         # Revenue (estimate based on subscriptions)
-        revenue_map = {'Free': 0, 'Premium': 29, 'Enterprise': 99}
-        revenue = sum(users_df['subscription_status'].map(revenue_map))
+        with span('revenue'):
+            revenue = sum(snap.users['subscription_status'].map(REVENUE_MAP))
         
         # Average events per user
-        avg_events = len(events_df) / total_users if total_users > 0 else 0
+        total_events = stored.total_events if stored is not None else len(snap.events)
+        avg_events = total_events / total_users if total_users > 0 else 0
         
-        return jsonify({
-            'total_users': int(total_users),
-            'active_users': int(active_users),
-            'conversion_rate': round(conversion_rate, 2),
-            'revenue': int(revenue),
-            'avg_events_per_user': round(avg_events, 2),
-            'total_events': int(len(events_df))
-        })
+        with span('serialize'):
+            return jsonify({
+                'total_users': int(total_users),
+                'active_users': int(active_users),
+                'conversion_rate': round(conversion_rate, 2),
+                'revenue': int(revenue),
+                'avg_events_per_user': round(avg_events, 2),
+                'total_events': int(total_events)
+            })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/cohorts', methods=['GET'])
-def get_cohorts():
-    """Calculate cohort retention analysis (Monthly)"""
-    try:
-        # Merge users with events
-        df = events_df.merge(users_df[['user_id', 'joined_at']], on='user_id')
-        
-        # Calculate cohort month and event month
+def _compute_cohorts(users, events):
+    """Monthly cohort retention table (payload of /api/cohorts)"""
+    # Merge users with events
+    with span('merge'):
+        df = events.merge(users[['user_id', 'joined_at']], on='user_id')
+    
+    # Calculate cohort month and event month
+    with span('periods'):
         df['cohort_month'] = df['joined_at'].dt.to_period('M')
         df['event_month'] = df['timestamp'].dt.to_period('M')
         
         # Calculate months since join
         df['months_since_join'] = (df['event_month'] - df['cohort_month']).apply(lambda x: x.n)
-        
-        # Group by cohort and month
+    
+    # Group by cohort and month
+    with span('groupby'):
         cohort_data = df.groupby(['cohort_month', 'months_since_join'])['user_id'].nunique().reset_index()
         cohort_data.columns = ['cohort_month', 'months_since_join', 'users']
         
         # Get cohort sizes
         cohort_sizes = df.groupby('cohort_month')['user_id'].nunique().reset_index()
         cohort_sizes.columns = ['cohort_month', 'cohort_size']
-        
-        # Merge and calculate retention percentage
+    
+    return _cohort_payload(cohort_data, cohort_sizes)
+
+def _cohort_payload(cohort_data, cohort_sizes):
+    """Retention heatmap from active users per (cohort_month, months_since_join) and cohort sizes"""
+    # Merge and calculate retention percentage
+    with span('pivot'):
         cohort_data = cohort_data.merge(cohort_sizes, on='cohort_month')
         cohort_data['retention'] = (cohort_data['users'] / cohort_data['cohort_size'] * 100).round(2)
         
@@ -201,10 +839,11 @@ def get_cohorts():
             columns='months_since_join',
             values='retention'
         ).fillna(0)
-        
-        # Format for frontend
-        result = []
-        max_months = 0
+    
+    # Format for frontend
+    result = []
+    max_months = 0
+    with span('format'):
         if not cohort_pivot.empty:
             max_months = int(cohort_pivot.columns.max())
             
@@ -225,18 +864,315 @@ def get_cohorts():
                         cohort_entry[f'month_{month_num}'] = 0.0
                 
                 result.append(cohort_entry)
-        
+    
+    return {
+        'cohorts': result,
+        'max_months': max_months
+    }
+
+def _approximate_cohorts(snap, sample, confidence_level):
+    """Cohort table of a user sample of snap; sizes are scaled up, retention carries a margin of error"""
+    z = sampling.z_value(confidence_level)
+    payload = snapshot_cache.get_or_compute(('cohorts', sample.rate), snap,
+                                            lambda: _compute_cohorts(sample.users, sample.events))
+    
+    with span('estimate'):
+        cohorts = []
+        for entry in payload['cohorts']:
+            sampled_size = entry['size']
+            scaled = dict(entry)
+            scaled['size'] = int(round(sampled_size / sample.rate))
+            # Worst-case (p = 0.5) half-width of a retention percentage in this cohort
+            scaled['margin_of_error'] = round(
+                z * math.sqrt(0.25 * (1 - sample.rate) / sampled_size) * 100, 2) if sampled_size else 100.0
+            cohorts.append(scaled)
+    
+    with span('serialize'):
         return jsonify({
-            'cohorts': result,
-            'max_months': max_months
+            'cohorts': cohorts,
+            'max_months': payload['max_months'],
+            'sampling': sample.info(confidence_level)
         })
+
+@app.route('/api/cohorts', methods=['GET'])
+def get_cohorts():
+    """Calculate cohort retention analysis (Monthly)"""
+    snap = _snapshot()
+    sample, error = _sample_arg(snap)
+    if error:
+        return error
+    try:
+        if sample is not None:
+            return _approximate_cohorts(snap, sample, request.args.get('confidence_level', 0.95, type=float))
+        
+        stored = snap.summaries
+        payload = snapshot_cache.get_or_compute(
+            'cohorts', snap,
+            lambda: _cohort_payload(*stored.cohort_counts()) if stored is not None
+            else _compute_cohorts(snap.users, snap.events))
+        
+        with span('serialize'):
+            return jsonify(payload)
     except Exception as e:
         print(f"Error calculating cohorts: {e}")
         return jsonify({'error': str(e)}), 500
 
+# User attributes retention and stickiness can be filtered on (?country=US,UK&device=Mobile)
+USER_FILTERS = SEGMENT_DIMENSIONS + ['ab_variant']
+
+def _activity_index(snap):
+    """Per-user sorted activity days of the snapshot"""
+    return snapshot_cache.get_or_compute('activity_index', snap,
+                                         lambda: retention.ActivityIndex(snap.users, snap.events))
+
+def _user_filter_arg(snap):
+    """Parse user attribute filters; returns (filters, boolean user mask or None)"""
+    filters = {}
+    for column in USER_FILTERS:
+        values = [v for v in request.args.get(column, '').split(',') if v]
+        if values:
+            filters[column] = values
+    if not filters:
+        return filters, None
+    mask = np.ones(len(snap.users), dtype=bool)
+    for column, values in filters.items():
+        mask &= snap.users[column].astype(str).isin(values).to_numpy()
+    return filters, mask
+
+@app.route('/api/retention', methods=['GET'])
+def get_retention():
+    """Bounded and unbounded day-N retention, optionally for a user segment"""
+    try:
+        try:
+            day_numbers = [int(d) for d in request.args.get('days', '1,7,30').split(',') if d]
+        except ValueError:
+            return jsonify({'error': 'days must be comma-separated integers'}), 400
+        if not day_numbers or any(d < 0 or d > 3650 for d in day_numbers):
+            return jsonify({'error': 'days must be between 0 and 3650'}), 400
+        snap = _snapshot()
+        filters, mask = _user_filter_arg(snap)
+        
+        with span('index'):
+            index = _activity_index(snap)
+        
+        key = ('retention', tuple(day_numbers), tuple((c, tuple(v)) for c, v in filters.items()))
+        with span('retention'):
+            counts = derived_cache.get_or_compute(key, snap.sources,
+                                                  lambda: index.retention(day_numbers, mask))
+        
+        with span('format'):
+            result = []
+            for day, (eligible, bounded, unbounded) in zip(day_numbers, counts):
+                result.append({
+                    'day': day,
+                    'eligible_users': eligible,
+                    'bounded_users': bounded,
+                    'unbounded_users': unbounded,
+                    'bounded': round(bounded / eligible * 100, 2) if eligible else 0.0,
+                    'unbounded': round(unbounded / eligible * 100, 2) if eligible else 0.0
+                })
+        
+        with span('serialize'):
+            return jsonify({
+                'retention': result,
+                'users': int(index.num_users if mask is None else mask.sum()),
+                'filters': filters
+            })
+    except Exception as e:
+        print(f"Error calculating retention: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/stickiness', methods=['GET'])
+def get_stickiness():
+    """Daily DAU, rolling WAU/MAU and DAU/MAU stickiness, optionally for a user segment"""
+    try:
+        snap = _snapshot()
+        filters, mask = _user_filter_arg(snap)
+        
+        with span('index'):
+            index = _activity_index(snap)
+        
+        key = ('stickiness', tuple((c, tuple(v)) for c, v in filters.items()))
+        with span('rolling'):
+            active = derived_cache.get_or_compute(key, snap.sources,
+                                                  lambda: index.rolling_active((1, 7, 30), mask))
+        
+        with span('format'):
+            dau, wau, mau = active[1], active[7], active[30]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                dau_wau = np.where(wau > 0, dau / wau * 100, 0.0)
+                dau_mau = np.where(mau > 0, dau / mau * 100, 0.0)
+            dates = [index.date(day) for day in range(len(dau))]
+            series = [{
+                'date': date,
+                'dau': int(dau[i]),
+                'wau': int(wau[i]),
+                'mau': int(mau[i]),
+                'dau_wau': round(float(dau_wau[i]), 2),
+                'dau_mau': round(float(dau_mau[i]), 2)
+            } for i, date in enumerate(dates)]
+        
+        with span('serialize'):
+            return jsonify({
+                'series': series,
+                # First 29 days have partial MAU windows, so they are left out of the average
+                'average_dau_mau': round(float(dau_mau[29:].mean()), 2) if len(dau_mau) > 29 else None,
+                'filters': filters
+            })
+    except Exception as e:
+        print(f"Error calculating stickiness: {e}")
+        return jsonify({'error': str(e)}), 500
+
+def _time_index(snap):
+    """int64 timestamp keys of the (time-sorted) event table, for range filters"""
+    return snapshot_cache.get_or_compute('time_index', snap, lambda: event_index.TimeIndex(snap.events))
+
+def _user_event_index(snap):
+    """Events sorted by user and timestamp, shared by sequence analyses"""
+    return snapshot_cache.get_or_compute('user_event_index', snap,
+                                         lambda: event_index.UserEventIndex(snap.events, EVENT_TYPES))
+
+# Longest path length /api/paths enumerates
+MAX_PATH_STEPS = 8
+
+@app.route('/api/paths', methods=['GET'])
+def get_paths():
+    """Next/previous event transition matrices and the most frequent k-step paths"""
+    try:
+        steps = request.args.get('steps', 3, type=int)
+        top = request.args.get('top', 10, type=int)
+        sessions = request.args.get('sessions', '1') != '0'
+        focus = request.args.get('event')
+        start_with = request.args.get('start_with')
+        end_with = request.args.get('end_with')
+        
+        if not 2 <= steps <= MAX_PATH_STEPS or not 1 <= top <= 100:
+            return jsonify({'error': f'steps must be between 2 and {MAX_PATH_STEPS}, top between 1 and 100'}), 400
+        
+        snap = _snapshot()
+        with span('index'):
+            index = _user_event_index(snap)
+        names = index.event_names
+        for value in (focus, start_with, end_with):
+            if value is not None and value not in names:
+                return jsonify({'error': f"Unknown event '{value}'"}), 400
+        
+        with span('transitions'):
+            counts, starts, ends = derived_cache.get_or_compute(
+                ('transitions', sessions), snap.sources, lambda: paths.transition_counts(index, sessions))
+            with np.errstate(divide='ignore', invalid='ignore'):
+                # Rows: from event; columns: next event, then end of sequence
+                outgoing = np.column_stack([counts, ends])
+                next_probabilities = np.nan_to_num(outgoing / outgoing.sum(axis=1, keepdims=True))
+                # Rows: event; columns: previous event, then start of sequence
+                incoming = np.column_stack([counts.T, starts])
+                previous_probabilities = np.nan_to_num(incoming / incoming.sum(axis=1, keepdims=True))
+        
+        with span('paths'):
+            codes = {name: i for i, name in enumerate(names)}
+            path_key = ('top_paths', steps, top, sessions, start_with, end_with)
+            top_runs, run_counts, total_runs = derived_cache.get_or_compute(
+                path_key, snap.sources,
+                lambda: paths.top_paths(index, steps, top, sessions, codes.get(start_with), codes.get(end_with)))
+        
+        with span('format'):
+            result = {
+                'events': names,
+                'sessions': sessions,
+                'transition_counts': counts.tolist(),
+                'start_counts': starts.tolist(),
+                'end_counts': ends.tolist(),
+                'next_probabilities': np.round(next_probabilities, 4).tolist(),
+                'previous_probabilities': np.round(previous_probabilities, 4).tolist(),
+                'steps': steps,
+                'total_paths': total_runs,
+                'paths': [{
+                    'path': [names[e] for e in run],
+                    'count': count,
+                    'share': round(count / total_runs * 100, 2)
+                } for run, count in zip(top_runs, run_counts)]
+            }
+            
+            if focus is not None:
+                i = codes[focus]
+                labels = names + ['(end)']
+                result['focus'] = {
+                    'event': focus,
+                    'next': sorted(({'event': labels[j], 'count': int(outgoing[i, j]),
+                                     'probability': round(float(next_probabilities[i, j]), 4)}
+                                    for j in range(len(labels)) if outgoing[i, j]),
+                                   key=lambda item: -item['count']),
+                    'previous': sorted(({'event': (names + ['(start)'])[j], 'count': int(incoming[i, j]),
+                                         'probability': round(float(previous_probabilities[i, j]), 4)}
+                                        for j in range(len(labels)) if incoming[i, j]),
+                                       key=lambda item: -item['count'])
+                }
+        
+        with span('serialize'):
+            return jsonify(result)
+    except Exception as e:
+        print(f"Error calculating paths: {e}")
+        return jsonify({'error': str(e)}), 500
+
+def _cube(snap):
+    """Pre-aggregated event counts by day, event and user attributes"""
+    return snapshot_cache.get_or_compute('cube', snap, lambda: cube.Cube.build(snap.users, snap.events))
+
+def _day_arg(name):
+    value = request.args.get(name)
+    return None if not value else int(event_index.to_ns(value) // (86400 * 10**9))
+
+@app.route('/api/query', methods=['GET'])
+def get_query():
+    """Event and distinct-user counts grouped by any cube dimensions, from the cube when it can answer exactly"""
+    try:
+        group_by = [d for d in request.args.get('group_by', '').split(',') if d]
+        measures = [m for m in request.args.get('measures', 'events,users').split(',') if m]
+        unknown = [d for d in group_by if d not in cube.DIMENSIONS] + [m for m in measures if m not in cube.MEASURES]
+        if unknown or not measures or len(set(group_by)) != len(group_by):
+            return jsonify({'error': f"group_by must be distinct values of {', '.join(cube.DIMENSIONS)}; "
+                                     f"measures of {', '.join(cube.MEASURES)}"}), 400
+        
+        filters = {}
+        for dimension in ['event_name'] + cube.USER_DIMENSIONS:
+            values = [v for v in request.args.get(dimension, '').split(',') if v]
+            if values:
+                filters[dimension] = values
+        try:
+            day_range = (_day_arg('start_date'), _day_arg('end_date'))
+        except ValueError:
+            return jsonify({'error': 'start_date and end_date must be ISO dates'}), 400
+        
+        snap = _snapshot()
+        with span('plan'):
+            event_cube = _cube(snap)
+            cuboid = None if request.args.get('route') == 'raw' else event_cube.plan(group_by, filters, day_range, measures)
+        with span('aggregate'):
+            if cuboid is not None:
+                result = event_cube.query(cuboid, group_by, filters, day_range, measures)
+            else:
+                result = cube.raw_query(snap.users, snap.events, group_by, filters, day_range, measures)
+        
+        if 'day' in result:
+            result['day'] = result['day'].to_numpy().astype('datetime64[D]').astype(str)
+        return jsonify({
+            'route': 'raw' if cuboid is None else f'cube:{cuboid}',
+            'group_by': group_by,
+            'measures': measures,
+            'filters': filters,
+            'rows': result.to_dict(orient='records')
+        })
+    except Exception as e:
+        print(f"Error in get_query: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/ab-test', methods=['GET'])
 def get_ab_test():
     """Get A/B test comparison statistics"""
+    snap = _snapshot()
+    sample, error = _sample_arg(snap)
+    if error:
+        return error
     try:
         # Get optional limit parameters
         limit = request.args.get('limit', type=int)
@@ -283,49 +1219,55 @@ def get_ab_test():
                 
         else:
             # Live Data Mode
+            current_users_df = snap.users
+            current_events_df = snap.events
+            
+            # A uniform user sample keeps whole user histories, unlike head()
+            if sample is not None:
+                current_users_df = sample.users
+                current_events_df = sample.events
+                results['sampling'] = sample.info(confidence_level)
+            
             # Use a subset of users if limit is provided
-            current_users_df = users_df
             if limit and limit > 0:
-                current_users_df = users_df.head(limit)
+                current_users_df = current_users_df.head(limit)
                 
             # Use a subset of events if event_limit is provided
-            current_events_df = events_df
             if event_limit and event_limit > 0:
-                current_events_df = events_df.head(event_limit)
+                current_events_df = current_events_df.head(event_limit)
                 
             # Merge users with events
-            df = current_events_df.merge(current_users_df[['user_id', 'ab_variant']], on='user_id')
-            
-            # Define funnel stages
-            funnel_stages = ['signup_success', 'view_dashboard', 'start_project', 'complete_task', 'invite_user']
+            with span('merge'):
+                df = current_events_df.merge(current_users_df[['user_id', 'ab_variant']], on='user_id')
             
             # Base data calculation for A and B
-            for variant in ['A', 'B']:
-                variant_users = current_users_df[current_users_df['ab_variant'] == variant]
-                variant_events = df[df['ab_variant'] == variant]
-                
-                # Calculate metrics for each funnel stage
-                funnel_metrics = []
-                total_users = len(variant_users)
-                
-                for stage in funnel_stages:
-                    users_at_stage = variant_events[variant_events['event_name'] == stage]['user_id'].nunique()
-                    conversion_rate = (users_at_stage / total_users * 100) if total_users > 0 else 0
-                    funnel_metrics.append({
-                        'stage': stage,
-                        'users': int(users_at_stage),
-                        'conversion_rate': round(conversion_rate, 2)
-                    })
-                
-                # Overall metrics
-                avg_events = len(variant_events) / total_users if total_users > 0 else 0
-                
-                results[f'variant_{variant}'] = {
-                    'total_users': int(total_users),
-                    'total_events': int(len(variant_events)),
-                    'avg_events_per_user': round(avg_events, 2),
-                    'funnel': funnel_metrics
-                }
+            with span('funnel'):
+                for variant in ['A', 'B']:
+                    variant_users = current_users_df[current_users_df['ab_variant'] == variant]
+                    variant_events = df[df['ab_variant'] == variant]
+                    
+                    # Calculate metrics for each funnel stage
+                    funnel_metrics = []
+                    total_users = len(variant_users)
+                    
+                    for stage in FUNNEL_STAGES:
+                        users_at_stage = variant_events[variant_events['event_name'] == stage]['user_id'].nunique()
+                        conversion_rate = (users_at_stage / total_users * 100) if total_users > 0 else 0
+                        funnel_metrics.append({
+                            'stage': stage,
+                            'users': int(users_at_stage),
+                            'conversion_rate': round(conversion_rate, 2)
+                        })
+                    
+                    # Overall metrics
+                    avg_events = len(variant_events) / total_users if total_users > 0 else 0
+                    
+                    results[f'variant_{variant}'] = {
+                        'total_users': int(total_users),
+                        'total_events': int(len(variant_events)),
+                        'avg_events_per_user': round(avg_events, 2),
+                        'funnel': funnel_metrics
+                    }
 
             # Calculate stats input from live data (using last stage conversion for simplification)
             n_a = results['variant_A']['total_users']
@@ -339,12 +1281,15 @@ def get_ab_test():
             conv_b = conv_users_b / n_b if n_b > 0 else 0
             
             # Calculate lift (B vs A)
+            # Note: 'lift' compares average events per user; 'conversion_lift' is the
+            # relative change in the conversion rate that the significance test uses
             if results['variant_A']['total_users'] > 0:
                 lift = ((results['variant_B']['avg_events_per_user'] - results['variant_A']['avg_events_per_user']) / 
                         results['variant_A']['avg_events_per_user'] * 100)
                 results['lift'] = round(lift, 2)
             else:
                 results['lift'] = 0
+            results['conversion_lift'] = round((conv_b - conv_a) / conv_a * 100, 2) if conv_a > 0 else 0
         
         # --- Statistical Calculations (Z-Test & Power) ---
         stats_result = {
@@ -355,96 +1300,616 @@ def get_ab_test():
             'confidence_level': confidence_level
         }
         
-        if n_a > 0 and n_b > 0:
-            # Pooled probability
-            p_pool = (n_a * conv_a + n_b * conv_b) / (n_a + n_b)
-            
-            # Standard Error
-            se = np.sqrt(p_pool * (1 - p_pool) * (1/n_a + 1/n_b))
-            
-            if se > 0:
-                # Z-Score
-                z_score = (conv_b - conv_a) / se
-                stats_result['z_score'] = float(round(z_score, 4))
+        with span('stats'):
+            if n_a > 0 and n_b > 0:
+                # Pooled probability
+                p_pool = (n_a * conv_a + n_b * conv_b) / (n_a + n_b)
                 
-                # P-Value (Two-tailed)
-                p_value = 2 * (1 - NormalDist().cdf(abs(z_score)))
-                stats_result['p_value'] = float(round(p_value, 4))
+                # Standard Error
+                se = np.sqrt(p_pool * (1 - p_pool) * (1/n_a + 1/n_b))
                 
-                # Significance
-                alpha = 1 - confidence_level
-                stats_result['significant'] = bool(p_value < alpha)
-                
-                # Power Calculation
-                # Effect size
-                h = 2 * (np.arcsin(np.sqrt(conv_b)) - np.arcsin(np.sqrt(conv_a)))
-                
-                # Sample size for power (harmonic mean approx)
-                n_harm = 2 * n_a * n_b / (n_a + n_b)
-                
-                # Power (1 - beta)
-                # alpha/2 for two-tailed
-                z_alpha = NormalDist().inv_cdf(1 - alpha/2)
-                z_beta = abs(h) * np.sqrt(n_harm/2) - z_alpha
-                power = NormalDist().cdf(z_beta)
-                stats_result['power'] = float(round(power, 4))
+                if se > 0:
+                    # Z-Score
+                    z_score = (conv_b - conv_a) / se
+                    stats_result['z_score'] = float(round(z_score, 4))
+                    
+                    # P-Value (Two-tailed)
+                    p_value = 2 * (1 - statistics.NormalDist().cdf(abs(z_score)))
+                    stats_result['p_value'] = float(round(p_value, 4))
+                    
+                    # Significance
+                    alpha = 1 - confidence_level
+                    stats_result['significant'] = bool(p_value < alpha)
+                    
+                    # Power Calculation
+                    # Effect size
+                    h = 2 * (np.arcsin(np.sqrt(conv_b)) - np.arcsin(np.sqrt(conv_a)))
+                    
+                    # Sample size for power (harmonic mean approx)
+                    n_harm = 2 * n_a * n_b / (n_a + n_b)
+                    
+                    # Power (1 - beta)
+                    # alpha/2 for two-tailed
+                    z_alpha = statistics.NormalDist().inv_cdf(1 - alpha/2)
+                    z_beta = abs(h) * np.sqrt(n_harm/2) - z_alpha
+                    power = statistics.NormalDist().cdf(z_beta)
+                    stats_result['power'] = float(round(power, 4))
         
         results['stats'] = stats_result
         
-        return jsonify(results)
+        with span('serialize'):
+            return jsonify(results)
     except Exception as e:
         print(f"Error in ab-test: {e}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/funnel', methods=['GET'])
-def get_funnel():
-    """Get funnel conversion metrics"""
+def _reached_matrix(users, events, metrics):
+    """Boolean users x metrics matrix: did each user ever fire each event"""
+    user_codes = pd.Index(users['user_id']).get_indexer(events['user_id'])
+    metric_codes = pd.Index(metrics).get_indexer(events['event_name'])
+    keep = (user_codes >= 0) & (metric_codes >= 0)
+    reached = np.zeros((len(users), len(metrics)), dtype=bool)
+    reached[user_codes[keep], metric_codes[keep]] = True
+    return reached
+
+def _segment_codes(users, columns):
+    """Integer segment per user for the cross product of columns, plus segment labels"""
+    codes = np.zeros(len(users), dtype=np.int64)
+    levels = []
+    for column in columns:
+        column_codes, uniques = pd.factorize(users[column].astype(str), sort=True)
+        codes = codes * len(uniques) + column_codes
+        levels.append(list(uniques))
+    present, codes = np.unique(codes, return_inverse=True)
+    
+    labels = []
+    for code in present:
+        parts = []
+        for uniques in reversed(levels):
+            code, index = divmod(int(code), len(uniques))
+            parts.append(uniques[index])
+        labels.append(' / '.join(reversed(parts)))
+    return codes, labels
+
+def _ab_test_report(snap, users, events, metrics, segment_by, control, correction, confidence_level, cache_key):
+    """Every metric x segment x variant-vs-control comparison, computed in one vectorized pass"""
+    with span('reached'):
+        reached = derived_cache.get_or_compute(cache_key, snap.sources,
+                                               lambda: _reached_matrix(users, events, metrics))
+    
+    variants, variant_codes = np.unique(users['ab_variant'].astype(str).to_numpy(), return_inverse=True)
+    variants = list(variants)
+    if control is None:
+        control = variants[0]
+    if control not in variants:
+        raise ValueError(f"Unknown control variant '{control}'")
+    num_variants = len(variants)
+    control_index = variants.index(control)
+    treatments = [i for i in range(num_variants) if i != control_index]
+    
+    with span('segments'):
+        # Overall plus one segmentation per requested dimension (or '*' cross product)
+        segmentations = [(None, np.zeros(len(users), dtype=np.int64), ['all'])]
+        for dimension in segment_by:
+            codes, labels = _segment_codes(users, dimension.split('*'))
+            segmentations.append((dimension, codes, labels))
+        
+        offsets = np.cumsum([0] + [len(labels) for _, _, labels in segmentations])
+        group_codes = np.concatenate([codes + offset for (_, codes, _), offset in zip(segmentations, offsets)])
+        cells = group_codes * num_variants + np.tile(variant_codes, len(segmentations))
+    
+    with span('counts'):
+        num_groups = int(offsets[-1])
+        n, conversions = abstats.group_conversion_counts(
+            cells, num_groups * num_variants, np.tile(reached, (len(segmentations), 1)))
+        n = n.reshape(num_groups, num_variants)
+        conversions = conversions.reshape(num_groups, num_variants, len(metrics))
+    
+    with span('stats'):
+        # Shapes: groups x treatments x metrics
+        n_c = np.broadcast_to(n[:, control_index, None, None], (num_groups, len(treatments), len(metrics)))
+        conv_c = np.broadcast_to(conversions[:, control_index, None, :], n_c.shape)
+        n_t = np.broadcast_to(n[:, treatments, None], n_c.shape)
+        conv_t = conversions[:, treatments, :]
+        tests = abstats.two_proportion_tests(conv_c, n_c, conv_t, n_t, confidence_level)
+        p_adjusted = abstats.CORRECTIONS[correction](tests['p_value'].ravel()).reshape(n_c.shape)
+        significant = p_adjusted < 1 - confidence_level
+    
+    def pct(value):
+        return None if np.isnan(value) else round(float(value) * 100, 2)
+    
+    def prob(value):
+        return None if np.isnan(value) else round(float(value), 4)
+    
+    with span('format'):
+        segments = []
+        for (dimension, _, labels), offset in zip(segmentations, offsets):
+            for j, label in enumerate(labels):
+                g = offset + j
+                comparisons = []
+                for t, variant_index in enumerate(treatments):
+                    for k, metric in enumerate(metrics):
+                        comparisons.append({
+                            'variant': variants[variant_index],
+                            'metric': metric,
+                            'control_rate': pct(tests['control_rate'][g, t, k]),
+                            'variant_rate': pct(tests['variant_rate'][g, t, k]),
+                            'diff': pct(tests['diff'][g, t, k]),
+                            'diff_ci': [pct(tests['diff_low'][g, t, k]), pct(tests['diff_high'][g, t, k])],
+                            'lift': pct(tests['lift'][g, t, k]),
+                            'lift_ci': [pct(tests['lift_low'][g, t, k]), pct(tests['lift_high'][g, t, k])],
+                            'z_score': prob(tests['z_score'][g, t, k]),
+                            'p_value': prob(tests['p_value'][g, t, k]),
+                            'p_adjusted': prob(p_adjusted[g, t, k]),
+                            'significant': bool(significant[g, t, k])
+                        })
+                segments.append({
+                    'dimension': dimension,
+                    'segment': label,
+                    'variants': {
+                        variants[v]: {
+                            'users': int(n[g, v]),
+                            'conversions': {metric: int(conversions[g, v, k]) for k, metric in enumerate(metrics)}
+                        } for v in range(num_variants)
+                    },
+                    'comparisons': comparisons
+                })
+    
+    return {
+        'variants': variants,
+        'control': control,
+        'metrics': metrics,
+        'correction': correction,
+        'confidence_level': confidence_level,
+        'tests': int(np.count_nonzero(~np.isnan(tests['p_value']))),
+        'segments': segments
+    }
+
+@app.route('/api/ab-test/report', methods=['GET'])
+def get_ab_test_report():
+    """Conversion tests for every metric, segment and variant against the control, with multiple-comparison correction"""
+    snap = _snapshot()
+    sample, error = _sample_arg(snap)
+    if error:
+        return error
     try:
-        funnel_stages = ['signup_success', 'view_dashboard', 'start_project', 'complete_task', 'invite_user']
+        confidence_level = request.args.get('confidence_level', 0.95, type=float)
+        metrics = [m for m in request.args.get('metrics', ','.join(FUNNEL_STAGES)).split(',') if m]
+        segment_by = [d for d in request.args.get('segment_by', '').split(',') if d]
+        control = request.args.get('control')
+        correction = request.args.get('correction', 'holm')
         
-        total_users = len(users_df)
-        funnel_data = []
+        if not 0 < confidence_level < 1:
+            return jsonify({'error': 'confidence_level must be between 0 and 1'}), 400
+        unknown = [m for m in metrics if m not in EVENT_TYPES]
+        if unknown or not metrics:
+            return jsonify({'error': f"metrics must be event names from: {', '.join(EVENT_TYPES)}"}), 400
+        if any(c not in SEGMENT_DIMENSIONS for d in segment_by for c in d.split('*')):
+            return jsonify({'error': f"segment_by must use: {', '.join(SEGMENT_DIMENSIONS)}"}), 400
+        if correction not in abstats.CORRECTIONS:
+            return jsonify({'error': f"correction must be one of: {', '.join(abstats.CORRECTIONS)}"}), 400
         
-        for i, stage in enumerate(funnel_stages):
-            users_at_stage = events_df[events_df['event_name'] == stage]['user_id'].nunique()
-            conversion_from_total = (users_at_stage / total_users * 100) if total_users > 0 else 0
+        users, events = snap.users, snap.events
+        cache_key = ('ab_reached', tuple(metrics))
+        if sample is not None:
+            users, events = sample.users, sample.events
+            cache_key += (sample.rate,)
+        
+        try:
+            report = _ab_test_report(snap, users, events, metrics, segment_by, control, correction,
+                                     confidence_level, cache_key)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if sample is not None:
+            report['sampling'] = sample.info(confidence_level)
+        
+        with span('serialize'):
+            return jsonify(report)
+    except Exception as e:
+        print(f"Error in ab-test report: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/ab-test/sequential', methods=['GET'])
+def get_ab_test_sequential():
+    """Always-valid (mSPRT) monitoring of a conversion metric, updated from newly arrived events only"""
+    try:
+        metric = request.args.get('metric', FUNNEL_STAGES[-1])
+        control = request.args.get('control', 'A')
+        tau = request.args.get('tau', sequential.DEFAULT_TAU, type=float)
+        alpha = request.args.get('alpha', 0.05, type=float)
+        
+        if metric not in EVENT_TYPES:
+            return jsonify({'error': f"metric must be one of: {', '.join(EVENT_TYPES)}"}), 400
+        if tau <= 0 or not 0 < alpha < 1:
+            return jsonify({'error': 'tau must be positive and alpha between 0 and 1'}), 400
+        
+        snap = _snapshot()
+        variants = snapshot_cache.get_or_compute(
+            'ab_variants', snap, lambda: sorted(snap.users['ab_variant'].astype(str).unique()))
+        with span('update'):
+            try:
+                # Checked before anything is kept for the experiment
+                test = sequential.get_test(metric, control, tau, snap.dataset, variants)
+                new_events = test.update(snap.users, snap.events)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+        
+        with span('format'):
+            result = test.summary(alpha)
+            result['state']['new_events'] = new_events
+        
+        with span('serialize'):
+            return jsonify(result)
+    except Exception as e:
+        print(f"Error in sequential ab-test: {e}")
+        return jsonify({'error': str(e)}), 500
+
+# Largest power grid (confidence levels x baselines x MDEs x sample sizes) served in one call
+MAX_POWER_GRID_CELLS = 200000
+
+def _grid_arg(name, default):
+    """Parse a grid parameter: 'a,b,c' or 'start:stop:count' (evenly spaced, inclusive)"""
+    raw = request.args.get(name, default)
+    if ':' in raw:
+        start, stop, count = raw.split(':')
+        return np.linspace(float(start), float(stop), int(count))
+    return np.array([float(v) for v in raw.split(',') if v])
+
+def _finite_list(values, digits):
+    """Nested lists with NaN/inf as null (JSON has no NaN); digits=0 gives integers"""
+    finite = np.isfinite(values)
+    rounded = np.round(np.where(finite, values, 0), digits)
+    if digits == 0:
+        rounded = rounded.astype(np.int64)
+    return np.where(finite, rounded, None).tolist()
+
+@app.route('/api/ab-test/power-curve', methods=['GET'])
+def get_ab_test_power_curve():
+    """Power and required sample size over grids of n, baseline rate, MDE and confidence level"""
+    try:
+        try:
+            n = np.round(_grid_arg('n', '100:10000:100'))
+            baseline = _grid_arg('baseline', '10')
+            mde = _grid_arg('mde', '5:50:10')
+            confidence_levels = _grid_arg('confidence_level', '0.95')
+        except ValueError:
+            return jsonify({'error': "grid parameters must be 'a,b,c' or 'start:stop:count'"}), 400
+        target_power = request.args.get('power', 0.8, type=float)
+        mde_type = request.args.get('mde_type', 'relative')
+        
+        if mde_type not in ('relative', 'absolute'):
+            return jsonify({'error': "mde_type must be 'relative' or 'absolute'"}), 400
+        if not all(len(grid) for grid in (n, baseline, mde, confidence_levels)):
+            return jsonify({'error': 'grid parameters must not be empty'}), 400
+        if (n <= 0).any() or ((confidence_levels <= 0) | (confidence_levels >= 1)).any() or not 0 < target_power < 1:
+            return jsonify({'error': 'n must be positive; confidence_level and power must be between 0 and 1'}), 400
+        # Both arms need a conversion rate strictly between 0% and 100%
+        bad = baseline[(baseline <= 0) | (baseline >= 100)]
+        if len(bad):
+            return jsonify({'error': f'baseline must be between 0 and 100; got {bad[0]:g}'}), 400
+        if (mde == 0).any():
+            return jsonify({'error': 'mde must not be 0'}), 400
+        treatment = (np.multiply.outer(baseline, 1 + mde / 100) if mde_type == 'relative'
+                     else np.add.outer(baseline, mde))
+        bad_b, bad_m = np.nonzero((treatment <= 0) | (treatment >= 100))
+        if len(bad_b):
+            return jsonify({'error': f'baseline {baseline[bad_b[0]]:g} with mde {mde[bad_m[0]]:g} '
+                                     f'puts the treatment rate outside 0 to 100'}), 400
+        cells = len(n) * len(baseline) * len(mde) * len(confidence_levels)
+        if cells > MAX_POWER_GRID_CELLS:
+            return jsonify({'error': f'grid has {cells} cells; the limit is {MAX_POWER_GRID_CELLS}'}), 400
+        
+        with span('stats'):
+            # Rates and MDE are given in percent, like the simulation parameters of /api/ab-test
+            power, required_n = abstats.power_grid(
+                n, baseline / 100, mde / 100, confidence_levels, target_power, relative=mde_type == 'relative')
+        
+        with span('serialize'):
+            return jsonify({
+                'dims': ['confidence_level', 'baseline', 'mde', 'n'],
+                'confidence_level': confidence_levels.tolist(),
+                'baseline': baseline.tolist(),
+                'mde': mde.tolist(),
+                'mde_type': mde_type,
+                'n': n.astype(int).tolist(),
+                'target_power': target_power,
+                'power': _finite_list(power, 4),
+                'required_n': _finite_list(required_n, 0)
+            })
+    except Exception as e:
+        print(f"Error in ab-test power curve: {e}")
+        return jsonify({'error': str(e)}), 500
+
+# Continuous per-user metrics the bootstrap endpoint supports
+USER_METRICS = ['events_per_user', 'sessions_per_user', 'session_hours']
+
+def _per_user_metrics(snap, users, events, sample):
+    """Per-user metric arrays aligned with users (zero for users without events)"""
+    user_codes = pd.Index(users['user_id']).get_indexer(events['user_id'])
+    counts = np.bincount(user_codes[user_codes >= 0], minlength=len(users))
+    
+    session_stats = _user_session_stats(snap, sample).set_index('user_id')
+    session_stats = session_stats.reindex(users['user_id'])
+    return {
+        'events_per_user': counts.astype(np.float64),
+        'sessions_per_user': session_stats['total_sessions'].fillna(0).to_numpy(dtype=np.float64),
+        'session_hours': session_stats['total_hours'].fillna(0).to_numpy(dtype=np.float64)
+    }
+
+def _ab_bootstrap(snap, users, events, sample, metrics, control, resamples, seed, confidence_level):
+    """Bootstrap means per variant and variant-vs-control comparisons for each metric"""
+    with span('per_user'):
+        key = 'ab_user_metrics' if sample is None else ('ab_user_metrics', sample.rate)
+        values = snapshot_cache.get_or_compute(key, snap,
+                                               lambda: _per_user_metrics(snap, users, events, sample))
+    
+    variants, variant_codes = np.unique(users['ab_variant'].astype(str).to_numpy(), return_inverse=True)
+    variants = list(variants)
+    if control is None:
+        control = variants[0]
+    if control not in variants:
+        raise ValueError(f"Unknown control variant '{control}'")
+    
+    # One independent, reproducible stream per (metric, variant)
+    streams = np.random.SeedSequence(seed).spawn(len(metrics) * len(variants))
+    
+    def rounded(value, digits=4):
+        return None if value is None or np.isnan(value) else round(float(value), digits)
+    
+    result = {}
+    with span('resample'):
+        for m, metric in enumerate(metrics):
+            means, resampled = {}, {}
+            for v, variant in enumerate(variants):
+                variant_values = values[metric][variant_codes == v]
+                rng = np.random.default_rng(streams[m * len(variants) + v])
+                means[variant] = variant_values.mean() if len(variant_values) else np.nan
+                resampled[variant] = bootstrap.resample_means(variant_values, resamples, rng)
+            
+            comparisons = []
+            for variant in variants:
+                if variant == control:
+                    continue
+                stats = bootstrap.compare(resampled[control], resampled[variant],
+                                          means[control], means[variant], confidence_level)
+                comparisons.append({
+                    'variant': variant,
+                    'diff': rounded(stats['diff']),
+                    'diff_ci': [rounded(v) for v in stats['diff_ci']],
+                    'lift': rounded(stats['lift'] * 100, 2),
+                    'lift_ci': [rounded(v * 100, 2) for v in stats['lift_ci']],
+                    'p_value': rounded(stats['p_value'])
+                })
+            
+            result[metric] = {
+                'variants': {
+                    variant: {
+                        'users': int(np.count_nonzero(variant_codes == v)),
+                        'mean': rounded(means[variant]),
+                        'mean_ci': [rounded(x) for x in
+                                    bootstrap.percentile_interval(resampled[variant], confidence_level)]
+                    } for v, variant in enumerate(variants)
+                },
+                'comparisons': comparisons
+            }
+    
+    return {
+        'variants': variants,
+        'control': control,
+        'resamples': resamples,
+        'seed': seed,
+        'confidence_level': confidence_level,
+        'metrics': result
+    }
+
+@app.route('/api/ab-test/bootstrap', methods=['GET'])
+def get_ab_test_bootstrap():
+    """Bootstrap confidence intervals for continuous per-user metrics by variant"""
+    snap = _snapshot()
+    sample, error = _sample_arg(snap)
+    if error:
+        return error
+    try:
+        confidence_level = request.args.get('confidence_level', 0.95, type=float)
+        metrics = [m for m in request.args.get('metrics', ','.join(USER_METRICS)).split(',') if m]
+        control = request.args.get('control')
+        resamples = request.args.get('resamples', bootstrap.DEFAULT_RESAMPLES, type=int)
+        seed = request.args.get('seed', 0, type=int)
+        
+        if not 0 < confidence_level < 1:
+            return jsonify({'error': 'confidence_level must be between 0 and 1'}), 400
+        if not metrics or any(m not in USER_METRICS for m in metrics):
+            return jsonify({'error': f"metrics must be from: {', '.join(USER_METRICS)}"}), 400
+        if not 1 <= resamples <= bootstrap.MAX_RESAMPLES:
+            return jsonify({'error': f'resamples must be between 1 and {bootstrap.MAX_RESAMPLES}'}), 400
+        if seed < 0:
+            return jsonify({'error': 'seed must be non-negative'}), 400
+        
+        users, events = snap.users, snap.events
+        if sample is not None:
+            users, events = sample.users, sample.events
+        
+        # Same seed, same data version -> same answer, so repeated views are served from cache
+        key = ('ab_bootstrap', tuple(metrics), control, resamples, seed, confidence_level,
+               None if sample is None else sample.rate)
+        try:
+            report = derived_cache.get_or_compute(key, snap.sources, lambda: _ab_bootstrap(
+                snap, users, events, sample, metrics, control, resamples, seed, confidence_level))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        if sample is not None:
+            report = dict(report, sampling=sample.info(confidence_level))
+        
+        with span('serialize'):
+            return jsonify(report)
+    except Exception as e:
+        print(f"Error in ab-test bootstrap: {e}")
+        return jsonify({'error': str(e)}), 500
+
+def _approximate_funnel(sample, confidence_level):
+    """get_funnel estimated from a user sample, with confidence intervals"""
+    z = sampling.z_value(confidence_level)
+    rate = sample.rate
+    user_ids = sample.users['user_id']
+    events = sample.events
+    ones = np.ones(len(user_ids))
+    
+    with span('stages'):
+        reached = [user_ids.isin(events.loc[events['event_name'] == stage, 'user_id']).to_numpy()
+                   for stage in FUNNEL_STAGES]
+    
+    with span('estimate'):
+        total_users, total_users_ci = sampling.estimate_count(len(user_ids), rate, z)
+        funnel_data = []
+        for i, stage in enumerate(FUNNEL_STAGES):
+            users_at_stage, users_ci = sampling.estimate_count(int(reached[i].sum()), rate, z)
+            from_total, from_total_ci = sampling.estimate_ratio(reached[i], ones, rate, z, upper_bound=1)
+            if i > 0:
+                from_prev, from_prev_ci = sampling.estimate_ratio(reached[i], reached[i - 1], rate, z, upper_bound=1)
+            else:
+                from_prev, from_prev_ci = 1.0, [1.0, 1.0]
             
-            # Conversion from previous stage
+            funnel_data.append({
+                'stage': stage.replace('_', ' ').title(),
+                'users': int(round(users_at_stage)),
+                'conversion_from_total': round(from_total * 100, 2),
+                'conversion_from_previous': round(from_prev * 100, 2),
+                'drop_off': round(100 - from_prev * 100, 2),
+                'confidence_intervals': {
+                    'users': sampling.rounded(users_ci, 0),
+                    'conversion_from_total': sampling.rounded([v * 100 for v in from_total_ci]),
+                    'conversion_from_previous': sampling.rounded([v * 100 for v in from_prev_ci])
+                }
+            })
+    
+    with span('serialize'):
+        return jsonify({
+            'funnel': funnel_data,
+            'total_users': int(round(total_users)),
+            'total_users_ci': sampling.rounded(total_users_ci, 0),
+            'sampling': sample.info(confidence_level)
+        })
+
+def _stage_times(snap):
+    """Per-stage event keys for ordered funnels, built from the user-sorted event index"""
+    return snapshot_cache.get_or_compute('stage_times', snap,
+                                         lambda: funnels.StageTimes(_user_event_index(snap), snap.users, FUNNEL_STAGES))
+
+def _ordered_funnel(snap):
+    """Strict ordered funnel within a conversion window, with time to convert between steps"""
+    try:
+        window_ns = funnels.parse_window(request.args.get('window'))
+    except (ValueError, IndexError):
+        return jsonify({'error': "window must look like '7d', '24h', '30m' or a number of seconds"}), 400
+    filters, mask = _user_filter_arg(snap)
+    
+    with span('stages'):
+        stage_times = _stage_times(snap)
+        # users x stages; shared by every segment filter with the same window
+        times = derived_cache.get_or_compute(('ordered_stage_times', window_ns), snap.sources,
+                                             lambda: stage_times.ordered_times(window_ns))
+    
+    with span('aggregate'):
+        selected = times if mask is None else times[mask]
+        total_users = len(selected)
+        reached = (selected != funnels.NOT_REACHED).sum(axis=0)
+        steps = funnels.time_to_convert(times, mask)
+    
+    with span('format'):
+        funnel_data = []
+        for i, stage in enumerate(FUNNEL_STAGES):
+            users_at_stage = int(reached[i])
+            conversion_from_total = (users_at_stage / total_users * 100) if total_users > 0 else 0
             if i > 0:
-                prev_stage_users = funnel_data[i-1]['users']
+                prev_stage_users = int(reached[i - 1])
                 conversion_from_prev = (users_at_stage / prev_stage_users * 100) if prev_stage_users > 0 else 0
             else:
                 conversion_from_prev = 100.0
-            
             funnel_data.append({
                 'stage': stage.replace('_', ' ').title(),
-                'users': int(users_at_stage),
+                'users': users_at_stage,
                 'conversion_from_total': round(conversion_from_total, 2),
                 'conversion_from_previous': round(conversion_from_prev, 2),
                 'drop_off': round(100 - conversion_from_prev, 2)
             })
         
+        time_to_convert = [dict(step, **{
+            'from': FUNNEL_STAGES[i].replace('_', ' ').title(),
+            'to': FUNNEL_STAGES[i + 1].replace('_', ' ').title()
+        }) for i, step in enumerate(steps)]
+    
+    with span('serialize'):
         return jsonify({
             'funnel': funnel_data,
-            'total_users': int(total_users)
+            'total_users': int(total_users),
+            'mode': 'ordered',
+            'window_seconds': None if window_ns is None else window_ns / 1e9,
+            'filters': filters,
+            'time_to_convert': time_to_convert,
+            'histogram_buckets': list(funnels.HISTOGRAM_LABELS)
         })
+
+@app.route('/api/funnel', methods=['GET'])
+def get_funnel():
+    """Get funnel conversion metrics"""
+    snap = _snapshot()
+    sample, error = _sample_arg(snap)
+    if error:
+        return error
+    try:
+        if request.args.get('mode') == 'ordered':
+            if sample is not None:
+                return jsonify({'error': 'sample is not supported with mode=ordered'}), 400
+            return _ordered_funnel(snap)
+        if sample is not None:
+            return _approximate_funnel(sample, request.args.get('confidence_level', 0.95, type=float))
+        
+        total_users = len(snap.users)
+        funnel_data = []
+        stored = snap.summaries
+        
+        with span('stages'):
+            for i, stage in enumerate(FUNNEL_STAGES):
+                if stored is not None:
+                    users_at_stage = stored.stage_users.get(stage, 0)
+                else:
+                    users_at_stage = snap.events[snap.events['event_name'] == stage]['user_id'].nunique()
+                conversion_from_total = (users_at_stage / total_users * 100) if total_users > 0 else 0
+                
+                # Conversion from previous stage
+                if i > 0:
+                    prev_stage_users = funnel_data[i-1]['users']
+                    conversion_from_prev = (users_at_stage / prev_stage_users * 100) if prev_stage_users > 0 else 0
+                else:
+                    conversion_from_prev = 100.0
+                
+                funnel_data.append({
+                    'stage': stage.replace('_', ' ').title(),
+                    'users': int(users_at_stage),
+                    'conversion_from_total': round(conversion_from_total, 2),
+                    'conversion_from_previous': round(conversion_from_prev, 2),
+                    'drop_off': round(100 - conversion_from_prev, 2)
+                })
+            
+        with span('serialize'):
+            return jsonify({
+                'funnel': funnel_data,
+                'total_users': int(total_users)
+            })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
 
 
-@app.route('/api/user-sessions', methods=['GET'])
-def get_user_sessions():
-    """Calculate user session times and total hours spent"""
-    try:
-        # Get optional parameters
-        limit = request.args.get('limit', 100, type=int)
-        sort_by = request.args.get('sort_by', 'total_hours')  # total_hours, total_sessions, last_activity
-        
+def _compute_user_session_stats(events, max_timestamp):
+    """Per-user session totals (30 minute inactivity timeout), before ranking"""
+    with span('sort'):
         # Sort events by user and timestamp
-        df = events_df.sort_values(['user_id', 'timestamp']).copy()
+        df = events.sort_values(['user_id', 'timestamp']).copy()
         
+    with span('sessionize'):
         # Calculate time difference between consecutive events for each user
         df['time_diff'] = df.groupby('user_id')['timestamp'].diff()
         
@@ -457,6 +1922,7 @@ def get_user_sessions():
         # Assign session IDs
         df['session_id'] = df.groupby('user_id')['new_session'].cumsum()
         
+    with span('aggregate'):
         # Calculate session durations
         session_stats = df.groupby(['user_id', 'session_id']).agg({
             'timestamp': ['min', 'max', 'count']
@@ -483,57 +1949,114 @@ def get_user_sessions():
         # Calculate average session duration
         user_stats['avg_session_duration'] = user_stats['total_hours'] / user_stats['total_sessions']
         
+    with span('status'):
         # Determine if user is active (activity in last 7 days)
-        max_timestamp = events_df['timestamp'].max()
         seven_days_ago = max_timestamp - timedelta(days=7)
         user_stats['status'] = user_stats['last_activity'].apply(
             lambda x: 'active' if x >= seven_days_ago else 'inactive'
         )
+    
+    return user_stats
+
+def _stored_user_session_stats(stored):
+    """The same per-user session totals, from the summary tables"""
+    user_stats = stored.user_sessions[['user_id', 'total_sessions', 'total_hours',
+                                       'first_activity', 'last_activity']].copy()
+    user_stats['avg_session_duration'] = user_stats['total_hours'] / user_stats['total_sessions']
+    seven_days_ago = stored.max_timestamp - timedelta(days=7)
+    user_stats['status'] = np.where(user_stats['last_activity'] >= seven_days_ago, 'active', 'inactive')
+    return user_stats
+
+def _user_session_stats(snap, sample=None):
+    """Cached per-user session totals for the snapshot or a sample of it"""
+    if sample is not None:
+        return snapshot_cache.get_or_compute(
+            ('user_session_stats', sample.rate), snap,
+            lambda: _compute_user_session_stats(sample.events, sample.max_timestamp))
+    stored = snap.summaries
+    if stored is not None:
+        return snapshot_cache.get_or_compute('user_session_stats', snap,
+                                             lambda: _stored_user_session_stats(stored))
+    return snapshot_cache.get_or_compute(
+        'user_session_stats', snap,
+        # The column's own maximum: frames from outside (benchmarks) may be tz-naive
+        lambda: _compute_user_session_stats(snap.events, snap.events['timestamp'].max()))
+
+@app.route('/api/user-sessions', methods=['GET'])
+def get_user_sessions():
+    """Calculate user session times and total hours spent"""
+    snap = _snapshot()
+    sample, error = _sample_arg(snap)
+    if error:
+        return error
+    try:
+        # Get optional parameters
+        limit = request.args.get('limit', 100, type=int)
+        sort_by = request.args.get('sort_by', 'total_hours')  # total_hours, total_sessions, last_activity
         
-        # Sort by requested field
-        if sort_by == 'total_hours':
-            user_stats = user_stats.sort_values('total_hours', ascending=False)
-        elif sort_by == 'total_sessions':
-            user_stats = user_stats.sort_values('total_sessions', ascending=False)
-        elif sort_by == 'last_activity':
-            user_stats = user_stats.sort_values('last_activity', ascending=False)
-        
-        # Limit results
-        user_stats = user_stats.head(limit)
-        
-        # Convert timestamps to strings
-        user_stats['first_activity'] = user_stats['first_activity'].dt.strftime('%Y-%m-%dT%H:%M:%SZ')
-        user_stats['last_activity'] = user_stats['last_activity'].dt.strftime('%Y-%m-%dT%H:%M:%SZ')
-        
-        # Round numeric values
-        user_stats['total_hours'] = user_stats['total_hours'].round(2)
-        user_stats['avg_session_duration'] = user_stats['avg_session_duration'].round(2)
+        # With a sample, per-user figures are exact but only sampled users are ranked
+        user_stats = _user_session_stats(snap, sample)
         
-        return jsonify({
+        with span('rank'):
+            # Sort by requested field; ties by user_id, so stored and scanned tables rank alike
+            if sort_by in ('total_hours', 'total_sessions', 'last_activity'):
+                user_stats = user_stats.sort_values([sort_by, 'user_id'], ascending=[False, True], kind='stable')
+            
+            # Limit results (copied, the unranked table is cached)
+            user_stats = user_stats.head(limit).copy()
+            
+        with span('format'):
+            # Convert timestamps to strings
+            user_stats['first_activity'] = user_stats['first_activity'].dt.strftime('%Y-%m-%dT%H:%M:%SZ')
+            user_stats['last_activity'] = user_stats['last_activity'].dt.strftime('%Y-%m-%dT%H:%M:%SZ')
+            
+            # Round numeric values
+            user_stats['total_hours'] = user_stats['total_hours'].round(2)
+            user_stats['avg_session_duration'] = user_stats['avg_session_duration'].round(2)
+            
+        payload = {
             'user_sessions': user_stats.to_dict('records'),
             'total_users': len(user_stats)
-        })
+        }
+        if sample is not None:
+            payload['sampling'] = sample.info(request.args.get('confidence_level', 0.95, type=float))
+        
+        with span('serialize'):
+            return jsonify(payload)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/kpi-time-series', methods=['GET'])
-def get_kpi_time_series():
-    """Get KPI time series data (DAU, Signups)"""
-    try:
-        # Calculate Daily Active Users (DAU)
-        # Group events by date and count unique users
-        events_df['date'] = events_df['timestamp'].dt.date
-        dau_series = events_df.groupby('date')['user_id'].nunique()
-        df_dau = pd.DataFrame({'date': dau_series.index, 'dau': dau_series.values})
-        df_dau['date'] = pd.to_datetime(df_dau['date'])
-
-        # Calculate Signups per Day
-        users_df['date'] = users_df['joined_at'].dt.date
-        signups_series = users_df.groupby('date').size()
-        df_signups = pd.DataFrame({'date': signups_series.index, 'signups': signups_series.values})
-        df_signups['date'] = pd.to_datetime(df_signups['date'])
+def _approximate_kpi_time_series(sample, confidence_level):
+    """Daily DAU and signups estimated from a user sample, with per-day confidence intervals"""
+    z = sampling.z_value(confidence_level)
+    
+    with span('dau'):
+        dau = sample.events.groupby(sample.events['timestamp'].dt.date)['user_id'].nunique()
+    
+    with span('signups'):
+        signups = sample.users.groupby(sample.users['joined_at'].dt.date).size()
+    
+    with span('format'):
+        counts = pd.DataFrame({'dau': dau, 'signups': signups}).fillna(0).sort_index()
+        result = []
+        for date, row in counts.iterrows():
+            dau_estimate, dau_ci = sampling.estimate_count(int(row['dau']), sample.rate, z)
+            signups_estimate, signups_ci = sampling.estimate_count(int(row['signups']), sample.rate, z)
+            result.append({
+                'date': date.strftime('%Y-%m-%d'),
+                'dau': int(round(dau_estimate)),
+                'signups': int(round(signups_estimate)),
+                'dau_ci': sampling.rounded(dau_ci, 0),
+                'signups_ci': sampling.rounded(signups_ci, 0)
+            })
+    
+    with span('serialize'):
+        return jsonify(result)
 
+def _kpi_payload(df_dau, df_signups):
+    """Daily DAU and signups rows from per-day frames (date, dau) and (date, signups)"""
+    with span('merge'):
         # Merge on date
         # Use outer join to ensure we have all dates from both series
         df_merged = pd.merge(df_dau, df_signups, on='date', how='outer').fillna(0)
@@ -541,6 +2064,7 @@ def get_kpi_time_series():
         # Sort by date
         df_merged = df_merged.sort_values('date')
         
+    with span('format'):
         result = []
         for _, row in df_merged.iterrows():
             result.append({
@@ -549,13 +2073,44 @@ def get_kpi_time_series():
                 'signups': int(row['signups'])
             })
             
+    with span('serialize'):
         return jsonify(result)
+
+@app.route('/api/kpi-time-series', methods=['GET'])
+def get_kpi_time_series():
+    """Get KPI time series data (DAU, Signups)"""
+    snap = _snapshot()
+    sample, error = _sample_arg(snap)
+    if error:
+        return error
+    try:
+        if sample is not None:
+            return _approximate_kpi_time_series(sample, request.args.get('confidence_level', 0.95, type=float))
+        
+        stored = snap.summaries
+        if stored is not None:
+            df_dau = stored.daily_active.assign(date=pd.to_datetime(stored.daily_active['date']))
+            df_signups = stored.daily_signups.assign(date=pd.to_datetime(stored.daily_signups['date']))
+        else:
+            with span('dau'):
+                # Calculate Daily Active Users (DAU)
+                # Group events by date and count unique users
+                dau_series = snap.events.groupby(snap.events['timestamp'].dt.date.rename('date'))['user_id'].nunique()
+                df_dau = pd.DataFrame({'date': dau_series.index, 'dau': dau_series.values})
+                df_dau['date'] = pd.to_datetime(df_dau['date'])
+
+            with span('signups'):
+                # Calculate Signups per Day
+                signups_series = snap.users.groupby(snap.users['joined_at'].dt.date.rename('date')).size()
+                df_signups = pd.DataFrame({'date': signups_series.index, 'signups': signups_series.values})
+                df_signups['date'] = pd.to_datetime(df_signups['date'])
+        
+        return _kpi_payload(df_dau, df_signups)
     except Exception as e:
         print(f"Error calculating KPI time series: {e}")
         return jsonify({'error': str(e)}), 500
 
 
-# Load data on startup for Vercel
-load_data()
+# Data is loaded on the first request that needs it (see _load_data_on_first_use), not at import
 
 # No app.run() needed for Vercel; it imports 'app'
@@ -0,0 +1,207 @@
+"""Vectorized statistics for A/B experiments.
+
+Everything here works on NumPy arrays so that a whole experiment report
+(every metric x segment x variant comparison) is computed in a handful of
+array operations instead of one scalar ``NormalDist`` call per test.
+"""
+import numpy as np
+
+# Coefficients of Acklam's rational approximation of the normal quantile
+_PPF_A = (-3.969683028665376e+01, 2.209460984245205e+02, -2.759285104469687e+02,
+          1.383577518672690e+02, -3.066479806614716e+01, 2.506628277459239e+00)
+_PPF_B = (-5.447609879822406e+01, 1.615858368580409e+02, -1.556989798598866e+02,
+          6.680131188771972e+01, -1.328068155288572e+01)
+_PPF_C = (-7.784894002430293e-03, -3.223964580411365e-01, -2.400758277161838e+00,
+          -2.549732539343734e+00, 4.374664141464968e+00, 2.938163982698783e+00)
+_PPF_D = (7.784695709041462e-03, 3.224671290700398e-01, 2.445134137142996e+00,
+          3.754408661907416e+00)
+
+
+def _erfc(x):
+    """Complementary error function, fractional error < 1.2e-7 everywhere (Numerical Recipes erfcc)."""
+    x = np.asarray(x, dtype=np.float64)
+    z = np.abs(x)
+    t = 1.0 / (1.0 + 0.5 * z)
+    poly = -z * z - 1.26551223 + t * (1.00002368 + t * (0.37409196 + t * (0.09678418 + t * (
+        -0.18628806 + t * (0.27886807 + t * (-1.13520398 + t * (1.48851587 + t * (
+            -0.82215223 + t * 0.17087277))))))))
+    ans = t * np.exp(poly)
+    return np.where(x >= 0, ans, 2.0 - ans)
+
+
+def norm_cdf(x):
+    """Standard normal CDF."""
+    return 0.5 * _erfc(-np.asarray(x, dtype=np.float64) / np.sqrt(2.0))
+
+
+def norm_sf(x):
+    """Standard normal survival function (1 - cdf), accurate in the upper tail."""
+    return 0.5 * _erfc(np.asarray(x, dtype=np.float64) / np.sqrt(2.0))
+
+
+def norm_ppf(p):
+    """Standard normal quantile function (inverse CDF), relative error < 1.2e-9 (Acklam)."""
+    p = np.asarray(p, dtype=np.float64)
+    q = np.clip(p, 1e-300, 1 - 1e-16)
+    x = np.empty_like(q)
+
+    lower = q < 0.02425
+    upper = q > 1 - 0.02425
+    central = ~(lower | upper)
+
+    if central.any():
+        r = q[central] - 0.5
+        s = r * r
+        a, b = _PPF_A, _PPF_B
+        x[central] = ((((((a[0] * s + a[1]) * s + a[2]) * s + a[3]) * s + a[4]) * s + a[5]) * r /
+                      (((((b[0] * s + b[1]) * s + b[2]) * s + b[3]) * s + b[4]) * s + 1))
+    c, d = _PPF_C, _PPF_D
+    for mask, sign, tail in ((lower, 1.0, q), (upper, -1.0, 1 - q)):
+        if mask.any():
+            s = np.sqrt(-2 * np.log(tail[mask]))
+            x[mask] = sign * (((((c[0] * s + c[1]) * s + c[2]) * s + c[3]) * s + c[4]) * s + c[5]) / \
+                ((((d[0] * s + d[1]) * s + d[2]) * s + d[3]) * s + 1)
+
+    x = np.where(p <= 0, -np.inf, np.where(p >= 1, np.inf, x))
+    return x
+
+
+def two_proportion_tests(conv_c, n_c, conv_t, n_t, confidence_level=0.95):
+    """Pooled two-proportion z-tests of treatment vs control, element-wise over arrays.
+
+    Returns a dict of arrays: control/treatment rates, absolute difference with
+    an unpooled confidence interval, relative lift with a log-ratio (delta
+    method) interval, z score and two-sided p-value. Tests without users on
+    either side get NaN statistics.
+    """
+    conv_c, n_c, conv_t, n_t = (np.asarray(a, dtype=np.float64) for a in (conv_c, n_c, conv_t, n_t))
+    z_crit = norm_ppf(0.5 + np.asarray(confidence_level, dtype=np.float64) / 2)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        p_c = conv_c / n_c
+        p_t = conv_t / n_t
+        diff = p_t - p_c
+
+        p_pool = (conv_c + conv_t) / (n_c + n_t)
+        se_pool = np.sqrt(p_pool * (1 - p_pool) * (1 / n_c + 1 / n_t))
+        z = np.where(se_pool > 0, diff / se_pool, 0.0)
+        p_value = np.where(se_pool > 0, 2 * norm_sf(np.abs(z)), 1.0)
+
+        se_diff = np.sqrt(p_c * (1 - p_c) / n_c + p_t * (1 - p_t) / n_t)
+        diff_low = diff - z_crit * se_diff
+        diff_high = diff + z_crit * se_diff
+
+        lift = p_t / p_c - 1
+        se_log = np.sqrt((1 - p_t) / conv_t + (1 - p_c) / conv_c)
+        log_ratio = np.log(p_t / p_c)
+        lift_low = np.exp(log_ratio - z_crit * se_log) - 1
+        lift_high = np.exp(log_ratio + z_crit * se_log) - 1
+
+    invalid = (n_c <= 0) | (n_t <= 0)
+    for arr in (z, p_value):
+        arr[invalid] = np.nan
+    no_lift = invalid | (conv_c <= 0) | (conv_t <= 0)
+    for arr in (lift, lift_low, lift_high):
+        arr[no_lift] = np.nan
+
+    return {
+        'control_rate': p_c,
+        'variant_rate': p_t,
+        'diff': diff,
+        'diff_low': diff_low,
+        'diff_high': diff_high,
+        'lift': lift,
+        'lift_low': lift_low,
+        'lift_high': lift_high,
+        'z_score': z,
+        'p_value': p_value,
+    }
+
+
+def holm_adjust(p_values):
+    """Holm-Bonferroni step-down adjusted p-values (NaNs are left out of the family)."""
+    return _adjust(p_values, 'holm')
+
+
+def bh_adjust(p_values):
+    """Benjamini-Hochberg false-discovery-rate adjusted p-values (NaNs are left out of the family)."""
+    return _adjust(p_values, 'bh')
+
+
+def _adjust(p_values, method):
+    p = np.asarray(p_values, dtype=np.float64)
+    adjusted = np.full_like(p, np.nan)
+    valid = ~np.isnan(p)
+    m = int(valid.sum())
+    if m == 0:
+        return adjusted
+
+    pv = p[valid]
+    order = np.argsort(pv, kind='stable')
+    ranked = pv[order]
+    ranks = np.arange(1, m + 1)
+
+    if method == 'holm':
+        stepped = np.maximum.accumulate((m - ranks + 1) * ranked)
+    else:
+        stepped = np.minimum.accumulate((m / ranks * ranked)[::-1])[::-1]
+
+    result = np.empty(m)
+    result[order] = np.minimum(stepped, 1.0)
+    adjusted[valid] = result
+    return adjusted
+
+
+CORRECTIONS = {
+    'holm': holm_adjust,
+    'bh': bh_adjust,
+    'none': lambda p: np.asarray(p, dtype=np.float64).copy(),
+}
+
+
+def group_conversion_counts(group_codes, num_groups, reached):
+    """Users and converted users per group, for every metric column, in one bincount.
+
+    group_codes: int array (one entry per user row, -1 to skip)
+    reached: bool matrix rows x metrics
+    Returns (users[num_groups], conversions[num_groups, metrics]).
+    """
+    group_codes = np.asarray(group_codes)
+    num_metrics = reached.shape[1]
+    keep = group_codes >= 0
+    codes = group_codes[keep]
+    users = np.bincount(codes, minlength=num_groups)
+
+    flat = (codes[:, None] * num_metrics + np.arange(num_metrics))[reached[keep]]
+    conversions = np.bincount(flat, minlength=num_groups * num_metrics).reshape(num_groups, num_metrics)
+    return users, conversions
+
+
+def power_grid(n, baseline, mde, confidence_level, target_power=0.8, relative=True):
+    """Power and required sample size over a full parameter grid, by broadcasting.
+
+    Uses the same two-sided test on Cohen's h as the single-point calculation in
+    ``/api/ab-test``: power = Phi(|h| sqrt(n / 2) - z_{1 - alpha/2}) with n users
+    per variant, and required n = 2 ((z_{1 - alpha/2} + z_power) / h)^2.
+
+    Returns (power[confidence, baseline, mde, n], required_n[confidence, baseline, mde]);
+    cells whose treatment rate falls outside (0, 1) are NaN.
+    """
+    n = np.asarray(n, dtype=np.float64)
+    cl = np.asarray(confidence_level, dtype=np.float64)[:, None, None]
+    p_a = np.asarray(baseline, dtype=np.float64)[None, :, None]
+    effect = np.asarray(mde, dtype=np.float64)[None, None, :]
+    p_b = p_a * (1 + effect) if relative else p_a + effect
+
+    valid = (p_a > 0) & (p_a < 1) & (p_b > 0) & (p_b < 1)
+    with np.errstate(invalid='ignore'):
+        h = np.abs(2 * (np.arcsin(np.sqrt(p_b)) - np.arcsin(np.sqrt(p_a))))
+    h = np.where(valid, h, np.nan)
+
+    z_alpha = norm_ppf(1 - (1 - cl) / 2)
+    power = norm_cdf(h[..., None] * np.sqrt(n / 2) - z_alpha[..., None])
+
+    with np.errstate(divide='ignore'):
+        # h == 0 (no effect) needs infinitely many users
+        required = np.ceil(2 * ((z_alpha + norm_ppf(target_power)) / h) ** 2)
+    return power, required
@@ -0,0 +1,308 @@
+"""Endpoint benchmark suite for the VizSprints API.
+
+Generates synthetic datasets at several scales, times every analytics route
+(one cold call plus several warm calls), measures peak Python memory per call
+and writes a JSON report. When a baseline file is present the run fails if any
+route got slower (or hungrier) than the baseline by more than the allowed
+margin.
+
+Usage:
+    cd backend
+    python benchmarks/bench_endpoints.py --scales 10k,1m
+    python benchmarks/bench_endpoints.py --scales 10k --update-baseline
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# Add backend directory to path
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BACKEND_DIR)
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, 'baseline.json')
+
+ROUTES = [
+    '/api/metrics',
+    '/api/funnel',
+    '/api/cohorts',
+    '/api/ab-test',
+    '/api/user-sessions',
+    '/api/kpi-time-series',
+    '/api/events',
+    '/api/users',
+]
+
+SCALES = {
+    '10k': 10_000,
+    '100k': 100_000,
+    '1m': 1_000_000,
+    '10m': 10_000_000,
+}
+
+# Same vocabulary and weights as generate_data.py
+DEVICES = ['Mobile', 'Desktop', 'Tablet']
+DEVICE_WEIGHTS = [0.6, 0.3, 0.1]
+COUNTRIES = ['US', 'IN', 'UK', 'CA', 'AU', 'DE', 'FR', 'JP', 'BR', 'SG']
+COUNTRY_WEIGHTS = [0.3, 0.2, 0.1, 0.08, 0.07, 0.06, 0.05, 0.05, 0.05, 0.04]
+SUBSCRIPTION_STATUS = ['Free', 'Premium', 'Enterprise']
+SUBSCRIPTION_WEIGHTS = [0.7, 0.25, 0.05]
+EVENT_TYPES = [
+    'signup_success', 'view_dashboard', 'start_project', 'complete_task', 'invite_user',
+    'upgrade_subscription', 'export_data', 'share_report', 'create_chart', 'delete_project'
+]
+START_DATE = np.datetime64('2023-01-01T00:00:00')
+END_DATE = np.datetime64('2024-01-01T00:00:00')
+
+# Average events per user in the shipped sample data
+EVENTS_PER_USER = 16
+
+
+def generate_dataset(num_events, seed=42):
+    """Generate users/events DataFrames shaped like the output of generate_data.py.
+
+    Vectorized so that the 10M-event scale can be produced in seconds rather
+    than the hours the row-by-row generator would need.
+    """
+    rng = np.random.default_rng(seed)
+    num_users = max(10, num_events // EVENTS_PER_USER)
+
+    span_seconds = int((END_DATE - START_DATE) / np.timedelta64(1, 's'))
+    join_offsets = rng.integers(0, span_seconds - 7 * 86400, size=num_users)
+    joined_at = START_DATE + join_offsets.astype('timedelta64[s]')
+
+    users_df = pd.DataFrame({
+        'user_id': np.array([f"u_{i:07d}" for i in range(1, num_users + 1)], dtype=object),
+        # UTC, as load_data() reads them
+        'joined_at': pd.to_datetime(joined_at, utc=True),
+        'device': np.array(DEVICES, dtype=object)[rng.choice(3, num_users, p=DEVICE_WEIGHTS)],
+        'country': np.array(COUNTRIES, dtype=object)[rng.choice(10, num_users, p=COUNTRY_WEIGHTS)],
+        'subscription_status': np.array(SUBSCRIPTION_STATUS, dtype=object)[
+            rng.choice(3, num_users, p=SUBSCRIPTION_WEIGHTS)],
+        'ab_variant': np.array(['A', 'B'], dtype=object)[rng.integers(0, 2, num_users)],
+    })
+
+    # Every user signs up; the remaining events go to users with a skewed
+    # engagement distribution (a few heavy users, many light ones).
+    extra = max(0, num_events - num_users)
+    engagement = rng.lognormal(mean=0.0, sigma=1.0, size=num_users)
+    owners = rng.choice(num_users, size=extra, p=engagement / engagement.sum())
+    user_idx = np.concatenate([np.arange(num_users), owners])
+
+    # Funnel events are more common than the long tail of feature events
+    name_weights = np.array([0, 0.2, 0.15, 0.12, 0.08, 0.05, 0.1, 0.1, 0.12, 0.08])
+    name_idx = np.concatenate([
+        np.zeros(num_users, dtype=np.int64),
+        rng.choice(len(EVENT_TYPES), size=extra, p=name_weights / name_weights.sum()),
+    ])
+
+    remaining = span_seconds - join_offsets[user_idx]
+    offsets = np.concatenate([
+        rng.integers(0, 300, size=num_users),
+        (rng.random(extra) * remaining[num_users:]).astype(np.int64),
+    ])
+    timestamps = joined_at[user_idx] + offsets.astype('timedelta64[s]')
+
+    order = np.argsort(timestamps, kind='stable')
+    n = len(order)
+    events_df = pd.DataFrame({
+        'event_id': np.array([f"e_{i}" for i in range(1, n + 1)], dtype=object),
+        'user_id': users_df['user_id'].to_numpy()[user_idx[order]],
+        'event_name': np.array(EVENT_TYPES, dtype=object)[name_idx[order]],
+        'timestamp': pd.to_datetime(timestamps[order], utc=True),
+        'metadata': np.array(['{"variant": "A"}', '{"variant": "B"}'], dtype=object)[
+            rng.integers(0, 2, n)],
+    })
+    return users_df, events_df
+
+
+def install_dataset(app_module, users_df, events_df):
+    """Swap a dataset into the running app, exactly as load_data() would."""
+    app_module.users_df = users_df
+    app_module.events_df = events_df
+
+
+def _call(client, route):
+    # Collect garbage left by the previous call so it is not billed to this one
+    gc.collect()
+    start = time.perf_counter()
+    response = client.get(route)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    if response.status_code != 200:
+        raise RuntimeError(f"{route} returned {response.status_code}: {response.get_data(as_text=True)[:200]}")
+    return elapsed_ms
+
+
+def _peak_memory_mb(client, route):
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        _call(client, route)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / (1024 * 1024)
+
+
+def bench_scale(app_module, num_events, routes, warm_runs, seed=42):
+    """Benchmark every route against one generated dataset."""
+    gen_start = time.perf_counter()
+    users_df, events_df = generate_dataset(num_events, seed=seed)
+    generate_s = time.perf_counter() - gen_start
+
+    client = app_module.app.test_client()
+    results = {}
+    for route in routes:
+        # Fresh (shallow-copied) frames so nothing computed by a previous
+        # route or run can be reused: the first call is genuinely cold.
+        install_dataset(app_module, users_df.copy(deep=False), events_df.copy(deep=False))
+        cold_ms = _call(client, route)
+        warm = [_call(client, route) for _ in range(warm_runs)]
+
+        install_dataset(app_module, users_df.copy(deep=False), events_df.copy(deep=False))
+        peak_mb = _peak_memory_mb(client, route)
+
+        results[route] = {
+            'cold_ms': round(cold_ms, 3),
+            'warm_median_ms': round(statistics.median(warm), 3) if warm else None,
+            'warm_min_ms': round(min(warm), 3) if warm else None,
+            'peak_mem_mb': round(peak_mb, 3),
+        }
+        print(f"  {route:<24} cold {cold_ms:10.1f} ms | warm {results[route]['warm_median_ms']:10.1f} ms"
+              f" | peak {peak_mb:8.1f} MB")
+
+    return {
+        'num_users': int(len(users_df)),
+        'num_events': int(len(events_df)),
+        'generate_s': round(generate_s, 3),
+        'routes': results,
+    }
+
+
+def compare_to_baseline(report, baseline, margin, min_delta_ms=25.0, min_delta_mb=1.0):
+    """Return a list of human-readable regressions of report against baseline.
+
+    A metric regresses when it exceeds baseline * (1 + margin) *and* the
+    absolute difference is above the noise floor (min_delta_ms / min_delta_mb),
+    so sub-millisecond jitter on tiny datasets does not fail the build.
+    Scales or routes missing from the baseline are ignored.
+    """
+    regressions = []
+    for scale, scale_result in report.get('scales', {}).items():
+        base_scale = baseline.get('scales', {}).get(scale)
+        if not base_scale:
+            continue
+        for route, metrics in scale_result['routes'].items():
+            base_metrics = base_scale['routes'].get(route)
+            if not base_metrics:
+                continue
+            for key, floor in (('cold_ms', min_delta_ms),
+                               ('warm_median_ms', min_delta_ms),
+                               ('peak_mem_mb', min_delta_mb)):
+                current = metrics.get(key)
+                reference = base_metrics.get(key)
+                if current is None or reference is None:
+                    continue
+                limit = reference * (1 + margin)
+                if current > limit and current - reference > floor:
+                    regressions.append(
+                        f"[{scale}] {route} {key}: {current:.2f} > {reference:.2f} (+{margin:.0%} allowed)"
+                    )
+    return regressions
+
+
+def parse_scales(value):
+    scales = {}
+    for name in value.split(','):
+        name = name.strip().lower()
+        if not name:
+            continue
+        if name in SCALES:
+            scales[name] = SCALES[name]
+        elif name.isdigit():
+            scales[name] = int(name)
+        else:
+            raise argparse.ArgumentTypeError(f"Unknown scale '{name}' (use {', '.join(SCALES)} or a number)")
+    return scales
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark VizSprints API routes")
+    parser.add_argument('--scales', type=parse_scales, default=parse_scales('10k,1m,10m'),
+                        help="Comma separated dataset sizes in events (10k, 100k, 1m, 10m or a number)")
+    parser.add_argument('--routes', default=','.join(ROUTES),
+                        help="Comma separated routes to benchmark")
+    parser.add_argument('--warm-runs', type=int, default=5, help="Warm calls per route")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='bench_report.json', help="Where to write the JSON report")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="Baseline report to compare against")
+    parser.add_argument('--margin', type=float, default=float(os.environ.get('BENCH_MARGIN', 0.5)),
+                        help="Allowed relative slowdown over the baseline (0.5 = +50%%)")
+    parser.add_argument('--min-delta-ms', type=float, default=25.0,
+                        help="Ignore timing regressions smaller than this many milliseconds")
+    parser.add_argument('--update-baseline', action='store_true',
+                        help="Write this run's results to the baseline file instead of comparing")
+    args = parser.parse_args(argv)
+
+    import app as app_module
+
+    routes = [r.strip() for r in args.routes.split(',') if r.strip()]
+    report = {
+        'generated_at': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'warm_runs': args.warm_runs,
+        'scales': {},
+    }
+
+    for name, num_events in args.scales.items():
+        print(f"Scale {name} ({num_events} events)")
+        report['scales'][name] = bench_scale(app_module, num_events, routes, args.warm_runs, seed=args.seed)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.output}")
+
+    if args.update_baseline:
+        baseline = {'scales': {}}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, 'r', encoding='utf-8') as f:
+                baseline = json.load(f)
+        baseline.update({k: v for k, v in report.items() if k != 'scales'})
+        baseline.setdefault('scales', {}).update(report['scales'])
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, indent=2)
+        print(f"Baseline updated at {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("No baseline found, skipping regression check")
+        return 0
+
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    regressions = compare_to_baseline(report, baseline, args.margin, min_delta_ms=args.min_delta_ms)
+    if regressions:
+        print(f"{len(regressions)} regression(s) against {args.baseline}:")
+        for line in regressions:
+            print(f" - {line}")
+        return 1
+
+    print("No regressions against baseline")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,103 @@
+"""Cold-start report: import-time breakdown of the API and first-request latency per route.
+
+Each route is measured in a fresh interpreter started with ``-X importtime``,
+so the numbers are what a serverless cold start pays: importing the app,
+then answering one request (which may import pandas and load the data).
+
+Usage:
+    cd backend
+    python benchmarks/import_times.py
+    python benchmarks/import_times.py --routes /api/health,/api/funnel --top 15 --json cold_start.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_ROUTES = ['/api/health', '/metrics', '/api/metrics', '/api/funnel', '/api/cohorts']
+
+# Modules a light route should not need
+HEAVY_MODULES = ['pandas', 'numpy', 'statistics']
+
+# Run in the child: import the app, answer one request, report timings as JSON on stdout
+_CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+response = app.app.test_client().get({route!r})
+done = time.perf_counter()
+print(json.dumps({{
+    'status': response.status_code,
+    'import_ms': (imported - start) * 1000,
+    'request_ms': (done - imported) * 1000,
+    'heavy_loaded': [m for m in {heavy!r} if m in sys.modules],
+}}))
+"""
+
+
+def parse_importtime(text):
+    """Rows of `-X importtime` output as dicts: module, self_us, cumulative_us, depth."""
+    rows = []
+    for line in text.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append({
+            'module': name.strip(),
+            'self_us': int(self_us),
+            'cumulative_us': int(cumulative_us),
+            'depth': (len(name) - len(name.lstrip())) // 2,
+        })
+    return rows
+
+
+def by_package(rows):
+    """Self import time summed per top-level package, largest first."""
+    totals = defaultdict(int)
+    for row in rows:
+        totals[row['module'].split('.')[0]] += row['self_us']
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)
+
+
+def measure(route):
+    """Cold-start figures for one route, from a fresh interpreter."""
+    child = _CHILD.format(route=route, heavy=HEAVY_MODULES)
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', child], cwd=BACKEND_DIR,
+                            capture_output=True, text=True, check=True)
+    figures = json.loads(result.stdout.strip().splitlines()[-1])
+    rows = parse_importtime(result.stderr)
+    figures['route'] = route
+    figures['modules_imported'] = len(rows)
+    figures['packages'] = by_package(rows)
+    return figures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--routes', default=','.join(DEFAULT_ROUTES), help='comma-separated routes')
+    parser.add_argument('--top', type=int, default=10, help='packages listed per route')
+    parser.add_argument('--json', help='also write the report to this file')
+    args = parser.parse_args()
+
+    report = []
+    for route in args.routes.split(','):
+        figures = measure(route)
+        report.append(figures)
+        print(f"{route}: status {figures['status']} | import {figures['import_ms']:.0f} ms | "
+              f"first request {figures['request_ms']:.0f} ms | {figures['modules_imported']} modules | "
+              f"heavy: {', '.join(figures['heavy_loaded']) or 'none'}")
+        for package, self_us in figures['packages'][:args.top]:
+            print(f"    {package:<24} {self_us / 1000:8.1f} ms")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""Render the default dashboard responses to static files at build time.
+
+Until the data changes, the dashboard's first-render requests have the same
+answer for every visitor, so they are computed once here and written to
+``frontend/dist/static-api`` as JSON plus a gzip-compressed copy (for hosts
+that serve pre-compressed files). The frontend requests these files in
+production builds (``frontend/src/api.js``). A missing file falls through
+``vercel.json`` to the API, which redirects it to the request it snapshots;
+every other request goes to the API as before.
+
+Run after the frontend build (which empties ``frontend/dist``):
+
+    python build_static.py
+"""
+import argparse
+import gzip
+import os
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OUTPUT_DIR = os.path.join(BASE_DIR, 'frontend', 'dist', 'static-api')
+
+# Static file (under static-api/, without .json) -> the API request it snapshots.
+# Keep in step with STATIC_RESPONSES in frontend/src/api.js.
+STATIC_RESPONSES = {
+    'metrics': '/api/metrics',
+    'funnel': '/api/funnel',
+    'kpi-time-series': '/api/kpi-time-series',
+    'cohorts': '/api/cohorts',
+    'user-sessions/total_hours': '/api/user-sessions?limit=50&sort_by=total_hours',
+    'user-sessions/total_sessions': '/api/user-sessions?limit=50&sort_by=total_sessions',
+    'user-sessions/last_activity': '/api/user-sessions?limit=50&sort_by=last_activity',
+    'ab-test': '/api/ab-test?confidence_level=0.95',
+}
+
+
+def build(output_dir=OUTPUT_DIR, responses=STATIC_RESPONSES):
+    """Write every response to output_dir; returns the paths written."""
+    # Imported here: loading the app reads the whole database
+    from app import app
+    client = app.test_client()
+    written = []
+    for name, url in responses.items():
+        start = time.perf_counter()
+        response = client.get(url)
+        if response.status_code != 200:
+            raise RuntimeError(f"{url} returned {response.status_code}: {response.get_data(as_text=True)[:200]}")
+        body = response.get_data()
+
+        path = os.path.join(output_dir, name + '.json')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(body)
+        # mtime=0 keeps the compressed bytes identical across builds of the same data
+        with open(path + '.gz', 'wb') as f:
+            f.write(gzip.compress(body, compresslevel=9, mtime=0))
+        written.append(path)
+        print(f" - {url} -> static-api/{name}.json ({len(body):,} bytes, "
+              f"{os.path.getsize(path + '.gz'):,} gzipped) in {(time.perf_counter() - start) * 1000:.0f} ms")
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Pre-render default API responses into the frontend build')
+    parser.add_argument('--output', default=OUTPUT_DIR, help='directory to write the static responses to')
+    args = parser.parse_args()
+    print(f"Rendering static responses to {args.output}...")
+    print(f"Wrote {len(build(args.output))} static responses")
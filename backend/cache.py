@@ -0,0 +1,142 @@
+"""In-process caches for results derived from the loaded DataFrames.
+
+An entry is only valid while the frames it was computed from are still the
+ones the app is serving: entries remember their source objects by weak
+reference and are recomputed as soon as ``load_data()`` (or a test) swaps in
+new frames. Entries of different sources (the datasets of datasets.py) are
+kept side by side under the same key. Hit/miss counters feed the
+``/metrics`` endpoint.
+
+Structures built once per load (cube, samples, indexes) go in a
+``SnapshotCache`` instead: they are stored on the snapshot itself and live
+exactly as long as it does, so a stream of requests with varied parameters
+filling the bounded ``DerivedCache`` never evicts them.
+"""
+import threading
+import weakref
+from collections import OrderedDict
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+class DerivedCache:
+    """Small LRU of values computed from a set of source objects."""
+
+    def __init__(self, name, maxsize=32):
+        self.name = name
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        # hits/misses per kind of result (the key, or its first element)
+        self.kind_counts = {}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry[name] = self
+
+    def get_or_compute(self, key, sources, compute):
+        """Return the cached value for key, computing it if the sources changed."""
+        kind = key[0] if isinstance(key, tuple) else key
+        slot = (key, tuple(id(s) for s in sources))
+        with self._lock:
+            counts = self.kind_counts.setdefault(kind, [0, 0])
+            entry = self._entries.get(slot)
+            if entry is not None and _same_sources(entry[0], sources):
+                self._entries.move_to_end(slot)
+                self.hits += 1
+                counts[0] += 1
+                return entry[1]
+            self.misses += 1
+            counts[1] += 1
+
+        value = compute()
+
+        with self._lock:
+            self._entries[slot] = ([_ref(s) for s in sources], value)
+            self._entries.move_to_end(slot)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return value
+
+    def discard(self, sources):
+        """Drop every entry computed from sources (e.g. frames that are no longer served)."""
+        with self._lock:
+            for slot in [slot for slot, (refs, _) in self._entries.items() if _same_sources(refs, sources)]:
+                del self._entries[slot]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def hit_ratio(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SnapshotCache(DerivedCache):
+    """Values computed once per snapshot (snapshot.py), kept on it: never evicted, dropped with it."""
+
+    def __init__(self, name):
+        super().__init__(name, maxsize=None)
+        # Snapshots holding entries, for the entry count
+        self._snapshots = weakref.WeakSet()
+
+    def get_or_compute(self, key, snap, compute):
+        """Return the value cached on snap for key, computing it on first use."""
+        kind = key[0] if isinstance(key, tuple) else key
+        with self._lock:
+            counts = self.kind_counts.setdefault(kind, [0, 0])
+            if key in snap.derived:
+                self.hits += 1
+                counts[0] += 1
+                return snap.derived[key]
+            self.misses += 1
+            counts[1] += 1
+
+        value = compute()
+
+        with self._lock:
+            snap.derived[key] = value
+            self._snapshots.add(snap)
+        return value
+
+    def discard(self, sources):
+        # Entries go with their snapshot
+        pass
+
+    def clear(self):
+        with self._lock:
+            for snap in list(self._snapshots):
+                snap.derived.clear()
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(snap.derived) for snap in self._snapshots)
+
+
+def _ref(obj):
+    try:
+        return weakref.ref(obj)
+    except TypeError:
+        # Not weak-referenceable (e.g. None): hold it directly
+        return lambda obj=obj: obj
+
+
+def _same_sources(refs, sources):
+    if len(refs) != len(sources):
+        return False
+    return all(ref() is source for ref, source in zip(refs, sources))
+
+
+def all_caches():
+    with _registry_lock:
+        return dict(_registry)
+
+
+def clear_all():
+    for cache in all_caches().values():
+        cache.clear()
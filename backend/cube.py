@@ -0,0 +1,231 @@
+"""Pre-aggregated event cube over day x event_name x user attributes.
+
+Every dashboard count grouped by day, event name, country, device,
+subscription status or A/B variant can be answered from a few small
+pre-aggregated tables ("cuboids") instead of the raw events:
+
+=============  ==============================================  ==============
+cuboid         dimensions                                      distinct users
+=============  ==============================================  ==============
+day_event      day, event_name, country, device, subscription  per day & event
+day            day, <user attributes>                          per day
+event          event_name, <user attributes>                   per event
+all            <user attributes>                               overall
+=============  ==============================================  ==============
+
+Event counts add up across any cells. Distinct users add up across the user
+attributes (each user has exactly one value of each), but not across days or
+event names, which is why each combination of those two keeps its own
+cuboid. A query that would need to add distinct users across several days or
+event names falls back to scanning the raw events.
+"""
+import numpy as np
+import pandas as pd
+
+from retention import epoch_days
+
+USER_DIMENSIONS = ['country', 'device', 'subscription_status', 'ab_variant']
+DIMENSIONS = ['day', 'event_name'] + USER_DIMENSIONS
+MEASURES = ['events', 'users']
+
+CUBOIDS = {
+    'day_event': ['day', 'event_name'],
+    'day': ['day'],
+    'event': ['event_name'],
+    'all': [],
+}
+
+TABLE_PREFIX = 'cube_'
+META_TABLE = 'cube_meta'
+
+
+def event_facts(users, events):
+    """One row per event (of a known user) with its day, name, user row and the user's attributes."""
+    rows = pd.Index(users['user_id']).get_indexer(events['user_id'])
+    keep = rows >= 0
+    rows = rows[keep]
+    facts = pd.DataFrame({
+        'user': rows,
+        'day': epoch_days(events['timestamp'])[keep],
+        'event_name': events['event_name'].to_numpy()[keep],
+    })
+    for dimension in USER_DIMENSIONS:
+        facts[dimension] = users[dimension].astype(str).to_numpy()[rows]
+    return facts
+
+
+def _aggregate(facts, dims):
+    """Events and distinct users per cell of dims + user attributes."""
+    keys = dims + USER_DIMENSIONS
+    if not len(facts):
+        return pd.DataFrame(columns=keys + MEASURES)
+    events = facts.groupby(keys, sort=False).size().rename('events')
+    users = facts.drop_duplicates(keys + ['user']).groupby(keys, sort=False).size().rename('users')
+    return pd.concat([events, users], axis=1).reset_index()
+
+
+def version_of(count, latest):
+    """Data version of `count` events whose latest timestamp is `latest` (None if empty)."""
+    return {'events': int(count), 'max_timestamp': None if latest is None else str(latest)}
+
+
+def data_version(events):
+    """What the cube was built from: row count and latest timestamp."""
+    return version_of(len(events), events['timestamp'].max() if len(events) else None)
+
+
+class Cube:
+    """The cuboids of one data version, queryable with group-by and filters."""
+
+    def __init__(self, tables, version):
+        self.tables = tables
+        self.version = version
+        # Distinct (user, day, event) keys per cuboid and stable event codes, built on first ingest
+        self._seen = None
+        self._event_codes = {}
+
+    @classmethod
+    def build(cls, users, events):
+        facts = event_facts(users, events)
+        return cls({name: _aggregate(facts, dims) for name, dims in CUBOIDS.items()}, data_version(events))
+
+    # --- Persistence -----------------------------------------------------
+
+    def save(self, conn):
+        """Write every cuboid (and the data version it matches) to SQLite tables."""
+        for name, table in self.tables.items():
+            out = table.copy()
+            if 'day' in out:
+                out['day'] = pd.to_datetime(out['day'], unit='D').dt.strftime('%Y-%m-%d')
+            out.to_sql(TABLE_PREFIX + name, conn, if_exists='replace', index=False)
+        pd.DataFrame([self.version]).to_sql(META_TABLE, conn, if_exists='replace', index=False)
+
+    @classmethod
+    def load(cls, conn, version):
+        """The persisted cube if it was built from data of this version (see data_version), else None."""
+        try:
+            stored = pd.read_sql_query(f"SELECT * FROM {META_TABLE}", conn).iloc[0].to_dict()
+        except Exception:
+            return None
+        if int(stored['events']) != version['events'] or stored['max_timestamp'] != version['max_timestamp']:
+            return None
+
+        tables = {}
+        for name, dims in CUBOIDS.items():
+            table = pd.read_sql_query(f"SELECT * FROM {TABLE_PREFIX}{name}", conn)
+            if 'day' in table:
+                table['day'] = epoch_days(pd.to_datetime(table['day'], utc=True))
+            tables[name] = table
+        return cls(tables, version)
+
+    # --- Incremental maintenance ----------------------------------------
+
+    def copy(self):
+        """A cube to ingest into while readers keep using this one (ingest replaces tables, never edits them)."""
+        other = Cube(dict(self.tables), self.version)
+        other._seen = None if self._seen is None else dict(self._seen)
+        other._event_codes = dict(self._event_codes)
+        return other
+
+    def _keys(self, facts, dims):
+        """int64 key per fact of (user, day?, event?) for distinct-user bookkeeping."""
+        key = facts['user'].to_numpy(dtype=np.int64)
+        if 'day' in dims:
+            key = key * 65536 + (facts['day'].to_numpy() & 0xFFFF)
+        if 'event_name' in dims:
+            for name in facts['event_name'].unique():
+                self._event_codes.setdefault(name, len(self._event_codes))
+            key = key * 65536 + facts['event_name'].map(self._event_codes).to_numpy(dtype=np.int64)
+        return key
+
+    def ingest(self, users, events, start, history=None):
+        """Fold events[start:] (newly appended rows) into the cuboids.
+
+        Distinct users need the (user, day, event_name) facts of the earlier
+        events. By default they come from events[:start] and are kept for the
+        next call; callers that do not hold the earlier events pass them as
+        ``history``, which must cover at least the users in the new rows.
+        """
+        if history is not None:
+            seen_all = {name: np.unique(self._keys(history, dims)) for name, dims in CUBOIDS.items()}
+        else:
+            if self._seen is None:
+                old = event_facts(users, events.iloc[:start])
+                self._seen = {name: np.unique(self._keys(old, dims)) for name, dims in CUBOIDS.items()}
+            seen_all = self._seen
+
+        new = event_facts(users, events.iloc[start:])
+        for name, dims in CUBOIDS.items():
+            keys = self._keys(new, dims)
+            # A user is new to a cell on the first occurrence of a key not seen before
+            unique_keys, first = np.unique(keys, return_index=True)
+            seen = seen_all[name]
+            fresh = ~np.isin(unique_keys, seen, assume_unique=True)
+            counted = np.zeros(len(new), dtype=np.int64)
+            counted[first[fresh]] = 1
+            seen_all[name] = np.union1d(seen, unique_keys[fresh])
+
+            group = dims + USER_DIMENSIONS
+            delta = new.assign(events=1, users=counted).groupby(group, sort=False)[MEASURES].sum()
+            table = self.tables[name].set_index(group)[MEASURES]
+            self.tables[name] = table.add(delta, fill_value=0).astype(np.int64).reset_index()
+        self.version = data_version(events)
+
+    # --- Queries ------------------------------------------------------------
+
+    def plan(self, group_by, filters, day_range, measures):
+        """Cuboid that answers the query exactly, or None when only a raw scan can.
+
+        filters: {dimension: [values]} over event_name and user attributes;
+        day_range: (first_day, last_day) in epoch days, either may be None.
+        """
+        first, last = day_range
+        needs_day = 'day' in group_by or first is not None or last is not None
+        needs_event = 'event_name' in group_by or 'event_name' in filters
+        name = {(True, True): 'day_event', (True, False): 'day',
+                (False, True): 'event', (False, False): 'all'}[(needs_day, needs_event)]
+
+        if 'users' in measures:
+            # Distinct users cannot be summed over several days or event names
+            if needs_day and 'day' not in group_by and (first is None or first != last):
+                return None
+            if needs_event and 'event_name' not in group_by and len(filters['event_name']) != 1:
+                return None
+        return name
+
+    def query(self, name, group_by, filters, day_range, measures):
+        return _group(self.tables[name], group_by, filters, day_range,
+                      {measure: (measure, 'sum') for measure in measures})
+
+
+def _select(table, filters, day_range):
+    mask = np.ones(len(table), dtype=bool)
+    for dimension, values in filters.items():
+        mask &= table[dimension].isin(values).to_numpy()
+    first, last = day_range
+    if first is not None:
+        mask &= table['day'].to_numpy() >= first
+    if last is not None:
+        mask &= table['day'].to_numpy() <= last
+    return table[mask]
+
+
+def _group(table, group_by, filters, day_range, aggregations):
+    """Filter then group; aggregations maps each output measure to (column, function)."""
+    selected = _select(table, filters, day_range)
+    if not group_by:
+        selected = selected.assign(_all=0)
+        group_by = ['_all']
+    result = selected.groupby(group_by, sort=True).agg(**aggregations).reset_index()
+    if group_by == ['_all']:
+        result = result.drop(columns='_all')
+        if not len(result):
+            result = pd.DataFrame([{measure: 0 for measure in aggregations}])
+    return result.astype({measure: np.int64 for measure in aggregations})
+
+
+def raw_query(users, events, group_by, filters, day_range, measures):
+    """The same group-by computed by scanning the raw events."""
+    functions = {'events': ('user', 'size'), 'users': ('user', 'nunique')}
+    return _group(event_facts(users, events), group_by, filters, day_range,
+                  {measure: functions[measure] for measure in measures})
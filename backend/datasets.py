@@ -0,0 +1,180 @@
+"""Several databases served by one process.
+
+The default dataset is ``backend/database/vizsprints.db``. Every other
+``<name>.db`` in ``backend/database/datasets/`` (``VIZSPRINTS_DATASETS_DIR``
+points elsewhere), built with ``init_db.py --db``, is served as the dataset
+``<name>``; API requests pick one with ``?dataset=<name>``.
+
+A dataset is read into memory the first time a request asks for it, in the
+same form as the default one (time-sorted frames, event metadata left on
+disk in month partitions). Loaded datasets share a memory budget
+(``VIZSPRINTS_DATASET_BUDGET_MB``): once a load takes their total resident
+size over it, the least recently used other datasets are dropped, and are
+loaded again by their next request. Requests already working on a dropped
+dataset finish with the snapshot they hold. A dataset being loaded or
+refreshed cannot be dropped, and a dataset bigger than the whole budget does
+not push the others out: either way the datasets stay over budget until a
+later load, and ``/api/debug/datasets`` reports by how much.
+"""
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT = 'default'
+
+DIR_ENV = 'VIZSPRINTS_DATASETS_DIR'
+DEFAULT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'database', 'datasets')
+
+BUDGET_ENV = 'VIZSPRINTS_DATASET_BUDGET_MB'
+DEFAULT_BUDGET_MB = 1024
+
+NAME_PATTERN = re.compile(r'^[A-Za-z0-9_-]+$')
+
+
+class Dataset:
+    """One database file and what is loaded from it (see app.load_data)."""
+
+    def __init__(self, name, db_file):
+        self.name = name
+        self.db_file = db_file
+        # Held by loads, refreshes and eviction; requests never take it
+        self.lock = threading.RLock()
+        # Read-only connections (sqlite_pool.py) and lazily read event metadata (partitions.py)
+        self.pool = None
+        self.event_store = None
+        # What the loaded frames hold: the database's load id and the last user_key / events rowid read
+        self.marks = {'load_id': None, 'user_key': 0, 'event_rowid': 0}
+        # The loaded data (snapshot.py), replaced on load / refresh, None while not resident
+        self.snapshot = None
+        self.nbytes = 0
+        self.loads = 0
+        self.evictions = 0
+        self.load_seconds = None
+        self.loaded_at = None
+        self.last_used = None
+
+    def info(self):
+        return {
+            'name': self.name,
+            'db_file': self.db_file,
+            'resident': self.snapshot is not None,
+            'bytes': self.nbytes,
+            'users': None if self.snapshot is None else int(len(self.snapshot.users)),
+            'events': None if self.snapshot is None else int(len(self.snapshot.events)),
+            'loads': self.loads,
+            'evictions': self.evictions,
+            'load_seconds': None if self.load_seconds is None else round(self.load_seconds, 3),
+            'loaded_at': self.loaded_at,
+            'last_used': self.last_used
+        }
+
+
+class Registry:
+    """The datasets on disk, and which of them are resident in least- to most-recently-used order."""
+
+    def __init__(self, default_file, directory=DEFAULT_DIR, budget_bytes=DEFAULT_BUDGET_MB * 1024 * 1024):
+        # Callable: the default database path can change at run time (tests point it elsewhere)
+        self.default_file = default_file
+        self.directory = directory
+        self.budget_bytes = budget_bytes
+        self.lock = threading.Lock()
+        self._datasets = {}
+        self._resident = OrderedDict()
+        # Evictions given up because the dataset was busy
+        self.skipped_evictions = 0
+
+    def names(self):
+        """Every dataset that can be served, the default first."""
+        found = []
+        if os.path.isdir(self.directory):
+            found = sorted(f[:-3] for f in os.listdir(self.directory)
+                           if f.endswith('.db') and NAME_PATTERN.match(f[:-3]) and f[:-3] != DEFAULT)
+        return [DEFAULT] + found
+
+    def get(self, name):
+        """The dataset called name; KeyError when there is no such database."""
+        if name == DEFAULT:
+            db_file = self.default_file()
+        else:
+            db_file = os.path.join(self.directory, f"{name}.db")
+            if not NAME_PATTERN.match(name) or not os.path.exists(db_file):
+                raise KeyError(name)
+        with self.lock:
+            dataset = self._datasets.get(name)
+            if dataset is None:
+                dataset = self._datasets[name] = Dataset(name, db_file)
+            dataset.db_file = db_file
+            return dataset
+
+    def touch(self, dataset):
+        """Mark a resident dataset as just used."""
+        with self.lock:
+            dataset.last_used = time.time()
+            if dataset.name in self._resident:
+                self._resident.move_to_end(dataset.name)
+
+    def admit(self, dataset, nbytes):
+        """Record a dataset as resident with nbytes in memory.
+
+        Returns the other resident datasets, least recently used first, to
+        evict (see evict) while over_budget(); none when this dataset alone
+        exceeds the budget, as dropping the others would not fit it.
+        """
+        with self.lock:
+            dataset.nbytes = nbytes
+            dataset.last_used = time.time()
+            self._resident[dataset.name] = dataset
+            self._resident.move_to_end(dataset.name)
+            if nbytes > self.budget_bytes:
+                return []
+            return [other for other in self._resident.values() if other is not dataset]
+
+    def over_budget(self):
+        """Bytes the resident datasets take beyond the budget (0 when within it)."""
+        with self.lock:
+            return max(0, sum(d.nbytes for d in self._resident.values()) - self.budget_bytes)
+
+    def evict(self, dataset):
+        """Drop a dataset's data and connections; returns its snapshot, or None when it was busy or not resident.
+
+        A dataset being loaded or refreshed right now is skipped: it will be
+        the most recently used one when that finishes.
+        """
+        if not dataset.lock.acquire(blocking=False):
+            with self.lock:
+                self.skipped_evictions += 1
+            return None
+        try:
+            with self.lock:
+                if self._resident.pop(dataset.name, None) is None:
+                    return None
+            dropped, dataset.snapshot = dataset.snapshot, None
+            if dataset.pool is not None:
+                dataset.pool.close()
+            dataset.pool = dataset.event_store = None
+            dataset.marks = {'load_id': None, 'user_key': 0, 'event_rowid': 0}
+            dataset.nbytes = 0
+            dataset.evictions += 1
+            return dropped
+        finally:
+            dataset.lock.release()
+
+    def stats(self):
+        with self.lock:
+            resident = sum(d.nbytes for d in self._resident.values())
+            known = dict(self._datasets)
+            skipped = self.skipped_evictions
+        datasets = []
+        for name in self.names():
+            dataset = known.get(name)
+            datasets.append(dataset.info() if dataset is not None else
+                            {'name': name, 'resident': False, 'loads': 0})
+        return {
+            'budget_bytes': self.budget_bytes,
+            'resident_bytes': resident,
+            'over_budget_bytes': max(0, resident - self.budget_bytes),
+            'skipped_evictions': skipped,
+            'datasets': datasets
+        }
@@ -0,0 +1,110 @@
+"""Events sorted by user and timestamp, shared by sequence analyses.
+
+Sorting the event table is the expensive part of any per-user sequence
+question (paths, sessions, ordered funnels). ``UserEventIndex`` does it once
+per data load and keeps the result as plain NumPy arrays: integer user and
+event-name codes, int64 nanosecond timestamps and session boundaries.
+
+The arrays are in CSR layout: ``offsets[u]:offsets[u + 1]`` is user u's run,
+so one user's events are a slice (a view, no copy) found by a binary search
+over the sorted user ids.
+"""
+import numpy as np
+import pandas as pd
+
+# Same inactivity timeout the user-sessions endpoint uses
+SESSION_TIMEOUT_NS = 30 * 60 * 10**9
+
+
+def timestamp_ns(timestamps):
+    """int64 nanoseconds since the epoch (UTC) for a datetime Series."""
+    return timestamps.values.astype('datetime64[ns]').view(np.int64)
+
+
+class UserEventIndex:
+    """Event table ordered by (user, timestamp), as arrays."""
+
+    def __init__(self, events, event_types, session_timeout_ns=SESSION_TIMEOUT_NS):
+        user_codes, self.user_ids = pd.factorize(events['user_id'], sort=True)
+        timestamps = timestamp_ns(events['timestamp'])
+
+        # Stable, so events with equal timestamps keep their table order
+        self.order = np.lexsort((timestamps, user_codes))
+        self.users = user_codes[self.order]
+        self.timestamps = timestamps[self.order]
+
+        extra = sorted(set(events['event_name'].unique()) - set(event_types))
+        self.event_names = list(event_types) + extra
+        self.events = pd.Categorical(events['event_name'], categories=self.event_names).codes[self.order]
+
+        n = len(self.order)
+        self.user_start = np.ones(n, dtype=bool)
+        self.user_start[1:] = self.users[1:] != self.users[:-1]
+        self.session_start = self.user_start.copy()
+        self.session_start[1:] |= np.diff(self.timestamps) > session_timeout_ns
+
+        self.offsets = np.searchsorted(self.users, np.arange(len(self.user_ids) + 1))
+
+    def __len__(self):
+        return len(self.order)
+
+    def user_slice(self, user_id):
+        """Slice of the sorted arrays holding one user's events (empty if unknown)."""
+        code = self.user_ids.searchsorted(user_id)
+        if code >= len(self.user_ids) or self.user_ids[code] != user_id:
+            return slice(0, 0)
+        return slice(self.offsets[code], self.offsets[code + 1])
+
+    def user_rows(self, user_id):
+        """Row positions in the event table of one user's events, in time order."""
+        return self.order[self.user_slice(user_id)]
+
+    def boundaries(self, sessions=True):
+        """Flags marking the first event of each sequence (session or whole user history)."""
+        return self.session_start if sessions else self.user_start
+
+
+def to_ns(value):
+    """int64 nanoseconds for a date/time string or Timestamp; naive values are taken as UTC."""
+    ts = pd.Timestamp(value)
+    if ts.tzinfo is None:
+        ts = ts.tz_localize('UTC')
+    return ts.value
+
+
+class TimeIndex:
+    """Event rows in timestamp order, keyed by int64 nanoseconds, for range lookups.
+
+    ``load_data`` keeps the event table sorted by time, so ranges are plain
+    row slices. Tables in any other order (e.g. swapped in by tests) are
+    served through a sort permutation instead.
+    """
+
+    def __init__(self, events):
+        keys = timestamp_ns(events['timestamp'])
+        if len(keys) > 1 and (keys[1:] < keys[:-1]).any():
+            self.order = np.argsort(keys, kind='stable')
+            self.keys = keys[self.order]
+        else:
+            self.order = None
+            self.keys = keys
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def max_ns(self):
+        return int(self.keys[-1]) if len(self.keys) else None
+
+    def bounds(self, start_ns=None, end_ns=None):
+        """Positions [lo, hi) of events with start <= timestamp <= end."""
+        lo = 0 if start_ns is None else int(np.searchsorted(self.keys, start_ns, side='left'))
+        hi = len(self.keys) if end_ns is None else int(np.searchsorted(self.keys, end_ns, side='right'))
+        return lo, max(lo, hi)
+
+    def select(self, events, start_ns=None, end_ns=None):
+        """Rows of events in the time range: a slice when the table is time-sorted."""
+        lo, hi = self.bounds(start_ns, end_ns)
+        if self.order is None:
+            return events.iloc[lo:hi]
+        return events.iloc[np.sort(self.order[lo:hi])]
@@ -0,0 +1,99 @@
+"""Strict ordered funnels with a conversion window, and time to convert.
+
+``StageTimes`` is built once per data load from the user-sorted event index.
+For every funnel stage it keeps that stage's events as one sorted array of
+``user_row * R + time_rank`` keys (time ranks are dense ranks of the event
+timestamps, so keys stay exact and fit in int64). "The first stage-k event
+of user u at or after time t" is then one ``searchsorted`` for all users at
+once, and walking the stages yields a dense users x stages array of the
+times each user reached each step.
+"""
+import numpy as np
+import pandas as pd
+
+NOT_REACHED = -1
+
+PERCENTILES = (25, 50, 75, 90, 95)
+
+# Histogram bucket edges for time to convert, in seconds
+HISTOGRAM_EDGES = (0, 60, 300, 1800, 3600, 6 * 3600, 86400, 3 * 86400, 7 * 86400, 30 * 86400)
+HISTOGRAM_LABELS = ('<1m', '1-5m', '5-30m', '30m-1h', '1-6h', '6-24h', '1-3d', '3-7d', '7-30d', '30d+')
+
+
+def parse_window(value):
+    """Conversion window like '7d', '24h', '30m' or plain seconds, as nanoseconds (None if unset)."""
+    if not value:
+        return None
+    units = {'d': 86400, 'h': 3600, 'm': 60, 's': 1}
+    unit = value[-1].lower()
+    seconds = float(value[:-1]) * units[unit] if unit in units else float(value)
+    if seconds <= 0:
+        raise ValueError('window must be positive')
+    return int(seconds * 10**9)
+
+
+class StageTimes:
+    """Per-stage event keys for walking ordered funnels over all users at once."""
+
+    def __init__(self, index, users, stages):
+        self.stages = list(stages)
+        self.num_users = len(users)
+
+        user_rows = pd.Index(users['user_id']).get_indexer(index.user_ids)[index.users]
+        self.rank_times, ranks = np.unique(index.timestamps, return_inverse=True)
+        self.num_ranks = max(len(self.rank_times), 1)
+
+        codes = {name: i for i, name in enumerate(index.event_names)}
+        self.stage_keys = []
+        for stage in self.stages:
+            hits = (index.events == codes.get(stage, -2)) & (user_rows >= 0)
+            self.stage_keys.append(np.sort(user_rows[hits].astype(np.int64) * self.num_ranks + ranks[hits]))
+
+    def ordered_times(self, window_ns=None):
+        """Dense users x stages array of when each user completed each step in order.
+
+        Step 1 is the user's first stage-1 event; step k is their first stage-k
+        event at or after step k - 1, and must fall within the window measured
+        from step 1. Later steps of users who dropped out stay NOT_REACHED.
+        """
+        times = np.full((self.num_users, len(self.stages)), NOT_REACHED, dtype=np.int64)
+        if not self.stages:
+            return times
+        keys = self.stage_keys[0]
+        users, first = np.unique(keys // self.num_ranks, return_index=True)
+        ranks = keys[first] % self.num_ranks
+        times[users, 0] = self.rank_times[ranks]
+        start = times[users, 0]
+
+        for k in range(1, len(self.stages)):
+            keys = self.stage_keys[k]
+            if not len(keys) or not len(users):
+                break
+            pos = np.searchsorted(keys, users * self.num_ranks + ranks)
+            found = pos < len(keys)
+            found[found] = keys[pos[found]] // self.num_ranks == users[found]
+            next_ranks = keys[np.minimum(pos, len(keys) - 1)] % self.num_ranks
+            if window_ns is not None:
+                found &= self.rank_times[next_ranks] - start <= window_ns
+            users, ranks, start = users[found], next_ranks[found], start[found]
+            times[users, k] = self.rank_times[ranks]
+        return times
+
+
+def time_to_convert(times, user_mask=None):
+    """Per-step percentiles and histograms of seconds from the previous step."""
+    if user_mask is not None:
+        times = times[user_mask]
+    steps = []
+    for k in range(1, times.shape[1]):
+        reached = (times[:, k] != NOT_REACHED) & (times[:, k - 1] != NOT_REACHED)
+        seconds = (times[reached, k] - times[reached, k - 1]) / 1e9
+        counts = np.bincount(np.searchsorted(HISTOGRAM_EDGES, seconds, side='right') - 1,
+                             minlength=len(HISTOGRAM_EDGES))
+        steps.append({
+            'users': int(reached.sum()),
+            'percentiles': {f'p{p}': round(v, 1) for p, v in zip(PERCENTILES, np.percentile(seconds, PERCENTILES))}
+            if len(seconds) else {},
+            'histogram': counts.tolist()
+        })
+    return steps
@@ -1,53 +1,495 @@
+import argparse
+import hashlib
+import io
 import sqlite3
 import pandas as pd
+import numpy as np
 import os
+import sys
+import time
+import uuid
 
-def init_db():
+import cube
+import partitions
+import summaries
+from event_index import timestamp_ns
+
+# Rows read from the CSVs and inserted per batch
+DEFAULT_CHUNK_SIZE = 200000
+
+# Page cache for the load, in KiB (negative cache_size is KiB in SQLite)
+LOAD_CACHE_KIB = 512 * 1024
+
+# Bytes hashed at the start of a CSV and just before its high-water mark
+FINGERPRINT_BYTES = 64 * 1024
+
+# Typed schema: epoch-second timestamps and integer user keys (users.user_key)
+SCHEMA = [
+    "DROP TABLE IF EXISTS users",
+    "DROP TABLE IF EXISTS events",
+    "DROP TABLE IF EXISTS load_state",
+    f"DROP TABLE IF EXISTS {partitions.CATALOG_TABLE}",
+    """CREATE TABLE users (
+        user_key INTEGER PRIMARY KEY,
+        user_id TEXT NOT NULL,
+        joined_at INTEGER NOT NULL,
+        device TEXT,
+        country TEXT,
+        subscription_status TEXT,
+        ab_variant TEXT
+    )""",
+    """CREATE TABLE events (
+        event_id TEXT,
+        user_key INTEGER NOT NULL,
+        event_name TEXT NOT NULL,
+        timestamp INTEGER NOT NULL,
+        metadata TEXT
+    )""",
+    # High-water marks of the last load (see record_state)
+    "CREATE TABLE load_state (name TEXT PRIMARY KEY, value TEXT)",
+    # Events per calendar month, for partition pruning (see refresh_partitions)
+    f"""CREATE TABLE {partitions.CATALOG_TABLE} (
+        month TEXT PRIMARY KEY,
+        events INTEGER NOT NULL,
+        min_timestamp INTEGER,
+        max_timestamp INTEGER
+    )""",
+]
+
+# Built after the rows are in, which is much cheaper than maintaining them per insert
+INDEXES = [
+    "CREATE UNIQUE INDEX idx_users_user_id ON users(user_id)",
+    "CREATE UNIQUE INDEX idx_events_event_id ON events(event_id)",
+    "CREATE INDEX idx_events_user_key ON events(user_key)",
+    "CREATE INDEX idx_events_event_name ON events(event_name)",
+    "CREATE INDEX idx_events_timestamp ON events(timestamp)",
+]
+
+USER_COLUMNS = ['device', 'country', 'subscription_status', 'ab_variant']
+
+
+def epoch_seconds(values):
+    """int64 seconds since the epoch for ISO timestamp strings (UTC)."""
+    try:
+        # NumPy parses plain 'YYYY-MM-DDTHH:MM:SS[Z]' several times faster than pandas does with a zone
+        return np.array(values.str.removesuffix('Z').to_numpy(dtype=str), dtype='datetime64[s]').astype(np.int64)
+    except ValueError:
+        return timestamp_ns(pd.to_datetime(values, utc=True)) // 10**9
+
+
+def _text(series):
+    """Column values as Python objects for sqlite3, with missing values as NULL."""
+    return series.astype(object).where(series.notna(), None).tolist()
+
+
+class Progress:
+    """Prints rows loaded and throughput per table."""
+
+    def __init__(self, table):
+        self.table = table
+        self.rows = 0
+        self.skipped = 0
+        self.start = time.perf_counter()
+
+    def add(self, rows):
+        self.rows += rows
+        elapsed = time.perf_counter() - self.start
+        print(f"   {self.table}: {self.rows:,} rows ({self.rows / max(elapsed, 1e-9):,.0f} rows/s)", flush=True)
+
+    def done(self):
+        elapsed = time.perf_counter() - self.start
+        skipped = f", skipped {self.skipped:,}" if self.skipped else ""
+        print(f" - Inserted {self.rows:,} {self.table} in {elapsed:.1f}s{skipped}")
+
+
+# --- Reading CSVs from a byte offset ---------------------------------------
+
+class _ByteRange(io.RawIOBase):
+    """A file read from its current position up to (not including) byte `end`."""
+
+    def __init__(self, raw, end):
+        self.raw = raw
+        self.end = end
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = min(len(buffer), self.end - self.raw.tell())
+        if size <= 0:
+            return 0
+        data = self.raw.read(size)
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def complete_size(path):
+    """Bytes of the file up to its last newline, so a row still being written is left for later."""
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        f.seek(max(size - FINGERPRINT_BYTES, 0))
+        tail = f.read()
+    return size - len(tail) + tail.rfind(b'\n') + 1 if b'\n' in tail else 0
+
+
+def fingerprint(path, end):
+    """Hash of the file's first bytes and the bytes just before `end`; changes if that part is rewritten."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        digest.update(f.read(min(FINGERPRINT_BYTES, end)))
+        f.seek(max(end - FINGERPRINT_BYTES, 0))
+        digest.update(f.read(min(FINGERPRINT_BYTES, end)))
+    return digest.hexdigest()
+
+
+def read_csv_range(path, start, end, chunk_size):
+    """DataFrame chunks (all columns as strings) of the CSV rows in bytes [start, end)."""
+    with open(path, 'rb') as f:
+        columns = f.readline().decode('utf-8').strip().split(',')
+        f.seek(max(start, f.tell()))
+        text = io.TextIOWrapper(io.BufferedReader(_ByteRange(f, end)), encoding='utf-8', newline='')
+        yield from pd.read_csv(text, names=columns, header=None, chunksize=chunk_size, dtype=str)
+
+
+# --- Load state -----------------------------------------------------------
+
+def read_state(conn):
+    try:
+        return dict(conn.execute("SELECT name, value FROM load_state").fetchall())
+    except sqlite3.OperationalError:
+        return {}
+
+
+def record_state(conn, load_id, files):
+    """Store the load id and, per CSV, the high-water mark: bytes loaded and their fingerprint."""
+    state = {'load_id': load_id}
+    for table, (path, end) in files.items():
+        state[f'{table}_offset'] = str(end)
+        state[f'{table}_fingerprint'] = fingerprint(path, end)
+    last = conn.execute("SELECT event_id, timestamp FROM events ORDER BY rowid DESC LIMIT 1").fetchone()
+    if last is not None:
+        state['last_event_id'], state['last_timestamp'] = last[0], str(last[1])
+    conn.executemany("INSERT OR REPLACE INTO load_state VALUES (?, ?)", state.items())
+
+
+def refresh_partitions(conn, after_rowid=0):
+    """Recount the month partitions holding events stored after `after_rowid` (every month for 0)."""
+    months = [row[0] for row in conn.execute(
+        "SELECT DISTINCT strftime('%Y-%m', timestamp, 'unixepoch') FROM events WHERE rowid > ?", (after_rowid,))]
+    for month in months:
+        start, end = partitions.month_bounds(month)
+        conn.execute(f"INSERT OR REPLACE INTO {partitions.CATALOG_TABLE} "
+                     "SELECT ?, COUNT(*), MIN(timestamp), MAX(timestamp) FROM events "
+                     "WHERE timestamp >= ? AND timestamp < ?", (month, start, end))
+    return len(months)
+
+
+def events_version(conn):
+    """Data version (cube.data_version) of the events table."""
+    count, latest = conn.execute("SELECT COUNT(*), MAX(timestamp) FROM events").fetchone()
+    return cube.version_of(count, None if latest is None else pd.Timestamp(latest, unit='s', tz='UTC'))
+
+
+# --- Loading rows -----------------------------------------------------------
+
+def load_users(conn, chunks, users=None):
+    """Insert users not loaded yet; returns all users ordered by user_key (small next to events)."""
+    progress = Progress('users')
+    frames = [] if users is None else [users]
+    known = set() if users is None else set(users['user_id'])
+    next_key = 1 if users is None else len(users) + 1
+    for chunk in chunks:
+        fresh = ~chunk['user_id'].isin(known) & ~chunk['user_id'].duplicated()
+        progress.skipped += int((~fresh).sum())
+        chunk = chunk[fresh]
+        known.update(chunk['user_id'])
+
+        keys = np.arange(next_key, next_key + len(chunk))
+        next_key += len(chunk)
+        joined = epoch_seconds(chunk['joined_at'])
+        conn.executemany(
+            "INSERT INTO users VALUES (?, ?, ?, ?, ?, ?, ?)",
+            zip(keys.tolist(), chunk['user_id'].tolist(), joined.tolist(),
+                *(_text(chunk[column]) for column in USER_COLUMNS)))
+        frames.append(chunk.assign(joined_at=pd.to_datetime(joined, unit='s', utc=True)))
+        progress.add(len(chunk))
+    progress.done()
+    return pd.concat(frames, ignore_index=True)
+
+
+def stored_users(conn):
+    users = pd.read_sql_query("SELECT * FROM users ORDER BY user_key", conn)
+    users['joined_at'] = pd.to_datetime(users['joined_at'], unit='s', utc=True)
+    return users.drop(columns='user_key')
+
+
+def _existing_event_ids(conn, event_ids):
+    """Which of these event ids are already in the events table."""
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS chunk_ids (event_id TEXT)")
+    conn.execute("DELETE FROM chunk_ids")
+    conn.executemany("INSERT INTO chunk_ids VALUES (?)", zip(event_ids))
+    return {row[0] for row in conn.execute(
+        "SELECT event_id FROM events WHERE event_id IN (SELECT event_id FROM chunk_ids)")}
+
+
+def _history(conn, user_keys):
+    """(user, day, event_name) facts of the stored events of these users, for the cube's distinct counts."""
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS chunk_users (user_key INTEGER PRIMARY KEY)")
+    conn.execute("DELETE FROM chunk_users")
+    conn.executemany("INSERT INTO chunk_users VALUES (?)", zip(np.unique(user_keys).tolist()))
+    history = pd.read_sql_query(
+        "SELECT DISTINCT user_key - 1 AS user, timestamp / 86400 AS day, event_name FROM events "
+        "WHERE user_key IN (SELECT user_key FROM chunk_users)", conn)
+    return history.astype({'user': np.int64, 'day': np.int64})
+
+
+def load_events(conn, chunks, users, event_cube=None, append=False):
+    """Insert event chunks, folding each one into event_cube when given.
+
+    Events of users missing from users.csv are skipped. When appending,
+    events whose event_id is already stored (or repeated in the chunk) are
+    skipped too, and the cube's distinct users are checked against the
+    stored events of the chunk's users. A full load passes no cube and
+    builds it from the table afterwards (cube_from_table).
+    """
+    progress = Progress('events')
+    user_index = pd.Index(users['user_id'])
+    for chunk in chunks:
+        rows = user_index.get_indexer(chunk['user_id'])
+        keep = rows >= 0
+        if append:
+            keep &= ~chunk['event_id'].duplicated().to_numpy()
+            existing = _existing_event_ids(conn, chunk['event_id'][keep].tolist())
+            keep &= ~chunk['event_id'].isin(existing).to_numpy()
+        progress.skipped += int((~keep).sum())
+        chunk, keys = chunk[keep], rows[keep] + 1
+
+        history = _history(conn, keys) if append and event_cube is not None else None
+        seconds = epoch_seconds(chunk['timestamp'])
+        conn.executemany(
+            "INSERT INTO events VALUES (?, ?, ?, ?, ?)",
+            zip(_text(chunk['event_id']), keys.tolist(), chunk['event_name'].tolist(),
+                seconds.tolist(), _text(chunk['metadata'])))
+
+        if event_cube is not None:
+            event_cube.ingest(users, chunk.assign(timestamp=pd.to_datetime(seconds, unit='s', utc=True)), 0, history)
+        progress.add(len(chunk))
+    progress.done()
+
+
+# Whole days since the epoch of events.timestamp, rounded down like retention.epoch_days
+SQL_DAY = "(e.timestamp / 86400 - (e.timestamp % 86400 < 0))"
+
+
+def cube_from_table(conn):
+    """Build the event cube from the events table with one GROUP BY per cuboid.
+
+    SQLite counts the distinct users itself, sorting in its page cache and
+    temporary storage, so the loader keeps no per-key bookkeeping and its
+    memory does not grow with the number of events or distinct keys.
+    """
+    user_columns = [f"COALESCE(CAST(u.{d} AS TEXT), 'None') AS {d}" for d in cube.USER_DIMENSIONS]
+    tables = {}
+    for name, dims in cube.CUBOIDS.items():
+        columns = ([f"{SQL_DAY} AS day"] if 'day' in dims else []) + \
+            (["e.event_name AS event_name"] if 'event_name' in dims else []) + user_columns
+        groups = ', '.join(str(i) for i in range(1, len(columns) + 1))
+        table = pd.read_sql_query(
+            f"SELECT {', '.join(columns)}, COUNT(*) AS events, COUNT(DISTINCT e.user_key) AS users "
+            f"FROM events e JOIN users u ON u.user_key = e.user_key GROUP BY {groups}", conn)
+        tables[name] = table.astype({'events': np.int64, 'users': np.int64})
+    return cube.Cube(tables, events_version(conn))
+
+
+def build_indexes(conn):
+    start = time.perf_counter()
+    try:
+        for statement in INDEXES:
+            conn.execute(statement)
+        deduplicated = 0
+    except sqlite3.IntegrityError:
+        # Repeated event ids in the CSV: keep the first of each, then index again
+        deduplicated = conn.execute(
+            "DELETE FROM events WHERE event_id IS NOT NULL AND rowid NOT IN "
+            "(SELECT MIN(rowid) FROM events WHERE event_id IS NOT NULL GROUP BY event_id)").rowcount
+        print(f"Warning: removed {deduplicated:,} events with repeated event_id")
+        for statement in INDEXES:
+            conn.execute(statement.replace(' INDEX ', ' INDEX IF NOT EXISTS ', 1))
+    print(f" - Built {len(INDEXES)} indexes in {time.perf_counter() - start:.1f}s")
+    return deduplicated
+
+
+# Paths
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+USERS_FILE = os.path.join(BASE_DIR, 'users.csv')
+EVENTS_FILE = os.path.join(BASE_DIR, 'events.csv')
+DB_FILE = os.path.join(BASE_DIR, 'backend', 'database', 'vizsprints.db')
+
+
+def _bulk_pragmas(conn):
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute(f"PRAGMA cache_size=-{LOAD_CACHE_KIB}")
+
+
+def _finish(conn, event_cube, load_start):
+    # Pre-aggregate the event cube the API answers group-by queries from
+    event_cube.save(conn)
+    summaries.save_version(conn, event_cube.version)
+    print(f" - Saved cube ({', '.join(f'{name}: {len(t)} cells' for name, t in event_cube.tables.items())})")
+
+    # Back to a rollback journal so the shipped file opens on read-only filesystems
+    conn.execute("PRAGMA synchronous=FULL")
+    conn.execute("PRAGMA journal_mode=DELETE")
+    print(f"Load complete in {time.perf_counter() - load_start:.1f}s!")
+
+
+def _remove(db_file, suffixes=('', '-wal', '-shm', '-journal')):
+    for suffix in suffixes:
+        if os.path.exists(db_file + suffix):
+            os.remove(db_file + suffix)
+
+
+def init_db(chunk_size=DEFAULT_CHUNK_SIZE, users_file=USERS_FILE, events_file=EVENTS_FILE, db_file=DB_FILE):
+    """Load the CSVs into a new database at db_file; returns whether it succeeded.
+
+    The load is built in a temporary file next to db_file that replaces it only
+    once complete, so a failed load leaves the previous database in place.
+    """
     print("Initializing Database...")
-    
-    # Paths
-    BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    USERS_FILE = os.path.join(BASE_DIR, 'users.csv')
-    EVENTS_FILE = os.path.join(BASE_DIR, 'events.csv')
-    DB_FILE = os.path.join(BASE_DIR, 'backend', 'database', 'vizsprints.db')
-    
-    # Connect to SQLite (creates file if not exists)
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    
+
+    if not os.path.exists(users_file) or not os.path.exists(events_file):
+        print(f"Warning: {users_file} or {events_file} not found!")
+        return False
+
+    # A full load starts from an empty file rather than leaving the old tables' free pages behind
+    build_file = db_file + '.building'
+    _remove(build_file)
+
+    # Transactions are managed explicitly
+    conn = sqlite3.connect(build_file, isolation_level=None)
+    built = False
+
     try:
-        # Load Users
-        if os.path.exists(USERS_FILE):
-            print(f"Loading {USERS_FILE}...")
-            users_df = pd.read_csv(USERS_FILE)
-            users_df.to_sql('users', conn, if_exists='replace', index=False)
-            print(f" - Inserted {len(users_df)} users")
-            
-            # Create index on user_id
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_user_id ON users(user_id)")
-        else:
-            print(f"Warning: {USERS_FILE} not found!")
-
-        # Load Events
-        if os.path.exists(EVENTS_FILE):
-            print(f"Loading {EVENTS_FILE}...")
-            events_df = pd.read_csv(EVENTS_FILE)
-            events_df.to_sql('events', conn, if_exists='replace', index=False)
-            print(f" - Inserted {len(events_df)} events")
-            
-            # Create indices for performance
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_events_user_id ON events(user_id)")
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_events_event_name ON events(event_name)")
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_events_timestamp ON events(timestamp)")
-        else:
-            print(f"Warning: {EVENTS_FILE} not found!")
-            
-        print("Database initialization complete!")
-        
+        load_start = time.perf_counter()
+        conn.execute("PRAGMA journal_mode=WAL")
+        _bulk_pragmas(conn)
+        files = {'users': (users_file, complete_size(users_file)), 'events': (events_file, complete_size(events_file))}
+
+        # One transaction for the whole load
+        conn.execute("BEGIN")
+        for statement in SCHEMA:
+            conn.execute(statement)
+
+        print(f"Loading {users_file}...")
+        users_df = load_users(conn, read_csv_range(users_file, 0, files['users'][1], chunk_size))
+        print(f"Loading {events_file}...")
+        load_events(conn, read_csv_range(events_file, 0, files['events'][1], chunk_size), users_df)
+
+        build_indexes(conn)
+        cube_start = time.perf_counter()
+        event_cube = cube_from_table(conn)
+        print(f" - Built cube in {time.perf_counter() - cube_start:.1f}s")
+        print(f" - Cataloged {refresh_partitions(conn)} month partitions")
+        summary_start = time.perf_counter()
+        summaries.refresh(conn)
+        print(f" - Built summary tables in {time.perf_counter() - summary_start:.1f}s")
+        event_cube.version = events_version(conn)
+        record_state(conn, uuid.uuid4().hex, files)
+        conn.execute("COMMIT")
+
+        _finish(conn, event_cube, load_start)
+        built = True
+
     except Exception as e:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
         print(f"Error initializing database: {e}")
     finally:
         conn.close()
 
+    if not built:
+        _remove(build_file)
+        return False
+    # The old file's WAL must not be replayed into the new one
+    _remove(db_file, ('-wal', '-shm', '-journal'))
+    os.replace(build_file, db_file)
+    return True
+
+
+def append_db(chunk_size=DEFAULT_CHUNK_SIZE, users_file=USERS_FILE, events_file=EVENTS_FILE, db_file=DB_FILE):
+    """Load only the rows added to the CSVs since the last load.
+
+    Falls back to a full load when there is no previous load or the CSVs
+    changed before their high-water marks (rewritten rather than appended).
+    Returns whether it succeeded; a failed append leaves the database as it was.
+    """
+    print("Appending to Database...")
+    if not os.path.exists(db_file):
+        return init_db(chunk_size, users_file, events_file, db_file)
+
+    conn = sqlite3.connect(db_file, isolation_level=None)
+    state = read_state(conn)
+    files = {}
+    for table, path in (('users', users_file), ('events', events_file)):
+        offset = int(state.get(f'{table}_offset', -1))
+        end = complete_size(path) if os.path.exists(path) else -1
+        if offset < 0 or end < offset or fingerprint(path, offset) != state.get(f'{table}_fingerprint'):
+            conn.close()
+            print(f"{path} does not extend the last load; running a full load")
+            return init_db(chunk_size, users_file, events_file, db_file)
+        files[table] = (path, offset, end)
+
+    try:
+        load_start = time.perf_counter()
+        _bulk_pragmas(conn)
+        event_cube = cube.Cube.load(conn, events_version(conn))
+
+        # One transaction for the whole append
+        conn.execute("BEGIN")
+        last_rowid = conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM events").fetchone()[0]
+        last_user_key = conn.execute("SELECT COALESCE(MAX(user_key), 0) FROM users").fetchone()[0]
+        users_path, users_start, users_end = files['users']
+        print(f"Appending {users_path} from byte {users_start:,}...")
+        users_df = load_users(conn, read_csv_range(users_path, users_start, users_end, chunk_size),
+                              stored_users(conn))
+
+        rebuild = event_cube is None
+        events_path, events_start, events_end = files['events']
+        print(f"Appending {events_path} from byte {events_start:,}...")
+        load_events(conn, read_csv_range(events_path, events_start, events_end, chunk_size),
+                    users_df, event_cube, append=True)
+
+        if rebuild:
+            print("Cube missing or stale; rebuilding it from the events table")
+            event_cube = cube_from_table(conn)
+        print(f" - Recounted {refresh_partitions(conn, last_rowid)} month partitions")
+        summary_start = time.perf_counter()
+        summaries.refresh(conn, last_rowid, last_user_key)
+        print(f" - Refreshed summary tables in {time.perf_counter() - summary_start:.1f}s")
+        event_cube.version = events_version(conn)
+        record_state(conn, state['load_id'], {table: (path, end) for table, (path, _, end) in files.items()})
+        conn.execute("COMMIT")
+
+        _finish(conn, event_cube, load_start)
+        return True
+
+    except Exception as e:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        print(f"Error appending to database: {e}")
+        return False
+    finally:
+        conn.close()
+
+
 if __name__ == "__main__":
-    init_db()
+    parser = argparse.ArgumentParser(description='Load users.csv and events.csv into the SQLite database')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='CSV rows per batch')
+    parser.add_argument('--append', action='store_true',
+                        help='load only rows added to the CSVs since the last load')
+    parser.add_argument('--users', default=USERS_FILE, help='users CSV')
+    parser.add_argument('--events', default=EVENTS_FILE, help='events CSV')
+    parser.add_argument('--db', default=DB_FILE, help='SQLite database to (re)create')
+    args = parser.parse_args()
+    if not (append_db if args.append else init_db)(args.chunk_size, args.users, args.events, args.db):
+        sys.exit(1)
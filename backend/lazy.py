@@ -0,0 +1,35 @@
+"""Modules imported on first use.
+
+pandas, numpy and the analysis modules built on them take most of a cold
+start to import. ``app.py`` binds them through ``lazy_module`` so that
+importing the app, and serving routes that never touch them (health,
+metrics, cached results), costs no more than Flask itself.
+"""
+import importlib
+import sys
+
+
+class LazyModule:
+    """Stands in for a module and imports it on first attribute access."""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            # The import system's module locks make concurrent first uses safe
+            self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+def lazy_module(name):
+    """The module if it is already imported, else a LazyModule for it."""
+    return sys.modules.get(name) or LazyModule(name)
@@ -0,0 +1,121 @@
+"""Month partitions of the event payload, loaded lazily from SQLite.
+
+Analyses only need the event id, user, name and timestamp of every event,
+so that is all the backend keeps resident. The per-event ``metadata`` JSON
+(the widest column) is only shown by endpoints returning raw rows, which
+return a page of at most a few months. ``PartitionStore`` reads it one
+calendar month (UTC) at a time, through the timestamp index, for just the
+months a request touches; ``init_db.py`` keeps the month catalog
+(``event_partitions``) that prunes requests to months that hold events.
+Partitions are kept in LRU order and the oldest-used are evicted beyond
+``max_resident``. Reads go through the backend's connection pool
+(``sqlite_pool.py``).
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+CATALOG_TABLE = 'event_partitions'
+
+# Months of payload kept in memory
+DEFAULT_RESIDENT_MONTHS = 3
+
+# Requests for fewer than this fraction of a month's events that is not resident
+# (e.g. one user's timeline) look rows up by event_id instead of loading the month
+SPARSE_FRACTION = 0.05
+
+
+def month_of(ns):
+    """'YYYY-MM' (UTC) of int64 nanosecond timestamps."""
+    return np.asarray(ns, dtype='datetime64[ns]').astype('datetime64[M]').astype(str)
+
+
+def month_bounds(month):
+    """[start, end) of a 'YYYY-MM' month in epoch seconds."""
+    start = np.datetime64(month, 'M')
+    return int(start.astype('datetime64[s]').astype(np.int64)), int((start + 1).astype('datetime64[s]').astype(np.int64))
+
+
+class PartitionStore:
+    """Lazily loaded, LRU-evicted month partitions of event metadata, keyed by event_id."""
+
+    def __init__(self, pool, max_resident=DEFAULT_RESIDENT_MONTHS):
+        self.pool = pool
+        self.max_resident = max_resident
+        self.lock = threading.Lock()
+        self.resident = OrderedDict()
+        self.loads = 0
+        self.hits = 0
+        self.evictions = 0
+        self._catalog = None
+
+    def catalog(self):
+        """{month: event count} of the months holding events."""
+        if self._catalog is None:
+            self._catalog = dict(self.pool.execute(f"SELECT month, events FROM {CATALOG_TABLE}"))
+        return self._catalog
+
+    def _partition(self, month):
+        with self.lock:
+            if month in self.resident:
+                self.resident.move_to_end(month)
+                self.hits += 1
+                return self.resident[month]
+
+        start, end = month_bounds(month)
+        rows = self.pool.execute("SELECT event_id, metadata FROM events WHERE timestamp >= ? AND timestamp < ?",
+                                 (start, end))
+        partition = pd.Series([r[1] for r in rows], index=pd.Index([r[0] for r in rows]), dtype=object)
+
+        with self.lock:
+            self.loads += 1
+            self.resident[month] = partition
+            while len(self.resident) > self.max_resident:
+                self.resident.popitem(last=False)
+                self.evictions += 1
+        return partition
+
+    def _lookup(self, event_ids, batch=500):
+        rows = []
+        for i in range(0, len(event_ids), batch):
+            ids = list(event_ids[i:i + batch])
+            rows += self.pool.execute(f"SELECT event_id, metadata FROM events WHERE event_id IN "
+                                      f"({', '.join('?' * len(ids))})", ids)
+        return pd.Series([r[1] for r in rows], index=pd.Index([r[0] for r in rows]), dtype=object)
+
+    def metadata(self, event_ids, timestamps_ns):
+        """Metadata for events given by id and timestamp; None where unknown."""
+        event_ids = pd.Index(event_ids)
+        months = month_of(timestamps_ns)
+        result = np.full(len(event_ids), None, dtype=object)
+        catalog = self.catalog()
+        for month in np.unique(months):
+            # Pruned: only months the catalog says hold events are read
+            if month not in catalog:
+                continue
+            rows = np.flatnonzero(months == month)
+            with self.lock:
+                sparse = month not in self.resident and len(rows) < SPARSE_FRACTION * catalog[month]
+            partition = self._lookup(event_ids[rows]) if sparse else self._partition(month)
+            found = partition.index.get_indexer(event_ids[rows])
+            result[rows[found >= 0]] = partition.to_numpy()[found[found >= 0]]
+        return [None if isinstance(value, float) else value for value in result]
+
+    def invalidate(self, months=None):
+        """Drop resident partitions (of the given months) and the catalog, e.g. after an append."""
+        with self.lock:
+            for month in list(self.resident) if months is None else months:
+                self.resident.pop(month, None)
+            self._catalog = None
+
+    def stats(self):
+        with self.lock:
+            return {
+                'max_resident': self.max_resident,
+                'resident_months': list(self.resident),
+                'loads': self.loads,
+                'hits': self.hits,
+                'evictions': self.evictions
+            }
@@ -0,0 +1,61 @@
+"""Event-to-event transitions and frequent k-step paths.
+
+Everything is computed from a ``UserEventIndex`` with shifted-array
+comparisons: event i is followed by event i + 1 whenever i + 1 does not start
+a new sequence (session, or user when sessions are ignored).
+"""
+import numpy as np
+
+
+def transition_counts(index, sessions=True):
+    """Counts of (from, to) transitions plus how often each event starts and ends a sequence.
+
+    Returns (counts[K, K], starts[K], ends[K]) for K event names.
+    """
+    k = len(index.event_names)
+    events = index.events.astype(np.int64)
+    starts_flag = index.boundaries(sessions)
+    follows = ~starts_flag[1:]
+
+    counts = np.bincount(events[:-1][follows] * k + events[1:][follows], minlength=k * k).reshape(k, k)
+    ends_flag = np.ones(len(events), dtype=bool)
+    ends_flag[:-1] = starts_flag[1:]
+    starts = np.bincount(events[starts_flag], minlength=k)
+    ends = np.bincount(events[ends_flag], minlength=k)
+    return counts, starts, ends
+
+
+def top_paths(index, steps, top, sessions=True, start_with=None, end_with=None):
+    """Most frequent runs of `steps` consecutive events within one sequence.
+
+    Returns (paths as lists of event codes, counts, total number of runs).
+    """
+    k = len(index.event_names)
+    n = len(index)
+    if n < steps:
+        return [], [], 0
+
+    events = index.events.astype(np.int64)
+    sequence = np.cumsum(index.boundaries(sessions))
+    windows = n - steps + 1
+    valid = sequence[steps - 1:] == sequence[:windows]
+    if start_with is not None:
+        valid &= events[:windows] == start_with
+    if end_with is not None:
+        valid &= events[steps - 1:] == end_with
+
+    # Encode each run as one base-K integer
+    codes = np.zeros(windows, dtype=np.int64)
+    for step in range(steps):
+        codes = codes * k + events[step:step + windows]
+    codes, counts = np.unique(codes[valid], return_counts=True)
+
+    best = np.argsort(-counts, kind='stable')[:top]
+    paths = []
+    for code in codes[best]:
+        path = []
+        for _ in range(steps):
+            code, event = divmod(int(code), k)
+            path.append(event)
+        paths.append(path[::-1])
+    return paths, counts[best].tolist(), int(counts.sum())
@@ -0,0 +1,148 @@
+"""On-demand profiling for the running API process.
+
+Two modes, both guarded by the ``VIZSPRINTS_DEBUG_TOKEN`` environment variable
+(profiling is disabled when it is unset; callers pass the token in the
+``X-Debug-Token`` header or a ``token`` query parameter):
+
+* ``sample_stacks`` polls every thread's Python stack for a few seconds and
+  returns collapsed stacks (``frame;frame;frame count``), the input format of
+  flamegraph.pl and speedscope.
+* ``?profile=1`` on any route runs that single request under cProfile and
+  returns the stats instead of the normal payload.
+"""
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+from flask import g, jsonify, request
+
+TOKEN_ENV = 'VIZSPRINTS_DEBUG_TOKEN'
+
+MAX_SECONDS = 60
+DEFAULT_INTERVAL = 0.005
+
+# Leaf functions of threads that are parked rather than doing work
+IDLE_FUNCTIONS = {'wait', 'select', 'poll', 'accept', 'sleep', 'get', '_wait_for_tstate_lock',
+                  'serve_forever', 'handle_request', 'readinto', 'recv_into'}
+
+PSTATS_SORT_KEYS = {'cumulative', 'tottime', 'ncalls', 'time', 'calls'}
+
+
+def check_access():
+    """Return an error response tuple if the caller may not profile, else None."""
+    expected = os.environ.get(TOKEN_ENV)
+    if not expected:
+        return jsonify({'error': f'Profiling is disabled; set {TOKEN_ENV} to enable it'}), 403
+    supplied = request.headers.get('X-Debug-Token') or request.args.get('token') or ''
+    if not hmac.compare_digest(supplied.encode(), expected.encode()):
+        return jsonify({'error': 'Invalid debug token'}), 403
+    return None
+
+
+def _short_path(filename):
+    """Last two path components, enough to tell flask/app.py from backend/app.py."""
+    head, tail = os.path.split(filename)
+    return f"{os.path.basename(head)}/{tail}" if head else tail
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})"
+
+
+def sample_stacks(seconds, interval=DEFAULT_INTERVAL, include_idle=False):
+    """Sample all other threads' stacks for `seconds`; return (Counter of collapsed stacks, samples taken)."""
+    own_ident = threading.get_ident()
+    stacks = Counter()
+    samples = 0
+    deadline = time.perf_counter() + seconds
+
+    while time.perf_counter() < deadline:
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            if not include_idle and frame.f_code.co_name in IDLE_FUNCTIONS:
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            labels.append(names.get(ident, f'thread-{ident}'))
+            stacks[';'.join(reversed(labels))] += 1
+        samples += 1
+        time.sleep(interval)
+
+    return stacks, samples
+
+
+def collapsed_text(stacks):
+    """Render stacks in collapsed (folded) format, hottest first."""
+    return ''.join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+def _profile_stats(profiler, sort, limit):
+    stats = pstats.Stats(profiler)
+    stats.sort_stats(sort)
+
+    rows = []
+    for func in stats.fcn_list[:limit]:
+        cc, nc, tt, ct, _ = stats.stats[func]
+        filename, line, name = func
+        rows.append({
+            'function': f"{name} ({_short_path(filename)}:{line})",
+            'ncalls': nc,
+            'primitive_calls': cc,
+            'tottime_ms': round(tt * 1000, 3),
+            'cumtime_ms': round(ct * 1000, 3),
+        })
+
+    text = io.StringIO()
+    stats.stream = text
+    stats.print_stats(limit)
+    return rows, text.getvalue()
+
+
+def init_app(app):
+    """Support ?profile=1 on every route."""
+
+    @app.before_request
+    def _start_request_profile():
+        if request.args.get('profile') != '1':
+            return None
+        denied = check_access()
+        if denied is not None:
+            return denied
+        g._profiler = cProfile.Profile()
+        g._profile_start = time.perf_counter()
+        g._profiler.enable()
+        return None
+
+    @app.after_request
+    def _finish_request_profile(response):
+        profiler = g.pop('_profiler', None)
+        if profiler is None:
+            return response
+        profiler.disable()
+        elapsed_ms = (time.perf_counter() - g.pop('_profile_start')) * 1000
+
+        sort = request.args.get('profile_sort', 'cumulative')
+        if sort not in PSTATS_SORT_KEYS:
+            sort = 'cumulative'
+        limit = request.args.get('profile_limit', 40, type=int)
+        rows, text = _profile_stats(profiler, sort, limit)
+
+        return jsonify({
+            'route': request.path,
+            'status': response.status_code,
+            'elapsed_ms': round(elapsed_ms, 3),
+            'sort': sort,
+            'functions': rows,
+            'text': text
+        })
@@ -0,0 +1,205 @@
+"""Disk-backed cache of whole API responses that survives cold starts.
+
+Every serverless cold start loses the in-process caches (``cache.py``), so
+responses are also kept in a small SQLite file keyed by endpoint, query
+parameters and the data version of the database they were computed from.
+``warm_cache.py`` fills it at build time with the default dashboard
+requests; at run time the lookup happens in a ``before_request`` hook, so a
+hit is one primary-key read and no handler (or pandas) work. Misses are
+written back when the file is writable, up to ``MAX_ENTRIES`` of them: past
+that the oldest written-back responses are dropped (the warmed ones stay).
+
+The cache is only used when its file exists (``warm_cache.py`` creates it);
+``VIZSPRINTS_RESULT_CACHE`` points it elsewhere.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from flask import Response, request
+
+PATH_ENV = 'VIZSPRINTS_RESULT_CACHE'
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'database', 'results.db')
+
+# Query parameters that do not change the payload
+IGNORED_PARAMS = {'profile', 'profile_sort', 'profile_limit', 'token'}
+
+# Routes whose responses are not cached: they report on the process, not the data
+UNCACHED_PREFIXES = ('/api/debug/', '/api/health')
+
+# Responses written back at run time kept at once (warmed responses do not count)
+MAX_ENTRIES_ENV = 'VIZSPRINTS_RESULT_CACHE_ENTRIES'
+MAX_ENTRIES = int(os.environ.get(MAX_ENTRIES_ENV, 1000))
+
+SCHEMA = """CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    version TEXT NOT NULL,
+    content_type TEXT NOT NULL,
+    body BLOB NOT NULL,
+    created_at REAL NOT NULL,
+    warmed INTEGER NOT NULL DEFAULT 0
+)"""
+
+
+def data_version(conn):
+    """Version string of the data in an open database: its load id and cube version."""
+    state = dict(conn.execute("SELECT name, value FROM load_state").fetchall())
+    try:
+        events, latest = conn.execute("SELECT events, max_timestamp FROM cube_meta").fetchone()
+    except sqlite3.OperationalError:
+        events, latest = None, None
+    return f"{state.get('load_id')}:{events}:{latest}"
+
+
+def scoped_version(dataset, version):
+    """Version of a dataset other than the default one (see datasets.py); entries are pruned per dataset."""
+    return f"{dataset}/{version}"
+
+
+def _scope(version):
+    return version.split('/', 1)[0] if '/' in version else ''
+
+
+def cache_key(path, args, version):
+    """Key of a request: its path, sorted query parameters (minus IGNORED_PARAMS) and the data version."""
+    params = sorted((name, value) for name, values in args.lists() if name not in IGNORED_PARAMS
+                    for value in values)
+    raw = json.dumps([path, params, version], separators=(',', ':'))
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class ResultCache:
+    """Responses stored in a SQLite file, keyed by cache_key."""
+
+    def __init__(self, path, max_entries=MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        # Set by warm_cache.py: what is stored meanwhile is never evicted for space
+        self.warming = False
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        # Cleared when the file turns out to be read-only (e.g. a deployed bundle)
+        self.writable = True
+        self._conn = None
+
+    def enabled(self):
+        return os.path.exists(self.path)
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        return self._conn
+
+    def create(self):
+        """Create (or empty) the cache file."""
+        with self.lock:
+            conn = self._connection()
+            # Recreated rather than emptied: files from before a schema change are rebuilt too
+            conn.execute("DROP TABLE IF EXISTS results")
+            conn.execute(SCHEMA)
+            conn.commit()
+
+    def get(self, key):
+        """(content_type, body) stored under key, or None."""
+        with self.lock:
+            try:
+                row = self._connection().execute(
+                    "SELECT content_type, body FROM results WHERE key = ?", (key,)).fetchone()
+            except sqlite3.Error:
+                row = None
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return row
+
+    def put(self, key, path, version, content_type, body):
+        with self.lock:
+            if not self.writable:
+                return
+            conn = self._connection()
+            try:
+                conn.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)",
+                             (key, path, version, content_type, body, time.time(), int(self.warming)))
+                # Responses of other versions of the same dataset can never be served again
+                conn.execute("DELETE FROM results WHERE version != ? AND CASE WHEN instr(version, '/') "
+                             "THEN substr(version, 1, instr(version, '/') - 1) ELSE '' END = ?",
+                             (version, _scope(version)))
+                # Oldest written-back responses past the cap
+                evicted = conn.execute("DELETE FROM results WHERE key IN (SELECT key FROM results WHERE warmed = 0 "
+                                       "ORDER BY created_at DESC LIMIT -1 OFFSET ?)", (self.max_entries,)).rowcount
+                conn.commit()
+                self.evictions += evicted
+                self.writes += 1
+            except sqlite3.Error:
+                conn.rollback()
+                self.writable = False
+
+    def stats(self):
+        with self.lock:
+            entries = 0
+            if self.enabled():
+                try:
+                    entries = self._connection().execute("SELECT COUNT(*) FROM results").fetchone()[0]
+                except sqlite3.Error:
+                    pass
+            return {
+                'path': self.path,
+                'enabled': self.enabled(),
+                'writable': self.writable,
+                'entries': entries,
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'writes': self.writes,
+                'evictions': self.evictions
+            }
+
+
+def _cacheable(path):
+    return request.method == 'GET' and path.startswith('/api/') and not path.startswith(UNCACHED_PREFIXES)
+
+
+def init_app(app, get_store, get_version):
+    """Serve cached responses before any handler runs and store new ones.
+
+    get_store() returns the ResultCache in use; get_version() the data version
+    of what the app is serving, or None when responses must not be cached
+    (e.g. while tests swap in other frames).
+    """
+
+    @app.before_request
+    def _serve_cached_result():
+        store = get_store()
+        if not _cacheable(request.path) or request.args.get('profile') == '1' or not store.enabled():
+            return None
+        version = get_version()
+        if version is None:
+            return None
+        found = store.get(cache_key(request.path, request.args, version))
+        if found is None:
+            return None
+        response = Response(found[1], status=200, content_type=found[0])
+        response.headers['X-Result-Cache'] = 'hit'
+        return response
+
+    @app.after_request
+    def _store_result(response):
+        store = get_store()
+        if response.headers.get('X-Result-Cache') == 'hit' or response.status_code != 200 or \
+                not _cacheable(request.path) or request.args.get('profile') == '1' or \
+                not response.is_json or not store.enabled():
+            return response
+        version = get_version()
+        if version is not None:
+            store.put(cache_key(request.path, request.args, version), request.path, version,
+                      response.content_type, response.get_data())
+            response.headers['X-Result-Cache'] = 'miss'
+        return response
@@ -0,0 +1,93 @@
+"""N-day retention and rolling active users from per-user activity days.
+
+``ActivityIndex`` stores each user's distinct active days as one sorted array
+in CSR layout: ``keys`` holds ``user * span + day`` for every (user, day)
+pair, sorted, and ``offsets[u]:offsets[u + 1]`` is user u's slice. Questions
+like "was user u active on day d" or "on any day >= d" then become a single
+vectorized ``searchsorted`` over all users, and rolling distinct-user counts
+become prefix sums over day-indexed arrays.
+"""
+import numpy as np
+import pandas as pd
+
+
+def epoch_days(timestamps):
+    """Whole days since 1970-01-01 (UTC) for a datetime Series."""
+    return timestamps.values.astype('datetime64[D]').astype(np.int64)
+
+
+class ActivityIndex:
+    """Distinct active days per user, sorted, in CSR layout."""
+
+    def __init__(self, users, events):
+        self.user_ids = users['user_id'].to_numpy()
+        self.num_users = len(users)
+
+        codes = pd.Index(users['user_id']).get_indexer(events['user_id'])
+        event_days = epoch_days(events['timestamp'])[codes >= 0]
+        codes = codes[codes >= 0]
+        signup_days = epoch_days(users['joined_at'])
+
+        # Day numbers are stored relative to the earliest signup or event
+        all_days = np.concatenate([signup_days, event_days])
+        self.base_day = int(all_days.min()) if all_days.size else 0
+        self.last_day = int(event_days.max()) - self.base_day if event_days.size else -1
+        self.span = int(all_days.max()) - self.base_day + 1 if all_days.size else 1
+        self.signup_days = signup_days - self.base_day
+
+        self.keys = np.unique(codes.astype(np.int64) * self.span + (event_days - self.base_day))
+        self.pair_users = self.keys // self.span
+        self.pair_days = self.keys % self.span
+        self.offsets = np.searchsorted(self.pair_users, np.arange(self.num_users + 1))
+
+    def date(self, day):
+        return (np.datetime64(self.base_day + int(day), 'D')).astype(str)
+
+    def retention(self, day_numbers, user_mask=None):
+        """Bounded and unbounded day-N retention for each N.
+
+        Bounded: active exactly N days after signup. Unbounded: active on day N
+        or any later day. Only users whose day N is not after the last day of
+        data are eligible. Returns a list of (eligible, bounded, unbounded) counts.
+        """
+        users = np.arange(self.num_users) if user_mask is None else np.flatnonzero(user_mask)
+        signup = self.signup_days[users]
+        base = users * self.span
+        end = self.offsets[users + 1]
+
+        results = []
+        for n in day_numbers:
+            eligible = signup + n <= self.last_day
+            query = base + signup + n
+            pos = np.searchsorted(self.keys, query)
+            unbounded = eligible & (pos < end)
+            bounded = unbounded & (self.keys[np.minimum(pos, len(self.keys) - 1)] == query)
+            results.append((int(eligible.sum()), int(bounded.sum()), int(unbounded.sum())))
+        return results
+
+    def rolling_active(self, windows, user_mask=None):
+        """Distinct active users over trailing windows of each length, for every day.
+
+        A user active on day d counts in every window ending on d .. d + w - 1,
+        up to (not including) their next active day, which takes over. Adding
+        +1 at the start and -1 at the end of each such run and taking a prefix
+        sum gives exact distinct counts in O(pairs + days).
+        """
+        days = self.pair_days
+        users = self.pair_users
+        if user_mask is not None:
+            keep = user_mask[users]
+            days, users = days[keep], users[keep]
+
+        num_days = self.last_day + 1
+        same_user_next = np.empty(len(days), dtype=bool)
+        same_user_next[:-1] = users[1:] == users[:-1]
+        same_user_next[-1:] = False
+        next_day = np.where(same_user_next, np.roll(days, -1), np.iinfo(np.int64).max)
+
+        counts = {}
+        for w in windows:
+            stop = np.minimum(days + w, next_day)
+            delta = np.bincount(days, minlength=num_days + w) - np.bincount(stop, minlength=num_days + w)
+            counts[w] = np.cumsum(delta)[:num_days]
+        return counts
@@ -0,0 +1,114 @@
+"""Deterministic user sampling for approximate analytics queries.
+
+Users are hashed to a stable point in [0, 1); a sample at rate r keeps every
+user below r together with all of their events. Because membership depends
+only on the user id, samples are nested (the 1% sample is a subset of the 10%
+one), identical across processes and restarts, and unbiased with respect to
+time, unlike ``head()``.
+
+Estimates are Horvitz-Thompson totals (sampled total / r) and ratio
+estimators, with normal-approximation confidence intervals for Poisson
+sampling of users.
+"""
+import math
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+# Sample rates prepared at load time
+SAMPLE_RATES = (0.01, 0.1)
+
+# Fixed 16-byte key so hashes are stable across processes and releases
+HASH_KEY = 'vizsprints-users'
+
+
+class Sample:
+    """Users and events of one sampled population."""
+
+    def __init__(self, rate, users, events, population_users, max_timestamp):
+        self.rate = rate
+        self.users = users
+        self.events = events
+        self.population_users = population_users
+        # Taken from the full event table so time windows match unsampled queries
+        self.max_timestamp = max_timestamp
+
+    def info(self, confidence_level):
+        return {
+            'rate': self.rate,
+            'sampled_users': int(len(self.users)),
+            'sampled_events': int(len(self.events)),
+            'confidence_level': confidence_level
+        }
+
+
+def user_hash_unit(user_ids):
+    """Map user ids to deterministic, uniformly distributed floats in [0, 1)."""
+    values = np.asarray(user_ids, dtype=object).astype(str).astype(object)
+    hashed = pd.util.hash_array(values, hash_key=HASH_KEY, categorize=False)
+    return (hashed >> np.uint64(11)).astype(np.float64) / float(1 << 53)
+
+
+def build_samples(users_df, events_df, rates=SAMPLE_RATES):
+    """Build nested samples for every rate, largest first so smaller ones filter less data."""
+    units = user_hash_unit(users_df['user_id'])
+    max_timestamp = events_df['timestamp'].max() if len(events_df) else None
+
+    samples = {}
+    users, events = users_df, events_df
+    for rate in sorted(rates, reverse=True):
+        keep = units < rate
+        sampled_users = users_df[keep]
+        # Filter the previous (larger) sample's events: samples are nested
+        events = events[events['user_id'].isin(sampled_users['user_id'])]
+        samples[rate] = Sample(rate, sampled_users, events, len(users_df), max_timestamp)
+    return samples
+
+
+def z_value(confidence_level):
+    return NormalDist().inv_cdf(0.5 + confidence_level / 2)
+
+
+def _interval(estimate, se, z, lower_bound=0.0, upper_bound=math.inf):
+    return [max(lower_bound, estimate - z * se), min(upper_bound, estimate + z * se)]
+
+
+def estimate_total(values, rate, z):
+    """Horvitz-Thompson total of per-user values over the population.
+
+    Returns (estimate, [low, high]). For Poisson sampling with inclusion
+    probability r, Var = (1 - r) / r^2 * sum(y_i^2).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    estimate = values.sum() / rate
+    se = math.sqrt((1 - rate) * np.square(values).sum()) / rate
+    return estimate, _interval(estimate, se, z)
+
+
+def estimate_count(sampled_count, rate, z):
+    """Population count of users with a property, from how many sampled users have it."""
+    estimate = sampled_count / rate
+    se = math.sqrt((1 - rate) * sampled_count) / rate
+    return estimate, _interval(estimate, se, z)
+
+
+def estimate_ratio(numerators, denominators, rate, z, upper_bound=math.inf):
+    """Ratio of two population totals, e.g. converted users / all users.
+
+    Uses the linearised variance of the ratio estimator:
+    Var(R) ~= (1 - r) / r^2 * sum((y_i - R x_i)^2) / X^2.
+    """
+    y = np.asarray(numerators, dtype=np.float64)
+    x = np.asarray(denominators, dtype=np.float64)
+    x_total = x.sum()
+    if x_total == 0:
+        return 0.0, [0.0, 0.0]
+    ratio = y.sum() / x_total
+    residual = y - ratio * x
+    se = math.sqrt((1 - rate) * np.square(residual).sum()) / x_total
+    return ratio, _interval(ratio, se, z, upper_bound=upper_bound)
+
+
+def rounded(interval, digits=2):
+    return [round(float(v), digits) for v in interval]
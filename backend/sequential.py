@@ -0,0 +1,278 @@
+"""Always-valid sequential monitoring of A/B experiments.
+
+Each monitored experiment (metric, control variant, mixing scale tau) keeps
+its state between checks: which users have converted, cumulative daily
+counts per variant and the always-valid p-value history. A check only reads
+the event rows appended since the previous one, so it costs O(new events)
+(plus O(new users) when users were added) rather than a full recompute.
+
+The statistic is the mixture sequential probability ratio test (mSPRT) for a
+difference of two proportions with a N(0, tau^2) mixing distribution
+(Johari et al., "Always Valid Inference"). With theta the observed rate
+difference and V its variance,
+
+    Lambda = sqrt(V / (V + tau^2)) * exp(theta^2 tau^2 / (2 V (V + tau^2)))
+
+and the always-valid p-value is the running minimum of 1 / Lambda, so it may
+be checked after every day without inflating the false positive rate.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from retention import epoch_days
+
+DEFAULT_TAU = 0.05
+
+# Monitored experiments kept at once (each holds per-user state); the least recently checked go first
+MAX_TESTS = 32
+
+_tests = OrderedDict()
+_tests_lock = threading.Lock()
+
+
+def msprt_p_values(conv_c, n_c, conv_t, n_t, tau, previous=1.0):
+    """Always-valid p-values for successive looks (arrays in time order)."""
+    conv_c, n_c, conv_t, n_t = (np.asarray(a, dtype=np.float64) for a in (conv_c, n_c, conv_t, n_t))
+    tau2 = tau * tau
+    with np.errstate(divide='ignore', invalid='ignore'):
+        p_c = conv_c / n_c
+        p_t = conv_t / n_t
+        theta = p_t - p_c
+        v = p_c * (1 - p_c) / n_c + p_t * (1 - p_t) / n_t
+        log_lambda = 0.5 * np.log(v / (v + tau2)) + theta * theta * tau2 / (2 * v * (v + tau2))
+    # No information yet (no users, or no variance): the likelihood ratio is 1
+    log_lambda = np.where(np.isfinite(log_lambda) & (v > 0), log_lambda, 0.0)
+    p = np.minimum(1.0, np.exp(-log_lambda))
+    return np.minimum.accumulate(np.concatenate([[previous], p]))[1:], theta
+
+
+def _boundary(frame, column):
+    """Fingerprint of the last processed row, to detect rewrites rather than appends."""
+    if column not in frame.columns:
+        column = frame.columns[0]
+    return frame[column].iloc[-1] if len(frame) else None
+
+
+class SequentialTest:
+    """Incrementally updated mSPRT state for one metric, every variant against the control."""
+
+    def __init__(self, metric, control, tau):
+        self.metric = metric
+        self.control = control
+        self.tau = tau
+        self.lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.rebuilds = getattr(self, 'rebuilds', -1) + 1
+        self.variants = []
+        self.user_index = pd.Index([])
+        self.variant_codes = np.zeros(0, dtype=np.int64)
+        self.joined_days = []
+        self.converted = np.zeros(0, dtype=bool)
+        self.events_seen = 0
+        self.users_seen = 0
+        self.event_boundary = None
+        self.user_boundary = None
+        # Latest day seen in any processed event or signup
+        self.max_day = None
+        # History, one entry per checked day
+        self.days = np.zeros(0, dtype=np.int64)
+        self.users = np.zeros((0, 0), dtype=np.int64)
+        self.conversions = np.zeros((0, 0), dtype=np.int64)
+        self.p_values = np.zeros((0, 0))
+        self.diffs = np.zeros((0, 0))
+        self.last_check = None
+
+    def _is_append(self, users, events):
+        return (len(events) >= self.events_seen and len(users) >= self.users_seen
+                and (self.events_seen == 0 or _boundary(events.iloc[:self.events_seen], 'event_id') == self.event_boundary)
+                and (self.users_seen == 0 or _boundary(users.iloc[:self.users_seen], 'user_id') == self.user_boundary))
+
+    def _add_users(self, users):
+        """Index newly appended users; returns whether there were any."""
+        if len(users) == self.users_seen:
+            return False
+        variants = sorted(users['ab_variant'].astype(str).unique())
+        if self.control not in variants:
+            raise ValueError(f"Unknown control variant '{self.control}'")
+        if self.variants and variants != self.variants:
+            # A new variant changes every series: start over
+            self._reset()
+        self.variants = variants
+        # Row order is append-only, so existing user codes stay valid
+        self.user_index = pd.Index(users['user_id'])
+        self.variant_codes = pd.Index(variants).get_indexer(users['ab_variant'].astype(str))
+        joined = epoch_days(users['joined_at'])
+        self.joined_days = [np.sort(joined[self.variant_codes == v]) for v in range(len(variants))]
+        self._see_day(joined)
+        self.converted = np.concatenate([self.converted, np.zeros(len(users) - self.users_seen, dtype=bool)])
+        self.users_seen = len(users)
+        self.user_boundary = _boundary(users, 'user_id')
+        return True
+
+    def update(self, users, events):
+        """Fold newly appended users/events into the state; returns the number of new event rows."""
+        with self.lock:
+            if not self._is_append(users, events):
+                self._reset()
+            users_added = self._add_users(users)
+
+            new_events = events.iloc[self.events_seen:]
+            if len(new_events) == 0 and not users_added and self.days.size:
+                self.last_check = time.time()
+                return 0
+
+            self._see_day(epoch_days(new_events['timestamp']))
+
+            # First conversion of each not-yet-converted user among the new rows
+            hits = new_events[new_events['event_name'] == self.metric]
+            codes = self.user_index.get_indexer(hits['user_id'])
+            days = epoch_days(hits['timestamp'])
+            keep = codes >= 0
+            codes, days = codes[keep], days[keep]
+            order = np.argsort(days, kind='stable')
+            codes, days = codes[order], days[order]
+            codes, first = np.unique(codes, return_index=True)
+            days = days[first]
+            fresh = ~self.converted[codes]
+            codes, days = codes[fresh], days[fresh]
+            self.converted[codes] = True
+
+            self._extend_history(codes, days)
+            self.events_seen = len(events)
+            self.event_boundary = _boundary(events, 'event_id')
+            self.last_check = time.time()
+            return len(new_events)
+
+    def _see_day(self, days):
+        if len(days):
+            latest = int(days.max())
+            self.max_day = latest if self.max_day is None else max(self.max_day, latest)
+
+    def _extend_history(self, codes, days):
+        num_variants = len(self.variants)
+        last_day = self.max_day
+        if last_day is None:
+            # No users or events yet: nothing to look at
+            return
+
+        if self.days.size:
+            # The last checked day may still be filling up: re-check it in place
+            start = self.days[-1]
+            base = self.conversions[-1]
+            keep = slice(0, -1)
+        else:
+            start = min(days.min() if days.size else last_day,
+                        min((d[0] for d in self.joined_days if d.size), default=last_day))
+            base = np.zeros(num_variants, dtype=np.int64)
+            keep = slice(0, 0)
+        look_days = np.arange(start, last_day + 1)
+
+        # Late events (before the re-checked day) count from the next look on
+        days = np.maximum(days, start)
+        variant_of = self.variant_codes[codes]
+        users_by_day = np.empty((len(look_days), num_variants), dtype=np.int64)
+        conversions_by_day = np.empty_like(users_by_day)
+        for v in range(num_variants):
+            users_by_day[:, v] = np.searchsorted(self.joined_days[v], look_days, side='right')
+            conversions_by_day[:, v] = base[v] + np.searchsorted(np.sort(days[variant_of == v]), look_days, side='right')
+
+        control = self.variants.index(self.control)
+        treatments = [v for v in range(num_variants) if v != control]
+        previous = self.p_values[keep][-1] if self.p_values[keep].size else np.ones(len(treatments))
+        p_values = np.empty((len(look_days), len(treatments)))
+        diffs = np.empty_like(p_values)
+        for i, v in enumerate(treatments):
+            p_values[:, i], diffs[:, i] = msprt_p_values(
+                conversions_by_day[:, control], users_by_day[:, control],
+                conversions_by_day[:, v], users_by_day[:, v], self.tau, previous[i])
+
+        self.days = np.concatenate([self.days[keep], look_days])
+        self.users = np.concatenate([self.users[keep].reshape(-1, num_variants), users_by_day])
+        self.conversions = np.concatenate([self.conversions[keep].reshape(-1, num_variants), conversions_by_day])
+        self.p_values = np.concatenate([self.p_values[keep].reshape(-1, len(treatments)), p_values])
+        self.diffs = np.concatenate([self.diffs[keep].reshape(-1, len(treatments)), diffs])
+
+    def summary(self, alpha):
+        """The current state as a JSON-ready dict, read under the lock so a concurrent update is never seen half done."""
+        with self.lock:
+            return self._summary(alpha)
+
+    def _summary(self, alpha):
+        treatments = [v for v in self.variants if v != self.control]
+        dates = pd.to_datetime(self.days, unit='D').strftime('%Y-%m-%d').tolist()
+
+        def rate(conv, n):
+            return round(float(conv) / float(n) * 100, 2) if n else 0.0
+
+        comparisons = []
+        for i, variant in enumerate(treatments):
+            crossed = np.flatnonzero(self.p_values[:, i] < alpha)
+            comparisons.append({
+                'variant': variant,
+                'diff': round(float(self.diffs[-1, i]) * 100, 2) if np.isfinite(self.diffs[-1, i]) else None,
+                'always_valid_p': round(float(self.p_values[-1, i]), 4),
+                'significant': bool(crossed.size),
+                'significant_since': dates[crossed[0]] if crossed.size else None
+            })
+
+        return {
+            'metric': self.metric,
+            'control': self.control,
+            'variants': self.variants,
+            'tau': self.tau,
+            'alpha': alpha,
+            'current': {
+                variant: {
+                    'users': int(self.users[-1, v]),
+                    'conversions': int(self.conversions[-1, v]),
+                    'conversion_rate': rate(self.conversions[-1, v], self.users[-1, v])
+                } for v, variant in enumerate(self.variants)
+            },
+            'comparisons': comparisons,
+            'history': {
+                'dates': dates,
+                'users': {variant: self.users[:, v].tolist() for v, variant in enumerate(self.variants)},
+                'conversions': {variant: self.conversions[:, v].tolist() for v, variant in enumerate(self.variants)},
+                'diff': {variant: np.round(self.diffs[:, i] * 100, 4).tolist() for i, variant in enumerate(treatments)},
+                'always_valid_p': {variant: np.round(self.p_values[:, i], 6).tolist()
+                                   for i, variant in enumerate(treatments)}
+            },
+            'state': {
+                'events_processed': self.events_seen,
+                'users_processed': self.users_seen,
+                'rebuilds': self.rebuilds
+            }
+        }
+
+
+def get_test(metric, control, tau, dataset=None, variants=None):
+    """The monitored experiment for (metric, control, tau) on a dataset, created on first use.
+
+    variants: the A/B variants of the data; a control outside them raises
+    ValueError before anything is kept. At most MAX_TESTS experiments are
+    kept, the least recently checked one is dropped first (and rebuilt from
+    scratch if asked for again).
+    """
+    if variants is not None and control not in variants:
+        raise ValueError(f"Unknown control variant '{control}'")
+    key = (metric, control, tau, dataset)
+    with _tests_lock:
+        test = _tests.get(key)
+        if test is None:
+            test = _tests[key] = SequentialTest(metric, control, tau)
+            while len(_tests) > MAX_TESTS:
+                _tests.popitem(last=False)
+        else:
+            _tests.move_to_end(key)
+        return test
+
+
+def reset_all():
+    with _tests_lock:
+        _tests.clear()
@@ -0,0 +1,114 @@
+"""Immutable, versioned views of the data the API serves.
+
+``load_data()`` and ``refresh_data()`` never change the frames a request may
+be reading: they build new ones, wrap them in a new ``Snapshot`` and swap it
+in with a single assignment. A request takes the current snapshot once
+(``app._snapshot()``) and passes it to everything it calls, so it works on
+one consistent version even when a refresh lands mid-request, and reading
+needs no lock.
+
+The numeric and timestamp arrays of a snapshot are made read-only, so code
+that writes into shared data fails loudly (``ValueError: assignment
+destination is read-only``) instead of corrupting other requests. Handlers
+build new frames or plain records for their output rather than copying the
+tables.
+
+Structures built from a snapshot once (the cube, samples, indexes) are
+memoised on it (``derived``, see ``cache.SnapshotCache``) and are dropped with
+it.
+"""
+import itertools
+import threading
+import time
+
+import datasets
+
+_versions = itertools.count(1)
+_versions_lock = threading.Lock()
+
+# Whether the unfreezable-pandas warning was printed
+_warned = False
+
+
+def freezable(frame):
+    """Whether this pandas exposes the internals freeze() needs.
+
+    pandas has no public way to make a frame's own storage read-only, so
+    freeze() reaches into its block manager (``frame._mgr.arrays``, the
+    ``_ndarray`` of extension arrays) and item cache
+    (``frame._clear_item_cache``). These are private and only known to behave
+    with the pandas pinned in requirements.txt (2.1.x); copy-on-write pandas
+    (3.x) drops the item cache. tests/test_snapshot.py fails when they go
+    away, so an upgrade has to revisit freeze().
+    """
+    return hasattr(frame, '_mgr') and hasattr(frame._mgr, 'arrays') and hasattr(frame, '_clear_item_cache')
+
+
+def freeze(frame):
+    """Mark the numeric and timestamp column arrays of frame read-only; returns frame.
+
+    Object (string) columns stay writable: pandas' object comparison kernels
+    (``frame[column] == value``) reject read-only buffers. With a pandas
+    lacking the internals this relies on (see freezable), frames are served
+    writable and a warning is printed.
+    """
+    global _warned
+    if not freezable(frame):
+        if not _warned:
+            _warned = True
+            import pandas as pd
+            print(f"Warning: pandas {pd.__version__} lacks the internals snapshot.freeze uses; "
+                  "snapshots are not read-only")
+        return frame
+    for values in frame._mgr.arrays:
+        # Extension arrays (tz-aware timestamps, categoricals) keep a numpy array in _ndarray
+        values = getattr(values, '_ndarray', values)
+        if hasattr(values, 'flags') and values.dtype != object:
+            values.flags.writeable = False
+    # Columns looked up before hold views taken while the arrays were writable
+    frame._clear_item_cache()
+    return frame
+
+
+class Snapshot:
+    """Users and events of one data version, with what was loaded alongside them."""
+
+    __slots__ = ('users', 'events', 'version', 'data_version', 'summaries', 'dataset', 'created_at', 'derived',
+                 '__weakref__')
+
+    def __init__(self, users, events, data_version=None, summaries=None, dataset=datasets.DEFAULT):
+        with _versions_lock:
+            version = next(_versions)
+        for name, value in (('users', freeze(users)), ('events', freeze(events)), ('version', version),
+                            # Database version (result_cache.data_version), None for frames from elsewhere
+                            ('data_version', data_version),
+                            # Summary tables built from exactly these frames, if any
+                            ('summaries', summaries),
+                            # Name of the dataset (datasets.py) the frames belong to
+                            ('dataset', dataset),
+                            ('created_at', time.time()),
+                            # Values computed from the frames, filled by cache.SnapshotCache
+                            ('derived', {})):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Snapshot is immutable; build a new one")
+
+    def __delattr__(self, name):
+        raise AttributeError("Snapshot is immutable; build a new one")
+
+    @property
+    def sources(self):
+        """The frames results derived from this snapshot are cached against (see cache.py)"""
+        return (self.users, self.events)
+
+    def info(self):
+        return {
+            'version': self.version,
+            'data_version': self.data_version,
+            'users': int(len(self.users)),
+            'events': int(len(self.events)),
+            'summaries': self.summaries is not None,
+            'dataset': self.dataset,
+            'created_at': self.created_at
+        }
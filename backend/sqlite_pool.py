@@ -0,0 +1,208 @@
+"""Pooled read-only connections to the SQLite database.
+
+Every SQL read the backend makes (loading the tables, event metadata,
+summaries, the cube) goes through a ``ConnectionPool``:
+
+* connections are opened read-only (``mode=ro``), and with ``immutable=1``
+  when the database file cannot change under them (the process cannot write
+  it, as in a deployed bundle), which also skips file locking;
+* each connection maps the file into memory (``mmap_size``), keeps a larger
+  page cache and holds its prepared statements (``cached_statements``), so a
+  query repeated on a warm connection is neither re-parsed nor re-read;
+* at most ``size`` connections exist; requests beyond that wait for one to
+  be returned instead of opening more, which keeps latency under concurrency
+  predictable;
+* queries slower than ``slow_ms`` are recorded with their ``EXPLAIN QUERY
+  PLAN`` so a missing index shows up in ``/api/debug/sql``.
+"""
+import os
+import queue
+import sqlite3
+import threading
+import time
+import urllib.parse
+from collections import deque
+from contextlib import contextmanager
+
+DEFAULT_SIZE = 4
+DEFAULT_MMAP_BYTES = 256 * 1024 * 1024
+DEFAULT_CACHE_KIB = 16 * 1024
+
+# Prepared statements kept per connection
+STATEMENT_CACHE = 256
+
+SLOW_QUERY_MS = float(os.environ.get('VIZSPRINTS_SLOW_QUERY_MS', 50))
+SLOW_QUERY_HISTORY = 50
+
+
+def read_only_uri(db_file, immutable=False):
+    uri = f"file:{urllib.parse.quote(os.path.abspath(db_file))}?mode=ro"
+    return uri + '&immutable=1' if immutable else uri
+
+
+def _file_identity(db_file):
+    try:
+        stat = os.stat(db_file)
+    except OSError:
+        return None
+    return (stat.st_dev, stat.st_ino)
+
+
+class ConnectionPool:
+    """Thread-safe pool of read-only connections to one database file."""
+
+    def __init__(self, db_file, size=DEFAULT_SIZE, immutable=None, mmap_bytes=DEFAULT_MMAP_BYTES,
+                 cache_kib=DEFAULT_CACHE_KIB, slow_ms=SLOW_QUERY_MS, timeout=30.0):
+        self.db_file = db_file
+        self.size = size
+        # Only files that cannot change under us may be opened immutable
+        self.immutable = not os.access(db_file, os.W_OK) if immutable is None else immutable
+        self.mmap_bytes = mmap_bytes
+        self.cache_kib = cache_kib
+        self.slow_ms = slow_ms
+        self.timeout = timeout
+        self.identity = _file_identity(db_file)
+
+        self.lock = threading.Lock()
+        self._idle = queue.LifoQueue()
+        self._open_count = 0
+        self._closed = False
+        self.acquires = 0
+        self.waits = 0
+        self.wait_ms = 0.0
+        self.queries = 0
+        self.query_ms = 0.0
+        self.slow_queries = deque(maxlen=SLOW_QUERY_HISTORY)
+
+    def _open(self):
+        conn = sqlite3.connect(read_only_uri(self.db_file, self.immutable), uri=True,
+                               check_same_thread=False, cached_statements=STATEMENT_CACHE)
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_bytes)}")
+        conn.execute(f"PRAGMA cache_size = -{int(self.cache_kib)}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        return conn
+
+    def _acquire(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = None
+        if conn is None:
+            with self.lock:
+                grow = self._open_count < self.size
+                if grow:
+                    self._open_count += 1
+            if grow:
+                try:
+                    conn = self._open()
+                except Exception:
+                    with self.lock:
+                        self._open_count -= 1
+                    raise
+            else:
+                start = time.perf_counter()
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise TimeoutError(f"No database connection free after {self.timeout}s") from None
+                with self.lock:
+                    self.waits += 1
+                    self.wait_ms += (time.perf_counter() - start) * 1000
+        with self.lock:
+            self.acquires += 1
+        return conn
+
+    def _release(self, conn):
+        with self.lock:
+            closed = self._closed
+            if closed:
+                self._open_count -= 1
+        if closed:
+            conn.close()
+        else:
+            self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        """A pooled connection for the duration of the block."""
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._release(conn)
+
+    def _record(self, conn, sql, params, elapsed_ms):
+        with self.lock:
+            self.queries += 1
+            self.query_ms += elapsed_ms
+        if elapsed_ms < self.slow_ms:
+            return
+        try:
+            plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+        except sqlite3.Error as e:
+            plan = [f"(no plan: {e})"]
+        with self.lock:
+            self.slow_queries.append({
+                'sql': ' '.join(sql.split()),
+                'params': len(params),
+                'elapsed_ms': round(elapsed_ms, 3),
+                'plan': plan,
+                'at': time.time()
+            })
+
+    def execute(self, sql, params=()):
+        """All rows of a query."""
+        with self.connection() as conn:
+            start = time.perf_counter()
+            rows = conn.execute(sql, params).fetchall()
+            self._record(conn, sql, params, (time.perf_counter() - start) * 1000)
+        return rows
+
+    def read_frame(self, sql, params=()):
+        """A query's rows as a DataFrame."""
+        import pandas as pd
+        with self.connection() as conn:
+            start = time.perf_counter()
+            frame = pd.read_sql_query(sql, conn, params=params)
+            self._record(conn, sql, params, (time.perf_counter() - start) * 1000)
+        return frame
+
+    def is_current(self, db_file=None):
+        """Whether the pool still reads db_file (default: its own) as it is on disk now.
+
+        A full init_db load replaces the file; connections opened before keep
+        reading the old one.
+        """
+        if db_file is not None and os.path.abspath(db_file) != os.path.abspath(self.db_file):
+            return False
+        return not self._closed and _file_identity(self.db_file) == self.identity
+
+    def close(self):
+        """Close idle connections now and the others as they are returned."""
+        with self.lock:
+            self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            with self.lock:
+                self._open_count -= 1
+            conn.close()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'db_file': self.db_file,
+                'immutable': self.immutable,
+                'size': self.size,
+                'open_connections': self._open_count,
+                'idle_connections': self._idle.qsize(),
+                'acquires': self.acquires,
+                'waits': self.waits,
+                'wait_ms': round(self.wait_ms, 3),
+                'queries': self.queries,
+                'query_ms': round(self.query_ms, 3),
+                'slow_ms': self.slow_ms,
+                'slow_queries': list(self.slow_queries)
+            }
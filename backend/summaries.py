@@ -0,0 +1,208 @@
+"""Summary tables maintained next to the raw tables in SQLite.
+
+``init_db.py`` builds them after a full load and refreshes them after an
+append, touching only what the new rows can change:
+
+=========================  ==========================================  =====================================
+table                      one row per                                 refreshed after an append by
+=========================  ==========================================  =====================================
+summary_daily_active       day: distinct active users                  recounting the days of the new events
+summary_daily_signups      day: users who joined                       adding the new users
+summary_user_stages        (user, event name): first timestamp         MIN-upserting the new events
+summary_user_sessions      user: events, sessions, hours, first/last   recomputing the users with new events
+summary_cohorts            (signup month, months since): active users  adding (user, month) pairs not seen yet
+=========================  ==========================================  =====================================
+
+The backend loads them (they are small next to the events) and answers the
+funnel, metrics, KPI time series, user sessions and cohorts endpoints from
+them, as long as they were built from exactly the events it loaded.
+"""
+import pandas as pd
+
+META_TABLE = 'summary_meta'
+
+# Same inactivity timeout the user-sessions endpoint uses, in seconds
+SESSION_TIMEOUT_SECONDS = 30 * 60
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS summary_daily_active (day TEXT PRIMARY KEY, users INTEGER NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS summary_daily_signups (day TEXT PRIMARY KEY, signups INTEGER NOT NULL)",
+    """CREATE TABLE IF NOT EXISTS summary_user_stages (
+        user_key INTEGER NOT NULL,
+        event_name TEXT NOT NULL,
+        first_timestamp INTEGER NOT NULL,
+        PRIMARY KEY (user_key, event_name)
+    )""",
+    """CREATE TABLE IF NOT EXISTS summary_user_sessions (
+        user_key INTEGER PRIMARY KEY,
+        events INTEGER NOT NULL,
+        total_sessions INTEGER NOT NULL,
+        total_hours REAL NOT NULL,
+        first_activity INTEGER NOT NULL,
+        last_activity INTEGER NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS summary_cohorts (
+        cohort_month TEXT NOT NULL,
+        months_since_join INTEGER NOT NULL,
+        users INTEGER NOT NULL,
+        PRIMARY KEY (cohort_month, months_since_join)
+    )""",
+]
+
+TABLES = ['summary_daily_active', 'summary_daily_signups', 'summary_user_stages',
+          'summary_user_sessions', 'summary_cohorts']
+
+# Per-user sessions (a gap of more than the timeout starts a new one); single-event sessions count one minute
+_USER_SESSIONS = f"""
+WITH ordered AS (
+    SELECT user_key, timestamp,
+           timestamp - LAG(timestamp) OVER (PARTITION BY user_key ORDER BY timestamp) AS gap
+    FROM events WHERE {{users}}
+), numbered AS (
+    SELECT user_key, timestamp,
+           SUM(CASE WHEN gap IS NULL OR gap > {SESSION_TIMEOUT_SECONDS} THEN 1 ELSE 0 END)
+               OVER (PARTITION BY user_key ORDER BY timestamp ROWS UNBOUNDED PRECEDING) AS session
+    FROM ordered
+), sessions AS (
+    SELECT user_key, MIN(timestamp) AS session_start, MAX(timestamp) AS session_end, COUNT(*) AS events
+    FROM numbered GROUP BY user_key, session
+)
+INSERT OR REPLACE INTO summary_user_sessions
+SELECT user_key, SUM(events), COUNT(*),
+       SUM(CASE WHEN events = 1 THEN 1.0 / 60 ELSE (session_end - session_start) / 3600.0 END),
+       MIN(session_start), MAX(session_end)
+FROM sessions GROUP BY user_key
+"""
+
+_MONTH_INDEX = "(CAST(strftime('%Y', {0}, 'unixepoch') AS INTEGER) * 12 + CAST(strftime('%m', {0}, 'unixepoch') AS INTEGER))"
+
+# Distinct (user, event month) pairs of events after a rowid, as month indexes
+_NEW_PAIRS = f"""
+CREATE TEMP TABLE new_pairs AS
+SELECT DISTINCT user_key, {_MONTH_INDEX.format('timestamp')} AS month FROM events WHERE rowid > ?
+"""
+
+_ADD_COHORT_PAIRS = f"""
+INSERT INTO summary_cohorts
+SELECT strftime('%Y-%m', u.joined_at, 'unixepoch'), p.month - {_MONTH_INDEX.format('u.joined_at')}, COUNT(*)
+FROM new_pairs p JOIN users u ON u.user_key = p.user_key
+WHERE true  -- keeps ON CONFLICT from parsing as a join constraint
+GROUP BY 1, 2
+ON CONFLICT (cohort_month, months_since_join) DO UPDATE SET users = users + excluded.users
+"""
+
+
+def _recount_days(conn, days):
+    for day in days:
+        conn.execute("INSERT OR REPLACE INTO summary_daily_active "
+                     "SELECT ?, COUNT(DISTINCT user_key) FROM events "
+                     "WHERE timestamp >= CAST(strftime('%s', ?) AS INTEGER) "
+                     "AND timestamp < CAST(strftime('%s', ?, '+1 day') AS INTEGER)", (day, day, day))
+
+
+def refresh(conn, after_rowid=0, after_user_key=0):
+    """Fold events stored after rowid `after_rowid` and users after `after_user_key` into the summaries.
+
+    With the defaults (nothing loaded before) this builds them from scratch.
+    """
+    for statement in SCHEMA:
+        conn.execute(statement)
+
+    conn.execute("INSERT INTO summary_daily_signups "
+                 "SELECT date(joined_at, 'unixepoch'), COUNT(*) FROM users WHERE user_key > ? GROUP BY 1 "
+                 "ON CONFLICT (day) DO UPDATE SET signups = signups + excluded.signups", (after_user_key,))
+
+    if after_rowid == 0:
+        conn.execute("INSERT OR REPLACE INTO summary_daily_active "
+                     "SELECT date(timestamp, 'unixepoch'), COUNT(DISTINCT user_key) FROM events GROUP BY 1")
+    else:
+        _recount_days(conn, [row[0] for row in conn.execute(
+            "SELECT DISTINCT date(timestamp, 'unixepoch') FROM events WHERE rowid > ?", (after_rowid,))])
+
+    conn.execute("INSERT INTO summary_user_stages "
+                 "SELECT user_key, event_name, MIN(timestamp) FROM events WHERE rowid > ? GROUP BY 1, 2 "
+                 "ON CONFLICT (user_key, event_name) DO UPDATE "
+                 "SET first_timestamp = MIN(first_timestamp, excluded.first_timestamp)", (after_rowid,))
+
+    if after_rowid == 0:
+        conn.execute(_USER_SESSIONS.format(users='true'))
+    else:
+        conn.execute("CREATE TEMP TABLE touched_users AS SELECT DISTINCT user_key FROM events WHERE rowid > ?",
+                     (after_rowid,))
+        conn.execute(_USER_SESSIONS.format(users='user_key IN (SELECT user_key FROM touched_users)'))
+        conn.execute("DROP TABLE touched_users")
+
+    conn.execute(_NEW_PAIRS, (after_rowid,))
+    if after_rowid:
+        # Pairs already active before the append were counted then
+        conn.execute(f"""DELETE FROM new_pairs WHERE EXISTS (
+            SELECT 1 FROM events e WHERE e.user_key = new_pairs.user_key AND e.rowid <= ?
+            AND {_MONTH_INDEX.format('e.timestamp')} = new_pairs.month)""", (after_rowid,))
+    conn.execute(_ADD_COHORT_PAIRS)
+    conn.execute("DROP TABLE new_pairs")
+
+
+def save_version(conn, version):
+    pd.DataFrame([version]).to_sql(META_TABLE, conn, if_exists='replace', index=False)
+
+
+class Summaries:
+    """The summary tables, loaded for answering requests."""
+
+    def __init__(self, daily_active, daily_signups, stage_users, user_sessions, cohorts):
+        self.daily_active = daily_active
+        self.daily_signups = daily_signups
+        self.stage_users = stage_users
+        self.user_sessions = user_sessions
+        self.cohorts = cohorts
+
+    @classmethod
+    def load(cls, conn, version):
+        """The stored summaries if they were built from data of this version, else None."""
+        try:
+            stored = pd.read_sql_query(f"SELECT * FROM {META_TABLE}", conn).iloc[0].to_dict()
+        except Exception:
+            return None
+        if int(stored['events']) != version['events'] or stored['max_timestamp'] != version['max_timestamp']:
+            return None
+
+        def timestamps(seconds):
+            return pd.to_datetime(seconds, unit='s', utc=True)
+
+        daily_active = pd.read_sql_query("SELECT day AS date, users AS dau FROM summary_daily_active", conn)
+        daily_signups = pd.read_sql_query("SELECT day AS date, signups FROM summary_daily_signups", conn)
+        stage_users = dict(conn.execute(
+            "SELECT event_name, COUNT(*) FROM summary_user_stages GROUP BY event_name").fetchall())
+        sessions = pd.read_sql_query(
+            "SELECT u.user_id, s.events, s.total_sessions, s.total_hours, s.first_activity, s.last_activity, "
+            "strftime('%Y-%m', u.joined_at, 'unixepoch') AS cohort_month "
+            "FROM summary_user_sessions s JOIN users u ON u.user_key = s.user_key ORDER BY u.user_id", conn)
+        sessions['first_activity'] = timestamps(sessions['first_activity'])
+        sessions['last_activity'] = timestamps(sessions['last_activity'])
+        cohorts = pd.read_sql_query("SELECT * FROM summary_cohorts ORDER BY cohort_month, months_since_join", conn)
+        return cls(daily_active, daily_signups, stage_users, sessions, cohorts)
+
+    @property
+    def total_events(self):
+        return int(self.user_sessions['events'].sum())
+
+    @property
+    def max_timestamp(self):
+        return self.user_sessions['last_activity'].max() if len(self.user_sessions) else None
+
+    def active_users(self, window):
+        """Users with an event in the `window` (a Timedelta) up to the latest event."""
+        latest = self.max_timestamp
+        if latest is None:
+            return 0
+        return int((self.user_sessions['last_activity'] >= latest - window).sum())
+
+    def cohort_counts(self):
+        """(cohort_data, cohort_sizes) as computed from raw events for /api/cohorts."""
+        cohort_data = self.cohorts.copy()
+        cohort_data['cohort_month'] = pd.PeriodIndex(cohort_data['cohort_month'], freq='M')
+        sizes = self.user_sessions.groupby('cohort_month').size()
+        cohort_sizes = pd.DataFrame({'cohort_month': pd.PeriodIndex(sizes.index, freq='M'),
+                                     'cohort_size': sizes.to_numpy()})
+        return cohort_data, cohort_sizes
+
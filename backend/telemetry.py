@@ -0,0 +1,212 @@
+"""In-process Prometheus metrics for the VizSprints API.
+
+Implements just enough of the Prometheus text exposition format (counters,
+gauges and histograms with labels) to be scraped without any client library
+or sidecar. Request metrics are recorded by hooks installed with
+``init_app``; everything else is sampled when ``/metrics`` is rendered.
+"""
+import math
+import os
+import sys
+import threading
+import time
+
+from flask import g, request
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Prometheus' default latency buckets, extended for slow analytics queries
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+        pairs.append(f'{name}="{escaped}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues):
+        return self._values.get(labelvalues, 0)
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            items = sorted(self._values.items())
+        for labelvalues, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def set(self, value, *labelvalues):
+        with self._lock:
+            self._values[labelvalues] = value
+
+    def value(self, *labelvalues):
+        return self._values.get(labelvalues)
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            items = sorted(self._values.items())
+        for labelvalues, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series = {}
+
+    def observe(self, value, *labelvalues):
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['counts'][i] += 1
+                    break
+            series['sum'] += value
+            series['count'] += 1
+
+    def count(self, *labelvalues):
+        series = self._series.get(labelvalues)
+        return series['count'] if series else 0
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            items = sorted((k, {'counts': list(v['counts']), 'sum': v['sum'], 'count': v['count']})
+                           for k, v in self._series.items())
+        names = self.labelnames + ('le',)
+        for labelvalues, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series['counts']):
+                cumulative += count
+                labels = _format_labels(names, labelvalues + (_format_value(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, labelvalues)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series['sum'])}")
+            lines.append(f"{self.name}_count{labels} {series['count']}")
+        return lines
+
+
+REQUESTS = Counter('vizsprints_http_requests_total', 'HTTP requests handled, by route, method and status.',
+                   ('route', 'method', 'status'))
+LATENCY = Histogram('vizsprints_http_request_duration_seconds', 'HTTP request latency in seconds, by route.',
+                    ('route', 'method'))
+DATA_LOAD_SECONDS = Gauge('vizsprints_data_load_duration_seconds', 'Duration of the last data load in seconds.')
+DATA_LOAD_TIMESTAMP = Gauge('vizsprints_data_load_timestamp_seconds', 'Unix time of the last successful data load.')
+
+_METRICS = [REQUESTS, LATENCY, DATA_LOAD_SECONDS, DATA_LOAD_TIMESTAMP]
+
+
+def record_data_load(seconds):
+    DATA_LOAD_SECONDS.set(seconds)
+    DATA_LOAD_TIMESTAMP.set(time.time())
+
+
+def process_rss_bytes():
+    """Current resident set size, falling back to the peak where /proc is unavailable."""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return peak_rss_bytes()
+
+
+def peak_rss_bytes():
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def render(extra_lines=()):
+    """Render all registered metrics plus caller-supplied sample lines."""
+    lines = []
+    for metric in _METRICS:
+        lines.extend(metric.render())
+    lines.extend(extra_lines)
+    return '\n'.join(lines) + '\n'
+
+
+def sample_lines(name, documentation, kind, samples, labelnames=()):
+    """Render an ad-hoc metric from (labelvalues, value) pairs sampled at scrape time."""
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} {kind}"]
+    for labelvalues, value in samples:
+        lines.append(f"{name}{_format_labels(labelnames, labelvalues)} {_format_value(value)}")
+    return lines
+
+
+def init_app(app):
+    """Count and time every request."""
+
+    @app.before_request
+    def _start_request_metrics():
+        g._telemetry_start = time.perf_counter()
+
+    @app.after_request
+    def _finish_request_metrics(response):
+        start = getattr(g, '_telemetry_start', None)
+        if start is None:
+            return response
+        # Label by URL rule, not path, so ids in URLs cannot blow up cardinality
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        REQUESTS.inc(route, request.method, str(response.status_code))
+        LATENCY.observe(time.perf_counter() - start, route, request.method)
+        return response
@@ -0,0 +1,99 @@
+import unittest
+import json
+import sys
+import os
+from statistics import NormalDist
+
+import numpy as np
+
+# Add backend directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app
+import abstats
+
+
+class TestVectorizedABStats(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+
+    def test_normal_functions_match_statistics_module(self):
+        xs = np.linspace(-6, 6, 61)
+        expected = np.array([NormalDist().cdf(x) for x in xs])
+        np.testing.assert_allclose(abstats.norm_cdf(xs), expected, atol=1e-7)
+
+        ps = np.array([1e-6, 0.001, 0.025, 0.3, 0.5, 0.8, 0.975, 0.999])
+        expected = np.array([NormalDist().inv_cdf(p) for p in ps])
+        np.testing.assert_allclose(abstats.norm_ppf(ps), expected, rtol=1e-8, atol=1e-12)
+
+    def test_corrections(self):
+        p = np.array([0.01, 0.04, 0.03, np.nan, 0.005])
+        # Holm: sorted 0.005, 0.01, 0.03, 0.04 times 4, 3, 2, 1 then running max
+        np.testing.assert_allclose(abstats.holm_adjust(p), [0.03, 0.06, 0.06, np.nan, 0.02])
+        # BH: sorted p * 4 / rank, then running min from the top
+        np.testing.assert_allclose(abstats.bh_adjust(p), [0.02, 0.04, 0.04, np.nan, 0.02])
+
+    def test_report_matches_single_test_endpoint(self):
+        """The overall invite_user comparison is the same test /api/ab-test runs"""
+        single = json.loads(self.app.get('/api/ab-test').data)
+        response = self.app.get('/api/ab-test/report?segment_by=country,device*subscription_status')
+        self.assertEqual(response.status_code, 200)
+        report = json.loads(response.data)
+
+        overall = report['segments'][0]
+        self.assertEqual(overall['segment'], 'all')
+        last = [c for c in overall['comparisons'] if c['metric'] == 'invite_user'][0]
+        self.assertAlmostEqual(last['z_score'], single['stats']['z_score'], places=3)
+        self.assertAlmostEqual(last['p_value'], single['stats']['p_value'], places=3)
+        self.assertGreaterEqual(last['p_adjusted'], last['p_value'])
+
+        # Segments of one dimension partition the users
+        countries = [s for s in report['segments'] if s['dimension'] == 'country']
+        for variant, totals in overall['variants'].items():
+            self.assertEqual(sum(s['variants'][variant]['users'] for s in countries), totals['users'])
+
+    def test_report_validates_parameters(self):
+        self.assertEqual(self.app.get('/api/ab-test/report?metrics=unknown_event').status_code, 400)
+        self.assertEqual(self.app.get('/api/ab-test/report?segment_by=browser').status_code, 400)
+        self.assertEqual(self.app.get('/api/ab-test/report?correction=sidak').status_code, 400)
+        self.assertEqual(self.app.get('/api/ab-test/report?control=Z').status_code, 400)
+        self.assertEqual(self.app.get('/api/ab-test/report?confidence_level=1.5').status_code, 400)
+        self.assertEqual(self.app.get('/api/ab-test/report?confidence_level=0').status_code, 400)
+
+    def test_power_curve_matches_simulation_mode(self):
+        single = json.loads(self.app.get(
+            '/api/ab-test?manual_n_a=1000&manual_conv_a=10&manual_n_b=1000&manual_conv_b=12').data)
+        response = self.app.get('/api/ab-test/power-curve?n=1000,4000&baseline=10&mde=20,10&confidence_level=0.9,0.95')
+        self.assertEqual(response.status_code, 200)
+        curve = json.loads(response.data)
+
+        self.assertEqual(curve['dims'], ['confidence_level', 'baseline', 'mde', 'n'])
+        self.assertAlmostEqual(curve['power'][1][0][0][0], single['stats']['power'], places=4)
+        # More users, more power; a smaller effect needs more users
+        self.assertGreater(curve['power'][1][0][0][1], curve['power'][1][0][0][0])
+        self.assertGreater(curve['required_n'][1][0][1], curve['required_n'][1][0][0])
+
+        # The required sample size indeed reaches the target power
+        required = curve['required_n'][1][0][0]
+        at_required = json.loads(self.app.get(
+            f'/api/ab-test/power-curve?n={required}&baseline=10&mde=20').data)
+        self.assertGreaterEqual(at_required['power'][0][0][0][0], 0.8)
+
+    def test_power_curve_rejects_oversized_grids(self):
+        self.assertEqual(self.app.get('/api/ab-test/power-curve?n=1:100000:100000&mde=1:50:50').status_code, 400)
+        self.assertEqual(self.app.get('/api/ab-test/power-curve?baseline=ten').status_code, 400)
+
+    def test_power_curve_rejects_rates_out_of_range(self):
+        for query in ('baseline=-5', 'baseline=0', 'baseline=100', 'mde=0',
+                      'baseline=10&mde=-10&mde_type=absolute', 'baseline=60&mde=100'):
+            response = self.app.get(f'/api/ab-test/power-curve?{query}')
+            self.assertEqual(response.status_code, 400, query)
+        error = json.loads(self.app.get('/api/ab-test/power-curve?baseline=10,-5').data)['error']
+        self.assertIn('-5', error)
+        self.assertEqual(self.app.get(
+            '/api/ab-test/power-curve?baseline=10&mde=-5&mde_type=absolute').status_code, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
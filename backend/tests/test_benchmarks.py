@@ -0,0 +1,59 @@
+import unittest
+import sys
+import os
+
+# Add backend directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+from bench_endpoints import ROUTES, generate_dataset, compare_to_baseline, bench_scale
+import app as app_module
+
+
+class TestBenchmarkSuite(unittest.TestCase):
+    def test_generate_dataset_shape(self):
+        """Generated data matches the schema load_data() produces"""
+        users, events = generate_dataset(2000, seed=1)
+        self.assertEqual(len(events), 2000)
+        self.assertEqual(list(users.columns),
+                         ['user_id', 'joined_at', 'device', 'country', 'subscription_status', 'ab_variant'])
+        self.assertEqual(list(events.columns), ['event_id', 'user_id', 'event_name', 'timestamp', 'metadata'])
+        self.assertTrue(events['timestamp'].is_monotonic_increasing)
+        self.assertEqual(str(events['timestamp'].dt.tz), 'UTC')
+        self.assertEqual(str(users['joined_at'].dt.tz), 'UTC')
+        self.assertTrue(events['user_id'].isin(users['user_id']).all())
+
+    def test_compare_to_baseline_flags_regressions(self):
+        """Only metrics above both the relative margin and the noise floor fail"""
+        baseline = {'scales': {'10k': {'routes': {
+            '/api/funnel': {'cold_ms': 100.0, 'warm_median_ms': 50.0, 'peak_mem_mb': 10.0},
+            '/api/metrics': {'cold_ms': 1.0, 'warm_median_ms': 1.0, 'peak_mem_mb': 0.1},
+        }}}}
+        report = {'scales': {'10k': {'routes': {
+            '/api/funnel': {'cold_ms': 200.0, 'warm_median_ms': 55.0, 'peak_mem_mb': 10.0},
+            '/api/metrics': {'cold_ms': 3.0, 'warm_median_ms': 3.0, 'peak_mem_mb': 0.3},
+        }}}}
+
+        regressions = compare_to_baseline(report, baseline, margin=0.5, min_delta_ms=5.0)
+
+        self.assertEqual(len(regressions), 1)
+        self.assertIn('/api/funnel cold_ms', regressions[0])
+
+    def test_bench_scale_times_every_route(self):
+        """A tiny run produces cold, warm and memory figures per route"""
+        users, events = app_module.users_df, app_module.events_df
+        try:
+            result = bench_scale(app_module, 500, ROUTES, warm_runs=1)
+        finally:
+            app_module.users_df, app_module.events_df = users, events
+
+        self.assertEqual(result['num_events'], 500)
+        self.assertEqual(list(result['routes']), ROUTES)
+        for metrics in result['routes'].values():
+            self.assertGreater(metrics['cold_ms'], 0)
+            self.assertIsNotNone(metrics['warm_median_ms'])
+            self.assertGreaterEqual(metrics['peak_mem_mb'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+import json
+import sys
+import os
+
+import numpy as np
+
+# Add backend directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app
+import bootstrap
+
+
+class TestBootstrap(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+
+    def test_multinomial_and_index_resampling_agree(self):
+        """Few distinct values use the multinomial shortcut; it must match plain resampling"""
+        values = np.random.default_rng(1).poisson(5, size=4000).astype(float)
+        fast = bootstrap.resample_means(values, 4000, np.random.default_rng(2))
+        # Force the index path by making every value distinct
+        jittered = values + np.random.default_rng(4).uniform(0, 1e-9, size=len(values))
+        slow = bootstrap.resample_means(jittered, 4000, np.random.default_rng(3), batch_elements=1 << 20)
+
+        expected_se = values.std() / np.sqrt(len(values))
+        for means in (fast, slow):
+            self.assertAlmostEqual(means.mean(), values.mean(), delta=expected_se / 5)
+            self.assertAlmostEqual(means.std(), expected_se, delta=expected_se * 0.1)
+
+    def test_endpoint_is_seeded_and_cached(self):
+        first = json.loads(self.app.get('/api/ab-test/bootstrap?resamples=500&seed=7').data)
+        again = json.loads(self.app.get('/api/ab-test/bootstrap?resamples=500&seed=7').data)
+        self.assertEqual(first, again)
+
+        events = first['metrics']['events_per_user']
+        total_users = sum(v['users'] for v in events['variants'].values())
+        self.assertEqual(total_users, 1000)
+        for variant in events['variants'].values():
+            low, high = variant['mean_ci']
+            self.assertLessEqual(low, variant['mean'])
+            self.assertGreaterEqual(high, variant['mean'])
+
+        self.assertEqual(self.app.get('/api/ab-test/bootstrap?metrics=revenue').status_code, 400)
+        self.assertEqual(self.app.get('/api/ab-test/bootstrap?resamples=0').status_code, 400)
+        response = self.app.get('/api/ab-test/bootstrap?confidence_level=2')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(json.loads(response.data)['error'], 'confidence_level must be between 0 and 1')
+
+
+if __name__ == '__main__':
+    unittest.main()
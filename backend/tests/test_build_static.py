@@ -0,0 +1,46 @@
+import unittest
+import gzip
+import json
+import os
+import re
+import sys
+import tempfile
+
+# Add backend directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app
+import build_static
+
+
+class TestBuildStatic(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+
+    def test_static_files_match_api_responses(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            build_static.build(tmp)
+            for name, url in build_static.STATIC_RESPONSES.items():
+                path = os.path.join(tmp, name + '.json')
+                with open(path, 'rb') as f:
+                    body = f.read()
+                with open(path + '.gz', 'rb') as f:
+                    self.assertEqual(gzip.decompress(f.read()), body)
+                self.assertEqual(json.loads(body), json.loads(self.app.get(url).data), url)
+
+    def test_missing_snapshot_redirects_to_api(self):
+        response = self.app.get('/static-api/user-sessions/total_sessions.json')
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.headers['Location'], '/api/user-sessions?limit=50&sort_by=total_sessions')
+        self.assertEqual(self.app.get('/static-api/unknown.json').status_code, 404)
+
+    def test_frontend_requests_the_same_snapshots(self):
+        api_js = os.path.join(build_static.BASE_DIR, 'frontend', 'src', 'api.js')
+        with open(api_js) as f:
+            pairs = re.findall(r"'(/[^']*)': '([^']+)'", f.read())
+        self.assertEqual({name: '/api' + url for url, name in pairs}, build_static.STATIC_RESPONSES)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+import json
+import sqlite3
+import sys
+import os
+
+# Add backend directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module
+from app import app
+import cube
+
+
+def _sorted(frame):
+    return frame.sort_values(list(frame.columns)).reset_index(drop=True).astype(str)
+
+
+class TestCube(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+        self.users = app_module.users_df
+        self.events = app_module.events_df
+        self.cube = cube.Cube.build(self.users, self.events)
+        days = cube.epoch_days(self.events['timestamp'])
+        self.first_day = int(days.min())
+
+    def test_cube_matches_raw_scan(self):
+        day = self.first_day + 40
+        queries = [
+            (['day'], {}, (None, None)),
+            (['country', 'device'], {'event_name': ['signup_success']}, (None, None)),
+            (['event_name', 'ab_variant'], {'country': ['US', 'DE']}, (None, None)),
+            (['subscription_status'], {}, (day, day)),
+            ([], {}, (None, None)),
+        ]
+        measures = ['events', 'users']
+        for group_by, filters, day_range in queries:
+            name = self.cube.plan(group_by, filters, day_range, measures)
+            self.assertIsNotNone(name, group_by)
+            self.assertTrue(_sorted(self.cube.query(name, group_by, filters, day_range, measures)).equals(
+                _sorted(cube.raw_query(self.users, self.events, group_by, filters, day_range, measures))))
+
+    def test_distinct_users_across_days_fall_back_to_raw(self):
+        day_range = (self.first_day, self.first_day + 30)
+        self.assertIsNone(self.cube.plan(['device'], {}, day_range, ['users']))
+        self.assertIsNone(self.cube.plan([], {'event_name': ['login', 'signup_success']}, (None, None), ['users']))
+        # Event counts always add up
+        self.assertEqual(self.cube.plan(['device'], {}, day_range, ['events']), 'day')
+
+    def test_ingest_matches_rebuild(self):
+        start = len(self.events) - 700
+        grown = cube.Cube.build(self.users, self.events.iloc[:start])
+        grown.ingest(self.users, self.events, start)
+        for name, table in self.cube.tables.items():
+            self.assertTrue(_sorted(table).equals(_sorted(grown.tables[name][table.columns])), name)
+        self.assertEqual(grown.version, self.cube.version)
+
+    def test_save_and_load(self):
+        conn = sqlite3.connect(':memory:')
+        self.cube.save(conn)
+        loaded = cube.Cube.load(conn, cube.data_version(self.events))
+        for name, table in self.cube.tables.items():
+            self.assertTrue(_sorted(table).equals(_sorted(loaded.tables[name])), name)
+        # A cube built from other events is not used
+        self.assertIsNone(cube.Cube.load(conn, cube.data_version(self.events.iloc[:-1])))
+
+    def test_query_endpoint_reports_route(self):
+        data = json.loads(self.app.get('/api/query?group_by=day,country&event_name=signup_success').data)
+        self.assertEqual(data['route'], 'cube:day_event')
+        self.assertEqual(sum(row['events'] for row in data['rows']),
+                         int((self.events['event_name'] == 'signup_success').sum()))
+
+        data = json.loads(self.app.get('/api/query?group_by=device&start_date=2023-03-01&end_date=2023-03-31').data)
+        raw = json.loads(self.app.get(
+            '/api/query?group_by=device&start_date=2023-03-01&end_date=2023-03-31&route=raw').data)
+        self.assertEqual(data['route'], 'raw')
+        self.assertEqual(data['rows'], raw['rows'])
+
+        self.assertEqual(self.app.get('/api/query?group_by=city').status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
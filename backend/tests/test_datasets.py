@@ -0,0 +1,132 @@
+import unittest
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+from unittest.mock import patch
+
+# Add backend directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module
+from app import app
+import result_cache
+
+
+class TestDatasets(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+        self.dir = tempfile.TemporaryDirectory()
+        for name in ('acme', 'beta'):
+            shutil.copy(app_module.DB_FILE, os.path.join(self.dir.name, f'{name}.db'))
+        self.patcher = patch.object(app_module.registry, 'directory', self.dir.name)
+        self.patcher.start()
+
+    def tearDown(self):
+        for name in ('acme', 'beta'):
+            app_module.registry.evict(app_module.registry.get(name))
+        self.patcher.stop()
+        self.dir.cleanup()
+
+    def _datasets(self):
+        data = json.loads(self.app.get('/api/debug/datasets').data)
+        return {d['name']: d for d in data['datasets']}
+
+    def test_datasets_load_on_first_request(self):
+        self.assertFalse(self._datasets()['acme']['resident'])
+        default = json.loads(self.app.get('/api/metrics').data)
+        response = self.app.get('/api/metrics?dataset=acme')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data), default)
+
+        acme = self._datasets()['acme']
+        self.assertTrue(acme['resident'])
+        self.assertGreater(acme['bytes'], 0)
+        self.assertIsNotNone(acme['load_seconds'])
+        self.assertFalse(self._datasets()['beta']['resident'])
+        self.assertEqual(self.app.get('/api/metrics?dataset=nope').status_code, 404)
+
+    def test_least_recently_used_dataset_is_evicted(self):
+        self.app.get('/api/funnel?dataset=acme')
+        self.app.get('/api/funnel')
+        evictions = self._datasets()['acme']['evictions']
+        loads = self._datasets()['acme']['loads']
+        # Room for the default dataset and one more
+        budget = self._datasets()['default']['bytes'] + self._datasets()['acme']['bytes'] + 1
+        with patch.object(app_module.registry, 'budget_bytes', budget):
+            self.assertEqual(self.app.get('/api/funnel?dataset=beta').status_code, 200)
+            datasets = self._datasets()
+            self.assertFalse(datasets['acme']['resident'])
+            self.assertEqual(datasets['acme']['evictions'], evictions + 1)
+            self.assertTrue(datasets['default']['resident'])
+            self.assertTrue(datasets['beta']['resident'])
+
+            # Loaded again on its next request
+            self.assertEqual(self.app.get('/api/funnel?dataset=acme').status_code, 200)
+            self.assertEqual(self._datasets()['acme']['loads'], loads + 1)
+
+    def test_dataset_over_the_whole_budget_keeps_the_others(self):
+        self.app.get('/api/funnel')
+        with patch.object(app_module.registry, 'budget_bytes', 1):
+            self.assertEqual(self.app.get('/api/funnel?dataset=acme').status_code, 200)
+            stats = json.loads(self.app.get('/api/debug/datasets').data)
+        datasets = {d['name']: d for d in stats['datasets']}
+        self.assertTrue(datasets['default']['resident'])
+        self.assertTrue(datasets['acme']['resident'])
+        self.assertEqual(stats['over_budget_bytes'], stats['resident_bytes'] - 1)
+
+    def test_busy_dataset_is_not_counted_as_evicted(self):
+        self.app.get('/api/funnel?dataset=acme')
+        self.app.get('/api/funnel')
+        acme = app_module.registry.get('acme')
+        budget = self._datasets()['default']['bytes'] + self._datasets()['acme']['bytes'] + 1
+        locked, release = threading.Event(), threading.Event()
+
+        def hold():
+            # A load or refresh of acme in progress
+            with acme.lock:
+                locked.set()
+                release.wait(10)
+
+        holder = threading.Thread(target=hold)
+        holder.start()
+        locked.wait(10)
+        try:
+            with patch.object(app_module.registry, 'budget_bytes', budget):
+                skipped = app_module.registry.skipped_evictions
+                self.assertEqual(self.app.get('/api/funnel?dataset=beta').status_code, 200)
+                stats = json.loads(self.app.get('/api/debug/datasets').data)
+        finally:
+            release.set()
+            holder.join()
+        datasets = {d['name']: d for d in stats['datasets']}
+        # acme could not go: the next least recently used one did, and the rest is reported
+        self.assertTrue(datasets['acme']['resident'])
+        self.assertFalse(datasets['default']['resident'])
+        self.assertEqual(stats['skipped_evictions'], skipped + 1)
+        self.assertEqual(stats['over_budget_bytes'], max(0, stats['resident_bytes'] - budget))
+
+    def test_result_cache_keeps_each_dataset(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            store = result_cache.ResultCache(os.path.join(cache_dir, 'results.db'))
+            store.create()
+            with patch('app.result_store', store):
+                self.app.get('/api/funnel')
+                self.app.get('/api/funnel?dataset=acme')
+                self.assertEqual(self.app.get('/api/funnel').headers['X-Result-Cache'], 'hit')
+                self.assertEqual(self.app.get('/api/funnel?dataset=acme').headers['X-Result-Cache'], 'hit')
+            conn = sqlite3.connect(store.path)
+            versions = [v for (v,) in conn.execute("SELECT version FROM results ORDER BY version")]
+            conn.close()
+            store._connection().close()
+        # One entry per dataset: storing acme's result did not prune the default one
+        self.assertEqual(len(versions), 2)
+        self.assertEqual(sorted(v.startswith('acme/') for v in versions), [False, True])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+import json
+import sys
+import os
+
+import numpy as np
+import pandas as pd
+
+# Add backend directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app
+import event_index
+import funnels
+
+
+class TestOrderedFunnel(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+        start = pd.Timestamp('2023-01-01', tz='UTC')
+        hours = lambda *hs: [start + pd.Timedelta(hours=h) for h in hs]
+        self.users = pd.DataFrame({'user_id': ['u1', 'u2', 'u3']})
+        # u1: a, b, c in order; u2: b before a, then b again; u3: c, a only
+        events = pd.DataFrame({
+            'user_id': ['u1', 'u1', 'u1', 'u2', 'u2', 'u2', 'u3', 'u3'],
+            'event_name': ['a', 'b', 'c', 'b', 'a', 'b', 'c', 'a'],
+            'timestamp': hours(0, 1, 50, 0, 2, 3, 0, 1)
+        })
+        index = event_index.UserEventIndex(events, ['a', 'b', 'c'])
+        self.stage_times = funnels.StageTimes(index, self.users, ['a', 'b', 'c'])
+
+    def test_steps_must_happen_in_order(self):
+        times = self.stage_times.ordered_times()
+        reached = times != funnels.NOT_REACHED
+        # u2's first b comes before a, but the later b still counts; u3's c came first
+        self.assertEqual(reached.tolist(), [[True, True, True], [True, True, False], [True, False, False]])
+        self.assertEqual((times[1, 1] - times[1, 0]) / 3.6e12, 1.0)
+
+    def test_conversion_window(self):
+        times = self.stage_times.ordered_times(funnels.parse_window('1d'))
+        # u1 reaches c 50 hours after a: outside a one-day window
+        self.assertEqual((times != funnels.NOT_REACHED).sum(axis=0).tolist(), [3, 2, 0])
+
+    def test_time_to_convert(self):
+        steps = funnels.time_to_convert(self.stage_times.ordered_times())
+        self.assertEqual(steps[0]['users'], 2)
+        self.assertEqual(steps[0]['percentiles']['p50'], 3600.0)
+        self.assertEqual(np.sum(steps[0]['histogram']), 2)
+        self.assertEqual(steps[1]['histogram'][funnels.HISTOGRAM_LABELS.index('1-3d')], 1)
+
+    def test_ordered_mode_never_exceeds_unordered(self):
+        unordered = json.loads(self.app.get('/api/funnel').data)['funnel']
+        response = self.app.get('/api/funnel?mode=ordered&window=7d&device=Mobile')
+        self.assertEqual(response.status_code, 200)
+        ordered = json.loads(response.data)
+        self.assertEqual(len(ordered['time_to_convert']), len(ordered['funnel']) - 1)
+        for o, u in zip(ordered['funnel'], unordered):
+            self.assertLessEqual(o['users'], u['users'])
+        self.assertEqual(self.app.get('/api/funnel?mode=ordered&window=soon').status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+import sys
+import os
+
+# Add backend directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+from import_times import parse_importtime, by_package, measure
+from lazy import LazyModule, lazy_module
+
+
+class TestColdStart(unittest.TestCase):
+    def test_light_routes_skip_heavy_imports_and_data(self):
+        """A cold /api/health imports neither pandas nor numpy; an analysis route loads both"""
+        health = measure('/api/health')
+        self.assertEqual(health['status'], 200)
+        self.assertEqual(health['heavy_loaded'], [])
+
+        funnel = measure('/api/funnel')
+        self.assertEqual(funnel['status'], 200)
+        self.assertIn('pandas', funnel['heavy_loaded'])
+
+    def test_parse_importtime(self):
+        text = ("import time: self [us] | cumulative | imported package\n"
+                "import time:       120 |        120 |     pandas._config\n"
+                "import time:       300 |        420 |   pandas\n"
+                "import time:        50 |         50 | json\n")
+        rows = parse_importtime(text)
+        self.assertEqual([r['module'] for r in rows], ['pandas._config', 'pandas', 'json'])
+        self.assertEqual([r['depth'] for r in rows], [2, 1, 0])
+        self.assertEqual(by_package(rows), [('pandas', 420), ('json', 50)])
+
+    def test_lazy_module_imports_on_first_use(self):
+        self.assertIs(lazy_module('os'), os)
+        module = LazyModule('colorsys')
+        self.assertIn('not loaded', repr(module))
+        self.assertEqual(module.rgb_to_hsv(0, 0, 0), (0, 0, 0))
+        self.assertIn("'colorsys' (loaded)", repr(module))
+
+
+if __name__ == '__main__':
+    unittest.main()
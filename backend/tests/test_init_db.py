@@ -0,0 +1,169 @@
+import unittest
+import sqlite3
+import tempfile
+from unittest.mock import patch
+import sys
+import os
+
+import pandas as pd
+
+# Add backend directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module
+import cube
+import init_db
+
+USERS_CSV = """user_id,joined_at,device,country,subscription_status,ab_variant
+u_1,2023-01-01T08:00:00Z,Mobile,US,Free,A
+u_2,2023-01-02T09:30:00Z,Desktop,DE,Premium,B
+u_3,2023-01-03T10:00:00Z,Tablet,FR,Free,A
+"""
+
+EVENTS_CSV = """event_id,user_id,event_name,timestamp,metadata
+e_1,u_1,signup_success,2023-01-01T08:00:05Z,"{""source"": ""organic""}"
+e_2,u_2,signup_success,2023-01-02T09:31:00Z,
+e_3,u_9,view_dashboard,2023-01-02T10:00:00Z,
+e_4,u_1,view_dashboard,2023-01-02T11:15:42Z,
+e_5,u_3,signup_success,2023-01-03T10:00:01Z,
+"""
+
+
+class TestInitDb(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.users_file = os.path.join(self.dir.name, 'users.csv')
+        self.events_file = os.path.join(self.dir.name, 'events.csv')
+        self.db_file = os.path.join(self.dir.name, 'test.db')
+        with open(self.users_file, 'w') as f:
+            f.write(USERS_CSV)
+        with open(self.events_file, 'w') as f:
+            f.write(EVENTS_CSV)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_chunked_typed_load(self):
+        init_db.init_db(chunk_size=2, users_file=self.users_file, events_file=self.events_file, db_file=self.db_file)
+        conn = sqlite3.connect(self.db_file)
+
+        rows = conn.execute("SELECT event_id, user_key, typeof(timestamp), timestamp, metadata FROM events").fetchall()
+        # The event of an unknown user is skipped, missing metadata is NULL
+        self.assertEqual([r[0] for r in rows], ['e_1', 'e_2', 'e_4', 'e_5'])
+        self.assertEqual([r[1] for r in rows], [1, 2, 1, 3])
+        self.assertEqual(rows[2][2:4], ('integer', int(pd.Timestamp('2023-01-02T11:15:42Z').timestamp())))
+        self.assertIsNone(rows[1][4])
+
+        indexes = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        self.assertTrue({'idx_events_user_key', 'idx_events_timestamp'} <= indexes)
+        self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], 'delete')
+
+        # The cube built chunk by chunk matches these events
+        events = pd.read_sql_query("SELECT * FROM events", conn)
+        events['timestamp'] = pd.to_datetime(events['timestamp'], unit='s', utc=True)
+        loaded = cube.Cube.load(conn, cube.data_version(events))
+        self.assertIsNotNone(loaded)
+        self.assertEqual(int(loaded.tables['all']['events'].sum()), 4)
+        # Counted in SQL, the same cells as a pandas build
+        self._cube_matches_rebuild(conn)
+        conn.close()
+
+    def _load(self, append=False):
+        load = init_db.append_db if append else init_db.init_db
+        load(chunk_size=2, users_file=self.users_file, events_file=self.events_file, db_file=self.db_file)
+
+    def _append_rows(self, path, text):
+        with open(path, 'a') as f:
+            f.write(text)
+
+    def _cube_matches_rebuild(self, conn):
+        stored = cube.Cube.load(conn, init_db.events_version(conn))
+        users = init_db.stored_users(conn)
+        events = pd.read_sql_query("SELECT user_key, event_name, timestamp FROM events", conn)
+        events = pd.DataFrame({'user_id': users['user_id'].to_numpy()[events['user_key'].to_numpy() - 1],
+                               'event_name': events['event_name'],
+                               'timestamp': pd.to_datetime(events['timestamp'], unit='s', utc=True)})
+        rebuilt = cube.Cube.build(users, events)
+        for name, table in rebuilt.tables.items():
+            expected = table.sort_values(list(table.columns)).reset_index(drop=True).astype(str)
+            actual = stored.tables[name][table.columns].sort_values(list(table.columns)).reset_index(drop=True)
+            self.assertTrue(expected.equals(actual.astype(str)), name)
+
+    def test_append_loads_only_new_rows(self):
+        self._load()
+        self._append_rows(self.users_file, "u_4,2023-01-04T12:00:00Z,Mobile,US,Free,B\n")
+        # A repeated event id, a new user's event, and a row still being written
+        self._append_rows(self.events_file, "e_4,u_1,view_dashboard,2023-01-02T11:15:42Z,\n"
+                                            "e_6,u_4,signup_success,2023-01-04T12:00:03Z,\n"
+                                            "e_7,u_1,view_dash")
+        self._load(append=True)
+
+        conn = sqlite3.connect(self.db_file)
+        rows = conn.execute("SELECT event_id, user_key FROM events ORDER BY rowid").fetchall()
+        self.assertEqual(rows, [('e_1', 1), ('e_2', 2), ('e_4', 1), ('e_5', 3), ('e_6', 4)])
+        state = init_db.read_state(conn)
+        self.assertEqual(state['last_event_id'], 'e_6')
+        self._cube_matches_rebuild(conn)
+        conn.close()
+
+        # The rest of the partial row arrives
+        self._append_rows(self.events_file, "board,2023-01-05T09:00:00Z,\n")
+        self._load(append=True)
+        conn = sqlite3.connect(self.db_file)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM events").fetchone()[0], 6)
+        self.assertEqual(conn.execute("SELECT month, events FROM event_partitions").fetchall(), [('2023-01', 6)])
+        self._cube_matches_rebuild(conn)
+        self.assertEqual(init_db.read_state(conn)['load_id'], state['load_id'])
+        conn.close()
+
+    def test_rewritten_csv_triggers_full_load(self):
+        self._load()
+        conn = sqlite3.connect(self.db_file)
+        load_id = init_db.read_state(conn)['load_id']
+        conn.close()
+
+        with open(self.events_file, 'w') as f:
+            f.write(EVENTS_CSV.replace('e_1,', 'e_100,'))
+        self._load(append=True)
+        conn = sqlite3.connect(self.db_file)
+        self.assertNotEqual(init_db.read_state(conn)['load_id'], load_id)
+        self.assertEqual(conn.execute("SELECT MIN(event_id) FROM events").fetchone()[0], 'e_100')
+        conn.close()
+
+    def test_failed_load_keeps_the_previous_database(self):
+        self.assertTrue(init_db.init_db(chunk_size=2, users_file=self.users_file, events_file=self.events_file,
+                                        db_file=self.db_file))
+        with patch('summaries.refresh', side_effect=RuntimeError('disk full')):
+            self.assertFalse(init_db.init_db(chunk_size=2, users_file=self.users_file,
+                                             events_file=self.events_file, db_file=self.db_file))
+        conn = sqlite3.connect(self.db_file)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM events").fetchone()[0], 4)
+        conn.close()
+        self.assertEqual(sorted(os.listdir(self.dir.name)), ['events.csv', 'test.db', 'users.csv'])
+
+    def test_app_refresh_folds_in_appended_rows(self):
+        self._load()
+        db_file = app_module.DB_FILE
+        app_module.DB_FILE = self.db_file
+        try:
+            app_module.load_data()
+            app_module._cube(app_module._snapshot())
+            self._append_rows(self.events_file, "e_6,u_2,view_dashboard,2023-01-02T09:45:00Z,\n")
+            self._load(append=True)
+            self.assertEqual(app_module.refresh_data(), (0, 1))
+            refreshed_events, refreshed_cube = app_module.events_df, app_module._cube(app_module._snapshot())
+
+            app_module.load_data()
+            self.assertTrue(refreshed_events.equals(app_module.events_df))
+            self.assertTrue(refreshed_events['timestamp'].is_monotonic_increasing)
+            for name, table in app_module._cube(app_module._snapshot()).tables.items():
+                columns = list(table.columns)
+                self.assertTrue(table.sort_values(columns).reset_index(drop=True).astype(str).equals(
+                    refreshed_cube.tables[name][columns].sort_values(columns).reset_index(drop=True).astype(str)))
+        finally:
+            app_module.DB_FILE = db_file
+            app_module.load_data()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+import json
+import sqlite3
+import sys
+import os
+
+import numpy as np
+import pandas as pd
+
+# Add backend directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module
+from app import app
+import event_index
+import partitions
+import sqlite_pool
+
+
+class TestPartitions(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+        conn = sqlite3.connect(app_module.DB_FILE)
+        self.stored = pd.read_sql_query("SELECT event_id, timestamp, metadata FROM events", conn)
+        self.catalog = dict(conn.execute("SELECT month, events FROM event_partitions").fetchall())
+        conn.close()
+        self.stored['ns'] = self.stored['timestamp'] * 10**9
+
+    def test_catalog_counts_months(self):
+        months = partitions.month_of(self.stored['ns'].to_numpy())
+        self.assertEqual(self.catalog, {m: int(c) for m, c in zip(*np.unique(months, return_counts=True))})
+
+    def test_lazy_loads_and_eviction(self):
+        store = partitions.PartitionStore(sqlite_pool.ConnectionPool(app_module.DB_FILE), max_resident=2)
+        months = partitions.month_of(self.stored['ns'].to_numpy())
+        for month in ['2023-03', '2023-04', '2023-03', '2023-05']:
+            rows = self.stored[months == month]
+            self.assertEqual(store.metadata(rows['event_id'], rows['ns']), rows['metadata'].tolist())
+
+        stats = store.stats()
+        self.assertEqual(stats['resident_months'], ['2023-03', '2023-05'])
+        self.assertEqual((stats['loads'], stats['hits'], stats['evictions']), (3, 1, 1))
+
+    def test_sparse_lookup_skips_partition_loads(self):
+        store = partitions.PartitionStore(sqlite_pool.ConnectionPool(app_module.DB_FILE))
+        rows = self.stored.iloc[::500]
+        self.assertEqual(store.metadata(rows['event_id'], rows['ns']), rows['metadata'].tolist())
+        self.assertEqual(store.stats()['loads'], 0)
+        # Months without events are pruned
+        self.assertEqual(store.metadata(['e_missing'], [event_index.to_ns('2019-01-01')]), [None])
+
+    def test_events_endpoint_returns_metadata(self):
+        self.assertNotIn('metadata', app_module.events_df)
+        data = json.loads(self.app.get('/api/events?start_date=2023-06-01&end_date=2023-06-03').data)
+        expected = self.stored.set_index('event_id')['metadata']
+        self.assertTrue(data['events'])
+        for event in data['events']:
+            self.assertEqual(event['metadata'], expected[event['event_id']])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+import json
+import sys
+import os
+
+import pandas as pd
+
+# Add backend directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module
+from app import app
+import event_index
+import paths
+
+
+class TestPaths(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+        start = pd.Timestamp('2023-01-01', tz='UTC')
+        minutes = lambda *ms: [start + pd.Timedelta(minutes=m) for m in ms]
+        # Rows deliberately out of order; u1 has two sessions (gap of 2 hours)
+        self.events = pd.DataFrame({
+            'user_id': ['u1', 'u2', 'u1', 'u1', 'u2', 'u1'],
+            'event_name': ['b', 'a', 'a', 'c', 'b', 'a'],
+            'timestamp': minutes(5, 0, 0, 10, 1, 130)
+        })
+        self.index = event_index.UserEventIndex(self.events, ['a', 'b', 'c'])
+
+    def test_index_sorts_by_user_and_time(self):
+        self.assertEqual(self.index.events.tolist(), [0, 1, 2, 0, 0, 1])
+        self.assertEqual(self.index.session_start.tolist(), [True, False, False, True, True, False])
+        self.assertEqual(self.index.user_start.tolist(), [True, False, False, False, True, False])
+
+    def test_transitions_respect_sessions(self):
+        counts, starts, ends = paths.transition_counts(self.index)
+        # a->b twice (u1, u2), b->c once; c->a crosses u1's session break
+        self.assertEqual(counts.tolist(), [[0, 2, 0], [0, 0, 1], [0, 0, 0]])
+        self.assertEqual(starts.tolist(), [3, 0, 0])
+        self.assertEqual(ends.tolist(), [1, 1, 1])
+
+        counts, _, _ = paths.transition_counts(self.index, sessions=False)
+        self.assertEqual(counts[2, 0], 1)
+
+    def test_top_paths(self):
+        runs, counts, total = paths.top_paths(self.index, 2, 5)
+        self.assertEqual((runs[0], counts[0], total), ([0, 1], 2, 3))
+
+        runs, counts, total = paths.top_paths(self.index, 3, 5, sessions=False, end_with=0)
+        self.assertEqual((runs, counts, total), ([[1, 2, 0]], [1], 1))
+
+    def test_endpoint(self):
+        response = self.app.get('/api/paths?event=view_dashboard&steps=3')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual(len(data['transition_counts']), len(data['events']))
+        # Every event either is followed by another in its session or ends it
+        followed = sum(map(sum, data['transition_counts']))
+        self.assertEqual(followed + sum(data['end_counts']), len(app_module.events_df))
+        self.assertAlmostEqual(sum(item['probability'] for item in data['focus']['next']), 1, places=2)
+        self.assertEqual(self.app.get('/api/paths?steps=1').status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+import json
+import sys
+import os
+import threading
+from unittest.mock import patch
+
+# Add backend directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app
+import profiling
+
+
+class TestProfiling(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+
+    def test_profile_endpoint_disabled_without_token(self):
+        """Profiling is refused unless VIZSPRINTS_DEBUG_TOKEN is configured"""
+        with patch.dict(os.environ, {}, clear=False):
+            os.environ.pop(profiling.TOKEN_ENV, None)
+            response = self.app.get('/api/debug/profile?seconds=0.1')
+        self.assertEqual(response.status_code, 403)
+
+    def test_profile_endpoint_rejects_wrong_token(self):
+        with patch.dict(os.environ, {profiling.TOKEN_ENV: 'secret'}):
+            response = self.app.get('/api/debug/profile?seconds=0.1&token=nope')
+        self.assertEqual(response.status_code, 403)
+
+    def test_sampling_profile_returns_collapsed_stacks(self):
+        """Busy threads show up as ';'-joined stacks followed by a count"""
+        stop = threading.Event()
+
+        def spin():
+            while not stop.is_set():
+                sum(range(1000))
+
+        worker = threading.Thread(target=spin, name='spinner')
+        worker.start()
+        try:
+            with patch.dict(os.environ, {profiling.TOKEN_ENV: 'secret'}):
+                response = self.app.get('/api/debug/profile?seconds=0.2',
+                                        headers={'X-Debug-Token': 'secret'})
+        finally:
+            stop.set()
+            worker.join()
+
+        self.assertEqual(response.status_code, 200)
+        lines = response.get_data(as_text=True).splitlines()
+        spinner = [line for line in lines if line.startswith('spinner;')]
+        self.assertTrue(spinner)
+        stack, count = spinner[0].rsplit(' ', 1)
+        self.assertIn('spin (', stack)
+        self.assertGreater(int(count), 0)
+
+    def test_per_request_cprofile(self):
+        """?profile=1 replaces the payload with cProfile stats for that call"""
+        with patch.dict(os.environ, {profiling.TOKEN_ENV: 'secret'}):
+            response = self.app.get('/api/funnel?profile=1&token=secret')
+
+        data = json.loads(response.data)
+        self.assertEqual(data['status'], 200)
+        self.assertTrue(any('get_funnel' in row['function'] for row in data['functions']))
+        self.assertIn('function calls', data['text'])
+
+
+if __name__ == '__main__':
+    unittest.main()
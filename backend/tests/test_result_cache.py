@@ -0,0 +1,86 @@
+import unittest
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+from unittest.mock import patch
+
+# Add backend directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module
+from app import app
+import result_cache
+import snapshot
+
+
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+        self.dir = tempfile.TemporaryDirectory()
+        self.store = result_cache.ResultCache(os.path.join(self.dir.name, 'results.db'))
+        self.store.create()
+        self.patcher = patch('app.result_store', self.store)
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        self.dir.cleanup()
+
+    def test_second_request_is_served_from_disk(self):
+        first = self.app.get('/api/funnel')
+        second = self.app.get('/api/funnel')
+        self.assertEqual(first.headers['X-Result-Cache'], 'miss')
+        self.assertEqual(second.headers['X-Result-Cache'], 'hit')
+        self.assertEqual(json.loads(first.data), json.loads(second.data))
+
+        # Parameters are part of the key, in any order
+        self.app.get('/api/user-sessions?limit=5&sort_by=total_sessions')
+        reordered = self.app.get('/api/user-sessions?sort_by=total_sessions&limit=5')
+        self.assertEqual(reordered.headers['X-Result-Cache'], 'hit')
+        self.assertEqual(self.app.get('/api/user-sessions?limit=6').headers['X-Result-Cache'], 'miss')
+
+        # Another process opening the same file (a cold start) hits too
+        with patch('app.result_store', result_cache.ResultCache(self.store.path)):
+            self.assertEqual(self.app.get('/api/funnel').headers['X-Result-Cache'], 'hit')
+
+    def test_other_data_is_not_served_from_cache(self):
+        self.app.get('/api/metrics')
+        with patch('app.events_df', app_module.events_df.copy()):
+            response = self.app.get('/api/metrics')
+        self.assertNotIn('X-Result-Cache', response.headers)
+
+        current = app_module._snapshot()
+        with patch.object(app_module.registry.get('default'), 'snapshot',
+                          snapshot.Snapshot(current.users, current.events, 'another-load')):
+            self.assertEqual(self.app.get('/api/metrics').headers['X-Result-Cache'], 'miss')
+        # Entries of older versions are dropped once a newer one is written
+        conn = sqlite3.connect(self.store.path)
+        self.assertEqual(conn.execute("SELECT DISTINCT version FROM results").fetchall(), [('another-load',)])
+        conn.close()
+
+    def test_written_back_entries_are_capped(self):
+        self.store.warming = True
+        self.app.get('/api/funnel')
+        self.store.warming = False
+        self.store.max_entries = 3
+        for limit in range(1, 6):
+            self.app.get(f'/api/user-sessions?limit={limit}')
+        stats = self.store.stats()
+        self.assertEqual(stats['entries'], 4)
+        self.assertEqual(stats['evictions'], 2)
+        # The warmed response and the newest written-back ones are kept
+        self.assertEqual(self.app.get('/api/funnel').headers['X-Result-Cache'], 'hit')
+        self.assertEqual(self.app.get('/api/user-sessions?limit=5').headers['X-Result-Cache'], 'hit')
+        self.assertEqual(self.app.get('/api/user-sessions?limit=1').headers['X-Result-Cache'], 'miss')
+
+    def test_errors_and_debug_routes_are_not_stored(self):
+        self.assertEqual(self.app.get('/api/query?group_by=city').status_code, 400)
+        self.app.get('/api/debug/timings')
+        self.assertEqual(self.store.stats()['entries'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+import json
+import sys
+import os
+
+import pandas as pd
+
+# Add backend directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module
+from app import app
+import retention
+
+
+class TestRetention(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+        ts = lambda day: pd.Timestamp('2023-01-01', tz='UTC') + pd.Timedelta(days=day, hours=12)
+        self.users = pd.DataFrame({
+            'user_id': ['u1', 'u2', 'u3'],
+            'joined_at': [ts(0), ts(0), ts(5)]
+        })
+        # u1 active on days 0, 1, 9; u2 on 0, 3; u3 on 5; data ends on day 9
+        self.events = pd.DataFrame({
+            'user_id': ['u1', 'u1', 'u1', 'u1', 'u2', 'u2', 'u3'],
+            'timestamp': [ts(0), ts(1), ts(1), ts(9), ts(0), ts(3), ts(5)]
+        })
+
+    def test_bounded_and_unbounded_retention(self):
+        index = retention.ActivityIndex(self.users, self.events)
+        (e1, b1, u1), (e3, b3, u3), (e7, b7, u7) = index.retention([1, 3, 7])
+        self.assertEqual((e1, b1, u1), (3, 1, 2))
+        self.assertEqual((e3, b3, u3), (3, 1, 2))
+        # u3 joined on day 5, so day 7 is not eligible for them yet
+        self.assertEqual((e7, b7, u7), (2, 0, 1))
+
+        only_u2 = (self.users['user_id'] == 'u2').to_numpy()
+        self.assertEqual(index.retention([3], only_u2), [(1, 1, 1)])
+
+    def test_rolling_active_users(self):
+        index = retention.ActivityIndex(self.users, self.events)
+        active = index.rolling_active((1, 7))
+        self.assertEqual(active[1].tolist(), [2, 1, 0, 1, 0, 1, 0, 0, 0, 1])
+        # Trailing 7 days: u1 (last seen day 1) drops out on day 8 and returns on day 9
+        self.assertEqual(active[7].tolist(), [2, 2, 2, 2, 2, 3, 3, 3, 2, 3])
+
+    def test_endpoints_match_brute_force(self):
+        events = app_module.events_df
+        day = pd.Timestamp('2023-06-30', tz='UTC')
+        window = events[(events['timestamp'] >= day - pd.Timedelta(days=29)) &
+                        (events['timestamp'] < day + pd.Timedelta(days=1))]
+
+        stickiness = json.loads(self.app.get('/api/stickiness').data)
+        entry = [s for s in stickiness['series'] if s['date'] == '2023-06-30'][0]
+        self.assertEqual(entry['mau'], window['user_id'].nunique())
+
+        data = json.loads(self.app.get('/api/retention?days=0,7&country=US').data)
+        self.assertEqual(data['filters'], {'country': ['US']})
+        self.assertEqual(data['users'], int((app_module.users_df['country'] == 'US').sum()))
+        self.assertEqual(self.app.get('/api/retention?days=week').status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import unittest
+import json
+import sys
+import os
+
+import numpy as np
+import pandas as pd
+
+# Add backend directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app
+import sampling
+
+
+class TestUserSampling(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+
+    def test_hash_is_deterministic_and_uniform(self):
+        ids = [f"u_{i:05d}" for i in range(20000)]
+        units = sampling.user_hash_unit(ids)
+
+        np.testing.assert_array_equal(units, sampling.user_hash_unit(ids))
+        self.assertTrue(((units >= 0) & (units < 1)).all())
+        self.assertAlmostEqual(float((units < 0.1).mean()), 0.1, delta=0.01)
+
+    def test_samples_are_nested_and_keep_whole_histories(self):
+        users = pd.DataFrame({'user_id': [f"u_{i}" for i in range(2000)]})
+        events = pd.DataFrame({
+            'user_id': np.repeat(users['user_id'].to_numpy(), 3),
+            'timestamp': pd.date_range('2023-01-01', periods=6000, freq='h')
+        })
+        samples = sampling.build_samples(users, events)
+
+        small, large = set(samples[0.01].users['user_id']), set(samples[0.1].users['user_id'])
+        self.assertTrue(small <= large)
+        self.assertEqual(len(samples[0.1].events), 3 * len(samples[0.1].users))
+
+    def test_estimators_cover_known_totals(self):
+        """A census (rate 1) is exact; a 10% count scales by 10 with a sensible interval"""
+        values = np.array([1.0, 2.0, 3.0])
+        estimate, interval = sampling.estimate_total(values, 1.0, 1.96)
+        self.assertEqual(estimate, 6.0)
+        self.assertEqual(interval, [6.0, 6.0])
+
+        estimate, (low, high) = sampling.estimate_count(100, 0.1, 1.96)
+        self.assertEqual(estimate, 1000)
+        self.assertLess(low, 1000)
+        self.assertGreater(high, 1000)
+
+        ratio, (low, high) = sampling.estimate_ratio([1, 0, 1, 1], [1, 1, 1, 1], 0.1, 1.96, upper_bound=1)
+        self.assertAlmostEqual(ratio, 0.75)
+        self.assertLessEqual(high, 1)
+
+    def test_sampled_endpoints_report_intervals(self):
+        response = self.app.get('/api/funnel?sample=0.1')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual(data['sampling']['rate'], 0.1)
+        self.assertIn('confidence_intervals', data['funnel'][1])
+
+        data = json.loads(self.app.get('/api/metrics?sample=0.1').data)
+        low, high = data['confidence_intervals']['total_users']
+        self.assertLessEqual(low, data['total_users'])
+        self.assertGreaterEqual(high, data['total_users'])
+
+    def test_unsupported_rate_is_rejected(self):
+        response = self.app.get('/api/metrics?sample=0.3')
+        self.assertEqual(response.status_code, 400)
+
+    def test_confidence_level_outside_unit_interval_is_rejected(self):
+        for level in (0, 1, 1.5):
+            response = self.app.get(f'/api/metrics?sample=0.01&confidence_level={level}')
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('confidence_level', json.loads(response.data)['error'])
+
+
+if __name__ == '__main__':
+    unittest.main()
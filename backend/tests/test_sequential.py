@@ -0,0 +1,117 @@
+import unittest
+import json
+import sys
+import os
+
+import numpy as np
+
+# Add backend directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module
+from app import app
+import sequential
+
+
+class TestSequentialMonitoring(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+
+    def test_always_valid_p_is_a_running_minimum(self):
+        days = np.arange(1, 101)
+        p, _ = sequential.msprt_p_values(days * 10, days * 100, days * 11, days * 100, tau=0.05)
+        self.assertTrue((np.diff(p) <= 0).all())
+        self.assertTrue(((p > 0) & (p <= 1)).all())
+
+        # Equal rates never give strong evidence
+        p, _ = sequential.msprt_p_values(days * 10, days * 100, days * 10, days * 100, tau=0.05)
+        self.assertEqual(p.min(), 1.0)
+
+    def test_incremental_updates_match_a_full_rebuild(self):
+        users, events = app_module.users_df, app_module.events_df
+
+        incremental = sequential.SequentialTest('invite_user', 'A', 0.05)
+        self.assertEqual(incremental.update(users, events.iloc[:5000]), 5000)
+        self.assertEqual(incremental.update(users, events), len(events) - 5000)
+        self.assertEqual(incremental.update(users, events), 0)
+
+        full = sequential.SequentialTest('invite_user', 'A', 0.05)
+        full.update(users, events)
+
+        np.testing.assert_array_equal(incremental.conversions[-1], full.conversions[-1])
+        np.testing.assert_array_equal(incremental.users[-1], full.users[-1])
+        self.assertEqual(incremental.rebuilds, 0)
+
+        # Rewritten (not appended) data starts the state over
+        incremental.update(users, events.iloc[::-1])
+        self.assertEqual(incremental.rebuilds, 1)
+        np.testing.assert_array_equal(incremental.conversions[-1], full.conversions[-1])
+
+    def test_endpoint_matches_fixed_horizon_counts(self):
+        sequential.reset_all()
+        ab = json.loads(self.app.get('/api/ab-test').data)
+        response = self.app.get('/api/ab-test/sequential?metric=invite_user')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+
+        for variant in ('A', 'B'):
+            self.assertEqual(data['current'][variant]['users'], ab[f'variant_{variant}']['total_users'])
+            self.assertEqual(data['current'][variant]['conversions'], ab[f'variant_{variant}']['funnel'][-1]['users'])
+        self.assertEqual(len(data['history']['dates']), len(data['history']['always_valid_p']['B']))
+
+        again = json.loads(self.app.get('/api/ab-test/sequential?metric=invite_user').data)
+        self.assertEqual(again['state']['new_events'], 0)
+        self.assertEqual(self.app.get('/api/ab-test/sequential?metric=unknown').status_code, 400)
+
+    def test_summary_during_concurrent_updates(self):
+        import threading
+        users, events = app_module.users_df, app_module.events_df
+        test = sequential.SequentialTest('invite_user', 'A', 0.05)
+        test.update(users, events)
+        errors = []
+
+        def updates():
+            # Rewritten, then original, events: every update starts the state over
+            for rewritten in (True, False) * 10:
+                test.update(users, events.iloc[::-1] if rewritten else events)
+
+        def summaries():
+            for _ in range(50):
+                try:
+                    summary = test.summary(0.05)
+                    self.assertEqual(len(summary['history']['dates']), len(summary['history']['always_valid_p']['B']))
+                except Exception as e:
+                    errors.append(e)
+
+        threads = [threading.Thread(target=updates), threading.Thread(target=summaries)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_experiments_kept_are_bounded(self):
+        sequential.reset_all()
+        # An unknown control is rejected before any state is kept
+        self.assertEqual(self.app.get('/api/ab-test/sequential?control=Z').status_code, 400)
+        self.assertEqual(len(sequential._tests), 0)
+
+        for i in range(sequential.MAX_TESTS + 5):
+            sequential.get_test('invite_user', 'A', 0.01 * (i + 1))
+        self.assertEqual(len(sequential._tests), sequential.MAX_TESTS)
+        # The least recently used experiments went first
+        self.assertNotIn(('invite_user', 'A', 0.01, None), sequential._tests)
+        sequential.reset_all()
+
+    def test_no_data_has_an_empty_history(self):
+        users, events = app_module.users_df, app_module.events_df
+        test = sequential.SequentialTest('invite_user', 'A', 0.05)
+        self.assertEqual(test.update(users.iloc[:0], events.iloc[:0]), 0)
+        summary = test.summary(0.05)
+        self.assertEqual(summary['history']['dates'], [])
+        self.assertEqual(summary['comparisons'], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+# Add backend directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module
+from app import app
+import snapshot
+
+ROUTES = ['/api/metrics', '/api/funnel', '/api/kpi-time-series', '/api/cohorts', '/api/users?country=US',
+          '/api/events?event_name=view_dashboard', '/api/user-sessions?limit=20', '/api/retention',
+          '/api/paths', '/api/query?group_by=country', '/api/ab-test', '/api/funnel?mode=ordered']
+
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+
+    def test_snapshot_is_read_only(self):
+        self.assertTrue(app_module._ensure_loaded())
+        snap = app_module._snapshot()
+        with self.assertRaises(AttributeError):
+            snap.events = snap.events.head()
+        for column in (snap.events['timestamp'], snap.users['joined_at']):
+            with self.assertRaises(ValueError):
+                column.array[0] = column.array[1]
+
+    def test_pandas_internals_used_by_freeze_exist(self):
+        # snapshot.freeze relies on private pandas internals (see snapshot.freezable):
+        # this fails first when a pandas upgrade removes them
+        import pandas as pd
+        frame = pd.DataFrame({'n': [1, 2], 't': pd.to_datetime([1, 2], unit='s', utc=True)})
+        self.assertTrue(snapshot.freezable(frame))
+        self.assertTrue(all(hasattr(getattr(values, '_ndarray', values), 'flags') for values in frame._mgr.arrays))
+        snapshot.freeze(frame)
+        for column in ('n', 't'):
+            with self.assertRaises(ValueError):
+                frame[column].array[0] = frame[column].array[1]
+
+    def test_endpoints_leave_the_frames_alone(self):
+        # Copies have no summary tables, so the endpoints scan (and used to annotate) the frames
+        users, events = app_module.users_df.copy(), app_module.events_df.copy()
+        columns = (list(users.columns), list(events.columns))
+        with patch('app.users_df', users), patch('app.events_df', events):
+            for route in ROUTES:
+                self.assertEqual(self.app.get(route).status_code, 200, route)
+        self.assertEqual((list(users.columns), list(events.columns)), columns)
+
+    def test_concurrent_requests_match_serial_ones(self):
+        serial = {route: json.loads(self.app.get(route).data) for route in ROUTES}
+
+        def fetch(route):
+            return route, json.loads(app.test_client().get(route).data)
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            for route, payload in pool.map(fetch, ROUTES * 4):
+                self.assertEqual(payload, serial[route], route)
+
+
+if __name__ == '__main__':
+    unittest.main()
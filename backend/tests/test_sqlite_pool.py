@@ -0,0 +1,81 @@
+import unittest
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+
+# Add backend directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module
+from app import app
+import sqlite_pool
+
+
+class TestConnectionPool(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.db_file = os.path.join(self.dir.name, 'test.db')
+        conn = sqlite3.connect(self.db_file)
+        conn.execute("CREATE TABLE events (id INTEGER PRIMARY KEY, name TEXT)")
+        conn.executemany("INSERT INTO events (name) VALUES (?)", [(f'e{i}',) for i in range(1000)])
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_connections_are_read_only_and_bounded(self):
+        pool = sqlite_pool.ConnectionPool(self.db_file, size=2, immutable=False)
+        results = []
+
+        def worker():
+            for _ in range(20):
+                results.append(pool.execute("SELECT COUNT(*) FROM events WHERE name = ?", ('e7',))[0][0])
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, [1] * 160)
+        stats = pool.stats()
+        self.assertLessEqual(stats['open_connections'], 2)
+        self.assertEqual(stats['acquires'], 160)
+        with pool.connection() as conn:
+            self.assertGreater(conn.execute("PRAGMA mmap_size").fetchone()[0], 0)
+            with self.assertRaises(sqlite3.OperationalError):
+                conn.execute("DELETE FROM events")
+        pool.close()
+        self.assertEqual(pool.stats()['open_connections'], 0)
+
+    def test_slow_queries_keep_their_plan(self):
+        pool = sqlite_pool.ConnectionPool(self.db_file, immutable=True, slow_ms=0)
+        frame = pool.read_frame("SELECT * FROM events WHERE id > ?", (990,))
+        self.assertEqual(len(frame), 10)
+        slow = pool.stats()['slow_queries'][-1]
+        self.assertEqual(slow['sql'], "SELECT * FROM events WHERE id > ?")
+        self.assertTrue(any('events' in step for step in slow['plan']), slow['plan'])
+
+    def test_replaced_file_is_reopened(self):
+        pool = sqlite_pool.ConnectionPool(self.db_file)
+        self.assertTrue(pool.is_current())
+        copy = os.path.join(self.dir.name, 'copy.db')
+        shutil.copy(self.db_file, copy)
+        os.replace(copy, self.db_file)
+        self.assertFalse(pool.is_current())
+        self.assertFalse(pool.is_current(copy))
+
+    def test_debug_endpoint(self):
+        app_module.users_df  # loads through the pool
+        data = json.loads(app.test_client().get('/api/debug/sql').data)
+        self.assertGreater(data['queries'], 0)
+        self.assertIn('slow_queries', data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+import json
+import sqlite3
+import tempfile
+import sys
+import os
+from unittest.mock import patch
+
+# Add backend directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module
+from app import app
+import init_db
+import summaries
+
+USERS_CSV = """user_id,joined_at,device,country,subscription_status,ab_variant
+u_1,2023-01-01T08:00:00Z,Mobile,US,Free,A
+u_2,2023-01-20T09:30:00Z,Desktop,DE,Premium,B
+"""
+
+EVENTS_CSV = """event_id,user_id,event_name,timestamp,metadata
+e_1,u_1,signup_success,2023-01-01T08:00:05Z,
+e_2,u_1,view_dashboard,2023-01-01T08:20:00Z,
+e_3,u_2,signup_success,2023-01-20T09:31:00Z,
+e_4,u_1,complete_task,2023-02-03T11:15:42Z,
+"""
+
+NEW_USERS = "u_3,2023-02-10T10:00:00Z,Tablet,FR,Free,A\n"
+
+NEW_EVENTS = """e_5,u_3,signup_success,2023-02-10T10:00:01Z,
+e_6,u_1,view_dashboard,2023-02-03T11:30:00Z,
+e_7,u_2,view_dashboard,2023-03-01T12:00:00Z,
+e_8,u_1,signup_success,2022-12-31T23:00:00Z,
+"""
+
+
+def _rows(conn, table):
+    return sorted(conn.execute(f"SELECT * FROM {table}").fetchall())
+
+
+class TestSummaries(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+
+    def _responses(self):
+        return {path: json.loads(self.app.get(path).data) for path in
+                ['/api/funnel', '/api/metrics', '/api/kpi-time-series', '/api/cohorts',
+                 '/api/user-sessions?limit=100000&sort_by=last_activity',
+                 '/api/user-sessions?limit=50&sort_by=total_sessions']}
+
+    def test_endpoints_match_raw_events(self):
+        self.assertIsNotNone(app_module._snapshot().summaries)
+        stored = self._responses()
+        # A copy of the events is not what the summaries were built from, so it is scanned
+        with patch('app.events_df', app_module.events_df.copy()), patch('app.users_df', app_module.users_df.copy()):
+            self.assertIsNone(app_module._snapshot().summaries)
+            scanned = self._responses()
+        for path, payload in stored.items():
+            self.assertEqual(payload, scanned[path], path)
+
+    def test_append_refresh_matches_full_build(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            users_file = os.path.join(tmp, 'users.csv')
+            events_file = os.path.join(tmp, 'events.csv')
+            with open(users_file, 'w') as f:
+                f.write(USERS_CSV)
+            with open(events_file, 'w') as f:
+                f.write(EVENTS_CSV)
+            appended = os.path.join(tmp, 'appended.db')
+            init_db.init_db(chunk_size=2, users_file=users_file, events_file=events_file, db_file=appended)
+
+            with open(users_file, 'a') as f:
+                f.write(NEW_USERS)
+            with open(events_file, 'a') as f:
+                f.write(NEW_EVENTS)
+            init_db.append_db(chunk_size=2, users_file=users_file, events_file=events_file, db_file=appended)
+            rebuilt = os.path.join(tmp, 'rebuilt.db')
+            init_db.init_db(chunk_size=2, users_file=users_file, events_file=events_file, db_file=rebuilt)
+
+            appended_conn, rebuilt_conn = sqlite3.connect(appended), sqlite3.connect(rebuilt)
+            for table in summaries.TABLES:
+                self.assertEqual(_rows(appended_conn, table), _rows(rebuilt_conn, table), table)
+            # u_1 active in Dec (before joining), Jan and Feb; u_2 in Jan and Mar; u_3 in Feb
+            self.assertEqual(_rows(appended_conn, 'summary_cohorts'),
+                             [('2023-01', -1, 1), ('2023-01', 0, 2), ('2023-01', 1, 1), ('2023-01', 2, 1),
+                              ('2023-02', 0, 1)])
+            self.assertIsNotNone(summaries.Summaries.load(appended_conn, init_db.events_version(appended_conn)))
+            appended_conn.close()
+            rebuilt_conn.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
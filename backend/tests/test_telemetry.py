@@ -0,0 +1,78 @@
+import unittest
+import sys
+import os
+
+# Add backend directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app
+import pandas as pd
+import telemetry
+
+
+class TestPrometheusMetrics(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+
+    def test_metrics_exposition_format(self):
+        """/metrics serves text exposition with request, table and process metrics"""
+        self.app.get('/api/funnel')
+        response = self.app.get('/metrics')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain'))
+        body = response.get_data(as_text=True)
+        self.assertIn('vizsprints_http_requests_total{route="/api/funnel",method="GET",status="200"}', body)
+        self.assertIn('vizsprints_http_request_duration_seconds_bucket{route="/api/funnel",method="GET",le="+Inf"}', body)
+        self.assertIn('vizsprints_table_rows{table="events"}', body)
+        self.assertIn('process_resident_memory_bytes', body)
+
+    def test_cache_hits_are_counted(self):
+        """Repeated cohort requests are served from the snapshot's cache"""
+        from unittest.mock import patch
+
+        events = pd.DataFrame({
+            'user_id': ['u1', 'u2'],
+            'event_name': ['signup_success', 'signup_success'],
+            'timestamp': pd.to_datetime(['2023-01-01', '2023-02-03'])
+        })
+        users = pd.DataFrame({
+            'user_id': ['u1', 'u2'],
+            'joined_at': pd.to_datetime(['2023-01-01', '2023-02-03']),
+        })
+        with patch('app.events_df', events), patch('app.users_df', users):
+            self.app.get('/api/cohorts')
+            self.app.get('/api/cohorts')
+            body = self.app.get('/metrics').get_data(as_text=True)
+
+        hits = [line for line in body.splitlines()
+                if line.startswith('vizsprints_cache_hits_total{cache="snapshot",kind="cohorts"}')]
+        self.assertEqual(len(hits), 1)
+        self.assertGreaterEqual(int(hits[0].split()[-1]), 1)
+
+    def test_varied_parameters_do_not_evict_per_load_structures(self):
+        """Parameter-keyed results fill the bounded cache without touching the snapshot's structures"""
+        import app as app_module
+        app_module._ensure_loaded(app_module._dataset('default'))
+        snap = app_module._snapshot(app_module._dataset('default'))
+        built = app_module._cube(snap)
+        for days in range(app_module.derived_cache.maxsize + 10):
+            self.app.get(f'/api/retention?days=0,{days + 1}')
+        self.assertEqual(len(app_module.derived_cache), app_module.derived_cache.maxsize)
+        self.assertIs(app_module._cube(snap), built)
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = telemetry.Histogram('test_seconds', 'Test.', ('route',), buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 5.0):
+            histogram.observe(value, '/x')
+
+        lines = histogram.render()
+        self.assertIn('test_seconds_bucket{route="/x",le="0.1"} 1', lines)
+        self.assertIn('test_seconds_bucket{route="/x",le="1"} 2', lines)
+        self.assertIn('test_seconds_bucket{route="/x",le="+Inf"} 3', lines)
+        self.assertIn('test_seconds_count{route="/x"} 3', lines)
+
+
+if __name__ == '__main__':
+    unittest.main()
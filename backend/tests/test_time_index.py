@@ -0,0 +1,61 @@
+import unittest
+import json
+import sys
+import os
+
+import numpy as np
+import pandas as pd
+
+# Add backend directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module
+from app import app
+import event_index
+
+
+class TestTimeIndex(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+
+    def test_range_selection_matches_masks(self):
+        rng = np.random.default_rng(0)
+        timestamps = pd.to_datetime(rng.integers(0, 10**6, size=500), unit='s', utc=True)
+        unsorted = pd.DataFrame({'timestamp': timestamps, 'row': np.arange(500)})
+        start, end = pd.Timestamp(200000, unit='s', tz='UTC'), pd.Timestamp(600000, unit='s', tz='UTC')
+        expected = unsorted[(unsorted['timestamp'] >= start) & (unsorted['timestamp'] <= end)]
+
+        for events in (unsorted, unsorted.sort_values('timestamp', ignore_index=True)):
+            index = event_index.TimeIndex(events)
+            selected = index.select(events, start.value, end.value)
+            self.assertEqual(sorted(selected['row']), sorted(expected['row']))
+        # Time-sorted tables are served by a plain slice
+        self.assertIsNone(index.order)
+
+    def test_loaded_events_are_time_sorted(self):
+        self.assertTrue(app_module.events_df['timestamp'].is_monotonic_increasing)
+
+    def test_events_date_range(self):
+        response = self.app.get('/api/events?start_date=2023-06-01&end_date=2023-06-02')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        events = app_module.events_df
+        in_range = (events['timestamp'] >= pd.Timestamp('2023-06-01', tz='UTC')) & \
+            (events['timestamp'] <= pd.Timestamp('2023-06-02', tz='UTC'))
+        self.assertEqual(data['total'], int(in_range.sum()))
+        self.assertEqual(self.app.get('/api/events?start_date=someday').status_code, 400)
+
+    def test_user_sessions_on_tz_naive_frames(self):
+        # Frames assigned from outside (benchmarks) may carry tz-naive timestamps
+        from unittest.mock import patch
+        events = app_module.events_df.assign(timestamp=app_module.events_df['timestamp'].dt.tz_localize(None))
+        users = app_module.users_df.copy()
+        with patch('app.users_df', users), patch('app.events_df', events):
+            response = self.app.get('/api/user-sessions?limit=5&sort_by=last_activity')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(json.loads(response.data)['user_sessions']), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
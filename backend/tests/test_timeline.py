@@ -0,0 +1,59 @@
+import unittest
+import json
+import sys
+import os
+
+import numpy as np
+
+# Add backend directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module
+from app import app
+
+
+class TestUserTimeline(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+        self.user_id = app_module.users_df['user_id'].iloc[5]
+
+    def test_user_slices_cover_every_event_once(self):
+        index = app_module._user_event_index(app_module._snapshot())
+        self.assertEqual(index.offsets[-1], len(app_module.events_df))
+        self.assertTrue((np.diff(index.offsets) >= 0).all())
+
+        rows = index.user_rows(self.user_id)
+        expected = app_module.events_df.index[app_module.events_df['user_id'] == self.user_id]
+        self.assertEqual(sorted(rows.tolist()), expected.tolist())
+        # A slice of the sorted arrays, not a copy
+        self.assertIs(index.timestamps[index.user_slice(self.user_id)].base, index.timestamps)
+        self.assertEqual(len(index.user_rows('nobody')), 0)
+
+    def test_timeline(self):
+        response = self.app.get(f'/api/users/{self.user_id}/timeline')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+
+        self.assertEqual(data['user']['user_id'], self.user_id)
+        timestamps = [e['timestamp'] for e in data['events']]
+        self.assertEqual(timestamps, sorted(timestamps))
+        self.assertEqual(sum(s['events'] for s in data['sessions']), data['total_events'])
+        self.assertEqual([f['stage'] for f in data['funnel']], app_module.FUNNEL_STAGES)
+
+        self.assertEqual(self.app.get('/api/users/nobody/timeline').status_code, 404)
+
+    def test_timeline_limit(self):
+        data = json.loads(self.app.get(f'/api/users/{self.user_id}/timeline?limit=1').data)
+        self.assertEqual(len(data['events']), 1)
+        response = self.app.get(f'/api/users/{self.user_id}/timeline?limit=-1')
+        self.assertEqual(response.status_code, 400)
+
+    def test_events_filter_by_user(self):
+        data = json.loads(self.app.get(f'/api/events?user_id={self.user_id}').data)
+        expected = app_module.events_df[app_module.events_df['user_id'] == self.user_id]
+        self.assertEqual([e['event_id'] for e in data['events']], expected['event_id'].tolist())
+
+
+if __name__ == '__main__':
+    unittest.main()
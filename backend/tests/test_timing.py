@@ -0,0 +1,52 @@
+import unittest
+import json
+import sys
+import os
+
+# Add backend directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app
+import timing
+
+
+class TestRequestTiming(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+        timing.reset()
+
+    def test_server_timing_header_lists_stages(self):
+        """Handlers report their stages and a total in Server-Timing"""
+        response = self.app.get('/api/funnel')
+        self.assertEqual(response.status_code, 200)
+
+        header = response.headers.get('Server-Timing')
+        stages = [part.split(';')[0] for part in header.split(', ')]
+        self.assertIn('stages', stages)
+        self.assertIn('serialize', stages)
+        self.assertEqual(stages[-1], 'total')
+
+    def test_debug_timings_aggregates_per_route(self):
+        """Recent spans are summarised per route with percentiles"""
+        for _ in range(3):
+            self.app.get('/api/metrics')
+
+        response = self.app.get('/api/debug/timings?route=/api/metrics')
+        data = json.loads(response.data)
+
+        route = data['routes']['/api/metrics']
+        self.assertEqual(route['requests'], 3)
+        for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+            self.assertIn(key, route['stages']['total'])
+        self.assertEqual(route['stages']['conversion']['count'], 3)
+
+    def test_spans_outside_requests_are_ignored(self):
+        """span() is a no-op when no timed block is open"""
+        with timing.span('orphan'):
+            pass
+        self.assertEqual(timing.summarize(), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
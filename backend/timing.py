@@ -0,0 +1,150 @@
+"""Lightweight span timing for API requests.
+
+Handlers wrap their stages in ``span('name')``. Spans are collected per thread
+into the currently open ``timed_block`` (one per request, or one around
+``load_data``), summed by name, emitted as a ``Server-Timing`` header plus a
+structured log line, and kept in a bounded per-route history that
+``/api/debug/timings`` summarises.
+"""
+import json
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+from flask import request
+
+logger = logging.getLogger('vizsprints.timing')
+
+# Number of recent requests kept per route for percentile summaries
+HISTORY_SIZE = 500
+
+_local = threading.local()
+_history = defaultdict(lambda: deque(maxlen=HISTORY_SIZE))
+_history_lock = threading.Lock()
+
+
+class _Block:
+    """Spans collected for one request (or one standalone operation)."""
+
+    def __init__(self, name):
+        self.name = name
+        self.start = time.perf_counter()
+        self.spans = {}
+
+    def add(self, stage, elapsed_ms):
+        self.spans[stage] = self.spans.get(stage, 0.0) + elapsed_ms
+
+    def total_ms(self):
+        return (time.perf_counter() - self.start) * 1000
+
+
+def _current_block():
+    return getattr(_local, 'block', None)
+
+
+@contextmanager
+def span(stage):
+    """Time a stage of the current request; a no-op outside of a timed block."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        block = _current_block()
+        if block is not None:
+            block.add(stage, (time.perf_counter() - start) * 1000)
+
+
+def _finish(block, extra=None):
+    """Record a finished block in the history and the structured log."""
+    total = block.total_ms()
+    stages = dict(block.spans)
+    stages['total'] = total
+    with _history_lock:
+        _history[block.name].append(stages)
+
+    record = {'route': block.name, 'total_ms': round(total, 3),
+              'spans': {k: round(v, 3) for k, v in block.spans.items()}}
+    if extra:
+        record.update(extra)
+    logger.info(json.dumps(record))
+    return total
+
+
+@contextmanager
+def timed_block(name):
+    """Collect spans for a standalone operation such as load_data()."""
+    previous = _current_block()
+    block = _Block(name)
+    _local.block = block
+    try:
+        yield block
+    finally:
+        _local.block = previous
+        _finish(block)
+
+
+def server_timing_header(block, total_ms):
+    """Format spans as a Server-Timing header value."""
+    parts = [f"{stage};dur={elapsed:.2f}" for stage, elapsed in block.spans.items()]
+    parts.append(f"total;dur={total_ms:.2f}")
+    return ', '.join(parts)
+
+
+def summarize(route=None):
+    """Per-route, per-stage latency percentiles over the recent history."""
+    # Imported here: every request is timed, but only this debug view needs numpy
+    import numpy as np
+
+    with _history_lock:
+        snapshot = {name: list(entries) for name, entries in _history.items()
+                    if route is None or name == route}
+
+    summary = {}
+    for name, entries in snapshot.items():
+        by_stage = defaultdict(list)
+        for entry in entries:
+            for stage, elapsed in entry.items():
+                by_stage[stage].append(elapsed)
+
+        stages = {}
+        for stage, values in by_stage.items():
+            arr = np.asarray(values)
+            p50, p95, p99 = np.percentile(arr, [50, 95, 99])
+            stages[stage] = {
+                'count': int(arr.size),
+                'mean_ms': round(float(arr.mean()), 3),
+                'p50_ms': round(float(p50), 3),
+                'p95_ms': round(float(p95), 3),
+                'p99_ms': round(float(p99), 3),
+            }
+        summary[name] = {'requests': len(entries), 'stages': stages}
+    return summary
+
+
+def reset():
+    """Drop all recorded history."""
+    with _history_lock:
+        _history.clear()
+
+
+def init_app(app):
+    """Open a timed block around every request and report it on the way out."""
+
+    @app.before_request
+    def _start_request_timing():
+        _local.block = _Block(request.path)
+
+    @app.after_request
+    def _finish_request_timing(response):
+        block = _current_block()
+        if block is None:
+            return response
+        _local.block = None
+        if request.url_rule is not None:
+            block.name = request.url_rule.rule
+        total = _finish(block, {'method': request.method, 'status': response.status_code,
+                                'query': request.query_string.decode('utf-8', 'replace')})
+        response.headers['Server-Timing'] = server_timing_header(block, total)
+        return response
@@ -0,0 +1,63 @@
+"""Pre-warm the persistent response cache (result_cache.py) at build time.
+
+Run after init_db.py, so a freshly deployed instance answers the default
+dashboard requests from the cache file instead of computing them on its
+first (cold) requests:
+
+    python warm_cache.py
+"""
+import argparse
+import os
+import time
+
+import result_cache
+
+# What the dashboard requests on first render (see frontend/src/components)
+DASHBOARD_REQUESTS = [
+    '/api/metrics',
+    '/api/funnel',
+    '/api/kpi-time-series',
+    '/api/cohorts',
+    '/api/user-sessions?limit=50&sort_by=total_hours',
+    '/api/user-sessions?limit=50&sort_by=total_sessions',
+    '/api/user-sessions?limit=50&sort_by=last_activity',
+    '/api/ab-test?confidence_level=0.95',
+]
+
+# Other analyses with default parameters
+DEFAULT_REQUESTS = DASHBOARD_REQUESTS + [
+    '/api/retention',
+    '/api/stickiness',
+    '/api/paths',
+    '/api/query',
+    '/api/ab-test/report',
+    '/api/ab-test/sequential',
+    '/api/ab-test/power-curve',
+]
+
+
+def warm(path, requests=DEFAULT_REQUESTS):
+    """Empty the cache file at path and fill it with the responses to requests; returns entries stored."""
+    store = result_cache.ResultCache(path)
+    store.create()
+
+    # Imported here: loading the app reads the whole database
+    import app as app_module
+    app_module.result_store = store
+    store.warming = True
+    client = app_module.app.test_client()
+    for url in requests:
+        start = time.perf_counter()
+        response = client.get(url)
+        status = 'stored' if response.headers.get('X-Result-Cache') == 'miss' else f'skipped ({response.status_code})'
+        print(f" - {url}: {status} in {(time.perf_counter() - start) * 1000:.0f} ms")
+    return store.stats()['entries']
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Pre-compute default API responses into the result cache')
+    parser.add_argument('--output', default=os.environ.get(result_cache.PATH_ENV, result_cache.DEFAULT_PATH),
+                        help='cache file to (re)create')
+    args = parser.parse_args()
+    print(f"Warming {args.output}...")
+    print(f"Stored {warm(args.output)} responses")
@@ -7,4 +7,28 @@ const api = axios.create({
     },
 });
 
+// Default dashboard requests are pre-rendered at build time (backend/build_static.py),
+// so production builds read them as static files; keep in step with STATIC_RESPONSES there.
+const STATIC_RESPONSES = {
+    '/metrics': 'metrics',
+    '/funnel': 'funnel',
+    '/kpi-time-series': 'kpi-time-series',
+    '/cohorts': 'cohorts',
+    '/user-sessions?limit=50&sort_by=total_hours': 'user-sessions/total_hours',
+    '/user-sessions?limit=50&sort_by=total_sessions': 'user-sessions/total_sessions',
+    '/user-sessions?limit=50&sort_by=last_activity': 'user-sessions/last_activity',
+    '/ab-test?confidence_level=0.95': 'ab-test',
+};
+
+if (import.meta.env.PROD) {
+    api.interceptors.request.use((config) => {
+        const name = config.method === 'get' && !config.params && STATIC_RESPONSES[config.url];
+        if (name) {
+            config.baseURL = '/static-api';
+            config.url = `/${name}.json`;
+        }
+        return config;
+    });
+}
+
 export default api;